@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of vote button callback parsing: the old backwards scan over
+underscore-split parts versus utils.callback_data for v1 tokens and legacy buttons.
+
+Usage:
+    python bench_callback_data.py [--iterations 200000]
+"""
+
+import argparse
+import os
+import timeit
+
+# Importing utils connects utils.mongo; keep it off the production database
+os.environ.setdefault("MONGO_DB_URI", "mongodb://localhost:27017")
+
+from utils.callback_data import decode_vote_callback, encode_vote_token, new_post_key, vote_callback_data
+
+LONG_CHANNEL = "@" + "_".join(["very", "long", "channel", "name", "with", "many", "parts"] * 2)
+
+
+def legacy_scan(callback_data: str):
+    """The parser VerifyHandler used before v1 tokens (without its debug prints)"""
+    parts = callback_data[13:].split("_")
+    if len(parts) < 3:
+        return None
+    for i in range(len(parts) - 1, 0, -1):
+        if parts[i].isdigit() and parts[i - 1].isdigit():
+            return "_".join(parts[:i - 1]), int(parts[i - 1]), f"{parts[i - 1]}_{parts[i]}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    short_legacy = vote_callback_data("@votes", "7840521426_1751953634004009")
+    long_legacy = vote_callback_data(LONG_CHANNEL, "7840521426_1751953634004009")
+    token = encode_vote_token(new_post_key())
+
+    cases = [
+        ("old scan, short channel", legacy_scan, short_legacy),
+        ("old scan, long channel", legacy_scan, long_legacy),
+        ("decode legacy, short channel", decode_vote_callback, short_legacy),
+        ("decode legacy, long channel", decode_vote_callback, long_legacy),
+        ("decode v1 token", decode_vote_callback, token),
+    ]
+
+    print(f"{'case':<30} {'bytes':>5} {'ns/parse':>10}")
+    for name, parse, data in cases:
+        seconds = timeit.timeit(lambda: parse(data), number=args.iterations)
+        print(f"{name:<30} {len(data.encode()):>5} {seconds / args.iterations * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Benchmark SubscriptionChecker and VoteScheduler.check_vote_subscriptions against a
+simulated Telegram client and an in-memory Mongo, so caching and concurrency
+changes can be compared without touching real Telegram.
+
+Usage:
+    python bench_subscription.py
+    python bench_subscription.py --sizes 1000,10000 --latency 0.002 --flood-rate 0.01 --not-participant 0.2
+
+Absolute numbers depend on --latency; compare runs made with the same settings.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import time
+import zlib
+from types import SimpleNamespace
+
+# Keep imports from reaching the production database
+os.environ.setdefault("MONGO_DB_URI", "mongodb://localhost:27017")
+
+from pyrogram.errors import FloodWait, UserNotParticipant
+from config import Config
+from utils.db import Database
+from utils.check import SubscriptionChecker, bot_identity
+from utils.cache import membership_cache, bot_admin_cache
+from utils.resolver import channel_resolver
+from utils.health import channel_health
+from utils.singleflight import telegram_flight
+from utils.buttons import button_coalescer
+from utils.scheduler import VoteScheduler
+
+BOT_ID = 1
+BENCH_CHANNEL = "@bench_channel"
+POSTS_PER_CHANNEL = 50
+
+
+class FakeTelegram:
+    """Stand-in for pyrogram.Client with configurable latency and failures"""
+
+    def __init__(self, latency=0.001, flood_rate=0.0, not_participant=0.1, seed=1, flood_wait=1):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.not_participant = not_participant
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.calls = {}
+        self.floods = 0
+        self.voters = []
+
+    async def _call(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.floods += 1
+            raise FloodWait(x=self.flood_wait)
+
+    def stable_hash(self, *parts):
+        # crc32 rather than hash(): str hashes change per process (PYTHONHASHSEED)
+        return zlib.crc32(":".join(map(str, (self.seed,) + parts)).encode())
+
+    def is_member(self, chat_id, user_id):
+        # Deterministic for a given --seed so runs can be compared
+        return (self.stable_hash(chat_id, user_id) % 1000) / 1000 >= self.not_participant
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    async def get_me(self):
+        await self._call("get_me")
+        return SimpleNamespace(id=BOT_ID, username="bench_bot")
+
+    async def get_chat(self, channel):
+        await self._call("get_chat")
+        username = str(channel).lstrip("@")
+        return SimpleNamespace(id=-100 - self.stable_hash(username.lower()) % 10 ** 9, title=username, username=username, type="channel", members_count=len(self.voters))
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call("get_chat_member")
+        if user_id == BOT_ID:
+            return SimpleNamespace(status="administrator", user=SimpleNamespace(id=user_id))
+        if not self.is_member(chat_id, user_id):
+            raise UserNotParticipant()
+        return SimpleNamespace(status="member", user=SimpleNamespace(id=user_id))
+
+    async def get_chat_members_count(self, chat_id):
+        await self._call("get_chat_members_count")
+        return sum(1 for user_id in self.voters if self.is_member(chat_id, user_id))
+
+    async def iter_chat_members(self, chat_id):
+        members = [user_id for user_id in self.voters if self.is_member(chat_id, user_id)]
+        for offset in range(0, len(members), 200):
+            await self._call("get_chat_members")
+            for user_id in members[offset:offset + 200]:
+                yield SimpleNamespace(status="member", user=SimpleNamespace(id=user_id))
+        # Telegram needs a final empty page to signal the end
+        await self._call("get_chat_members")
+
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+        await self._call("edit_message_reply_markup")
+
+
+class FakeResult:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs = sorted(self.docs, key=lambda doc: doc.get(field), reverse=direction < 0)
+        return self
+
+    async def to_list(self, length=None):
+        return [dict(doc) for doc in (self.docs if length is None else self.docs[:length])]
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+    async def close(self):
+        pass
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the checker and scheduler, with lazy hash indexes"""
+
+    def __init__(self):
+        self.docs = {}
+        self.indexes = {}
+        self.next_id = 0
+
+    def _index(self, field):
+        if field not in self.indexes:
+            index = {}
+            for doc_id, doc in self.docs.items():
+                index.setdefault(doc.get(field), set()).add(doc_id)
+            self.indexes[field] = index
+        return self.indexes[field]
+
+    def _add_to_indexes(self, doc_id, doc):
+        for field, index in self.indexes.items():
+            index.setdefault(doc.get(field), set()).add(doc_id)
+
+    def _remove_from_indexes(self, doc_id, doc):
+        for field, index in self.indexes.items():
+            index.get(doc.get(field), set()).discard(doc_id)
+
+    def _matches(self, doc, query):
+        for field, expected in query.items():
+            if field == "$or":
+                if not any(self._matches(doc, option) for option in expected):
+                    return False
+            elif isinstance(expected, dict) and "$in" in expected:
+                if doc.get(field) not in expected["$in"]:
+                    return False
+            elif isinstance(expected, dict) and "$gt" in expected:
+                if doc.get(field) is None or doc.get(field) <= expected["$gt"]:
+                    return False
+            elif isinstance(expected, dict) and "$lt" in expected:
+                if doc.get(field) is None or doc.get(field) >= expected["$lt"]:
+                    return False
+            elif isinstance(expected, dict) and "$exists" in expected:
+                if (field in doc) != expected["$exists"]:
+                    return False
+            elif doc.get(field) != expected:
+                return False
+        return True
+
+    def _find(self, query):
+        candidates = None
+        for field, expected in query.items():
+            if field.startswith("$"):
+                continue
+            if isinstance(expected, dict):
+                if "$in" not in expected:
+                    continue
+                index = self._index(field)
+                ids = set().union(*(index.get(value, set()) for value in expected["$in"]))
+            else:
+                ids = self._index(field).get(expected, set())
+            candidates = ids if candidates is None or len(ids) < len(candidates) else candidates
+        doc_ids = list(candidates) if candidates is not None else list(self.docs)
+        return [doc_id for doc_id in doc_ids if self._matches(self.docs[doc_id], query)]
+
+    async def insert_one(self, doc):
+        self.next_id += 1
+        doc = dict(doc, _id=doc.get("_id", self.next_id))
+        self.docs[doc["_id"]] = doc
+        self._add_to_indexes(doc["_id"], doc)
+        return FakeResult(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            await self.insert_one(doc)
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            await self.update_one(request._filter, request._doc)
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([self.docs[doc_id] for doc_id in self._find(query or {})])
+
+    async def find_one(self, query, projection=None, sort=None):
+        doc_ids = self._find(query)
+        return dict(self.docs[doc_ids[0]]) if doc_ids else None
+
+    async def count_documents(self, query):
+        return len(self._find(query))
+
+    async def distinct(self, field, query=None):
+        return list({self.docs[doc_id].get(field) for doc_id in self._find(query or {})})
+
+    async def update_one(self, query, update, upsert=False):
+        doc_ids = self._find(query)
+        if not doc_ids:
+            if upsert:
+                await self.insert_one(dict(query, **update.get("$set", {}), **update.get("$inc", {})))
+            return FakeResult(matched_count=0, modified_count=0)
+        doc = self.docs[doc_ids[0]]
+        self._remove_from_indexes(doc["_id"], doc)
+        doc.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        self._add_to_indexes(doc["_id"], doc)
+        return FakeResult(matched_count=1, modified_count=1)
+
+    async def update_many(self, query, update):
+        doc_ids = self._find(query)
+        for doc_id in doc_ids:
+            doc = self.docs[doc_id]
+            self._remove_from_indexes(doc_id, doc)
+            doc.update(update.get("$set", {}))
+            self._add_to_indexes(doc_id, doc)
+        return FakeResult(matched_count=len(doc_ids), modified_count=len(doc_ids))
+
+    async def delete_one(self, query):
+        doc_ids = self._find(query)[:1]
+        for doc_id in doc_ids:
+            self._remove_from_indexes(doc_id, self.docs.pop(doc_id))
+        return FakeResult(deleted_count=len(doc_ids))
+
+    async def delete_many(self, query):
+        doc_ids = self._find(query)
+        for doc_id in doc_ids:
+            self._remove_from_indexes(doc_id, self.docs.pop(doc_id))
+        return FakeResult(deleted_count=len(doc_ids))
+
+
+class FakeMongo(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def reset_shared_state():
+    """Start every run cold so results don't leak between scenarios"""
+    membership_cache.clear()
+    bot_admin_cache.clear()
+    channel_resolver._peers.clear()
+    channel_health._channels.clear()
+    telegram_flight.calls = telegram_flight.suppressed = 0
+    bot_identity.me = None
+
+
+async def seed_votes(db, voter_ids):
+    """One vote per voter spread over the channel's posts"""
+    for post in range(POSTS_PER_CHANNEL):
+        await db.db[Config.PARTICIPANTS_COLLECTION].insert_one({
+            "unique_post_id": f"post{post}",
+            "channel_username": BENCH_CHANNEL,
+            "channel_message_id": 1000 + post,
+            "vote_count": 0
+        })
+    for user_id in voter_ids:
+        await db.db["user_votes"].insert_one({
+            "voter_id": user_id,
+            "unique_post_id": f"post{user_id % POSTS_PER_CHANNEL}",
+            "channel_username": BENCH_CHANNEL
+        })
+
+
+def make_environment(args, voter_count):
+    reset_shared_state()
+    app = FakeTelegram(args.latency, args.flood_rate, args.not_participant, args.seed, args.flood_wait)
+    app.voters = list(range(BOT_ID + 1, BOT_ID + 1 + voter_count))
+    db = Database()
+    db.db = FakeMongo()
+    return app, db
+
+
+def quiet(args):
+    """Swallow the bot's per-user prints unless --verbose is given"""
+    return contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def report(name, voter_count, elapsed, operations, latencies, app, extra=""):
+    print(
+        f"{name:<8} {voter_count:>7} voters | {operations / elapsed:>9.1f} ops/s | "
+        f"p50 {percentile(latencies, 50) * 1000:>7.2f}ms | p99 {percentile(latencies, 99) * 1000:>7.2f}ms | "
+        f"{app.total_calls():>7} API calls | {app.floods} floods | "
+        f"{telegram_flight.suppressed} coalesced{extra}"
+    )
+
+
+async def bench_checker(args, voter_count):
+    """Every voter taps a vote button: SUPPORT, UPDATE and the vote's channel are checked"""
+    app, db = make_environment(args, voter_count)
+    checker = SubscriptionChecker(app, db)
+    channels = [Config.SUPPORT_CHANNEL, Config.UPDATE_CHANNEL, BENCH_CHANNEL]
+    taps = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def tap(user_id):
+        async with taps:
+            started = time.perf_counter()
+            await checker.check_all_subscriptions(user_id, channels)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with quiet(args):
+        await asyncio.gather(*(tap(user_id) for user_id in app.voters))
+    report("checker", voter_count, time.perf_counter() - started, voter_count, latencies, app)
+
+
+async def bench_sweep(args, voter_count):
+    """One scheduler sweep over a channel holding one vote per voter"""
+    app, db = make_environment(args, voter_count)
+    await seed_votes(db, app.voters)
+    scheduler = VoteScheduler(app, db)
+    latencies = []
+    check_voter = scheduler.check_voter
+
+    async def timed_check_voter(*voter_args):
+        # A voter's whole check: flood pauses, retries and any vote removal included
+        voter_started = time.perf_counter()
+        try:
+            return await check_voter(*voter_args)
+        finally:
+            latencies.append(time.perf_counter() - voter_started)
+
+    scheduler.check_voter = timed_check_voter
+
+    started = time.perf_counter()
+    with quiet(args):
+        await scheduler.check_vote_subscriptions({"channel_username": BENCH_CHANNEL})
+        await button_coalescer.flush_all()
+    # Count from the collection so the figure doesn't depend on the sweep's own bookkeeping
+    removed = voter_count - await db.db["user_votes"].count_documents({})
+    sweep = scheduler.sweep_stats.to_dict()
+    report(
+        "sweep", voter_count, time.perf_counter() - started, voter_count, latencies, app,
+        f" | {removed} removed | {sweep['flood_retries']} flood retries | {sweep['skipped']} skipped"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated voter counts")
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds per simulated API call")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="fraction of calls raising FloodWait")
+    parser.add_argument("--not-participant", type=float, default=0.1, help="fraction of voters not in a channel")
+    parser.add_argument("--concurrency", type=int, default=100, help="simultaneous button taps")
+    parser.add_argument("--flood-wait", type=int, default=1, help="seconds in each simulated FloodWait")
+    parser.add_argument("--sweep-concurrency", type=int, default=Config.SWEEP_CONCURRENCY, help="sweep worker pool size")
+    parser.add_argument("--sweep-rate", type=float, default=0, help="sweep Telegram calls per second (0 = unpaced)")
+    parser.add_argument("--no-roster", action="store_true", help="disable roster snapshots in the sweep")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own log output")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Flush button edits straight away so they show up in the API call count
+    button_coalescer.interval = 0
+    
+    if args.no_roster:
+        Config.ROSTER_SNAPSHOTS_ENABLED = False
+    Config.SWEEP_CONCURRENCY = args.sweep_concurrency
+    Config.SWEEP_RATE_LIMIT = args.sweep_rate
+
+    print(
+        f"latency={args.latency}s flood_rate={args.flood_rate} not_participant={args.not_participant} "
+        f"roster={Config.ROSTER_SNAPSHOTS_ENABLED} sweep_concurrency={Config.SWEEP_CONCURRENCY} sweep_rate={Config.SWEEP_RATE_LIMIT}"
+    )
+    for voter_count in [int(size) for size in args.sizes.split(",")]:
+        await bench_checker(args, voter_count)
+        await bench_sweep(args, voter_count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
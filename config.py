@@ -24,6 +24,12 @@ class Config:
     VOTES_COLLECTION = "votes"
     PARTICIPANTS_COLLECTION = "participants"
     CHANNELS_COLLECTION = "channels"
+    CHANNEL_PEERS_COLLECTION = "channel_peers"
+    VOTE_EVENTS_COLLECTION = "vote_events"
+    VOTE_COUNTS_COLLECTION = "vote_counts"
+    SWEEP_CHECKPOINTS_COLLECTION = "sweep_checkpoints"
+    VOTER_VERIFICATION_COLLECTION = "voter_verification"
+    SWEEP_RUNS_COLLECTION = "sweep_runs"
     
     # Bot settings
     BOT_USERNAME = os.getenv("BOT_USERNAME", "My_Vote_Robot")
@@ -31,6 +37,94 @@ class Config:
     # Subscription check interval (in minutes)
     SUBSCRIPTION_CHECK_INTERVAL = int(os.getenv("SUBSCRIPTION_CHECK_INTERVAL", "5"))
     
+    # React to chat-member updates; the sweep then only runs as a safety net (in minutes)
+    MEMBER_UPDATES_ENABLED = os.getenv("MEMBER_UPDATES_ENABLED", "true").lower() == "true"
+    SUBSCRIPTION_SAFETY_SWEEP_INTERVAL = int(os.getenv("SUBSCRIPTION_SAFETY_SWEEP_INTERVAL", "60"))
+    
+    # Sweeps stream voters in chunks and stop after the time budget (in seconds, 0 = no limit),
+    # resuming from a per-channel checkpoint on the next interval
+    SWEEP_CHUNK_SIZE = int(os.getenv("SWEEP_CHUNK_SIZE", "500"))
+    SWEEP_TIME_BUDGET = int(os.getenv("SWEEP_TIME_BUDGET", "600"))
+    
+    # Sweep worker pool: parallel voter checks, Telegram calls per second (0 = unpaced),
+    # timeout of each Telegram call (in seconds, not counting flood pauses) and retries of a voter after a FloodWait
+    SWEEP_CONCURRENCY = int(os.getenv("SWEEP_CONCURRENCY", "10"))
+    SWEEP_RATE_LIMIT = float(os.getenv("SWEEP_RATE_LIMIT", "20"))
+    SWEEP_USER_TIMEOUT = float(os.getenv("SWEEP_USER_TIMEOUT", "30"))
+    SWEEP_FLOOD_RETRIES = int(os.getenv("SWEEP_FLOOD_RETRIES", "3"))
+    
+    # Verify only the most overdue (voter, channel) pairs each SUBSCRIPTION_CHECK_INTERVAL instead of
+    # sweeping every voter; pairs go stale after VERIFICATION_STALE_AFTER seconds, divided by
+    # 1 + VERIFICATION_TOP_POST_WEIGHT for voters on a channel's VERIFICATION_TOP_POSTS best posts
+    # (off by default: it replaces the checkpointed sweep and its roster snapshots)
+    VERIFICATION_LEDGER_ENABLED = os.getenv("VERIFICATION_LEDGER_ENABLED", "false").lower() == "true"
+    VERIFICATION_TICK_BUDGET = int(os.getenv("VERIFICATION_TICK_BUDGET", "500"))
+    VERIFICATION_STALE_AFTER = int(os.getenv("VERIFICATION_STALE_AFTER", "21600"))
+    VERIFICATION_TOP_POSTS = int(os.getenv("VERIFICATION_TOP_POSTS", "10"))
+    VERIFICATION_TOP_POST_WEIGHT = float(os.getenv("VERIFICATION_TOP_POST_WEIGHT", "3"))
+    
+    # Keep per-run sweep telemetry for this many days
+    SWEEP_RUNS_RETENTION_DAYS = int(os.getenv("SWEEP_RUNS_RETENTION_DAYS", "30"))
+    
+    # Membership cache (TTLs in seconds)
+    MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "50000"))
+    MEMBERSHIP_POSITIVE_TTL = int(os.getenv("MEMBERSHIP_POSITIVE_TTL", "300"))
+    MEMBERSHIP_NEGATIVE_TTL = int(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "30"))
+    
+    # Maximum parallel Telegram lookups per subscription checker
+    SUBSCRIPTION_CHECK_CONCURRENCY = int(os.getenv("SUBSCRIPTION_CHECK_CONCURRENCY", "10"))
+    
+    # Bot admin status cache (TTL in seconds)
+    BOT_ADMIN_CACHE_SIZE = int(os.getenv("BOT_ADMIN_CACHE_SIZE", "1000"))
+    BOT_ADMIN_CACHE_TTL = int(os.getenv("BOT_ADMIN_CACHE_TTL", "600"))
+    
+    # Channel health: failures before a channel is broken, backoff bounds (in seconds)
+    CHANNEL_BROKEN_AFTER = int(os.getenv("CHANNEL_BROKEN_AFTER", "3"))
+    CHANNEL_BACKOFF_BASE = int(os.getenv("CHANNEL_BACKOFF_BASE", "60"))
+    CHANNEL_BACKOFF_MAX = int(os.getenv("CHANNEL_BACKOFF_MAX", "3600"))
+    
+    # Snapshot admin channel member lists once per sweep, up to this many members
+    ROSTER_SNAPSHOTS_ENABLED = os.getenv("ROSTER_SNAPSHOTS_ENABLED", "true").lower() == "true"
+    ROSTER_MAX_SIZE = int(os.getenv("ROSTER_MAX_SIZE", "10000"))
+    
+    # Vote button edits: at most one per message per interval (in seconds)
+    BUTTON_FLUSH_INTERVAL = float(os.getenv("BUTTON_FLUSH_INTERVAL", "3"))
+    BUTTON_CACHE_SIZE = int(os.getenv("BUTTON_CACHE_SIZE", "10000"))
+    BUTTON_CACHE_TTL = int(os.getenv("BUTTON_CACHE_TTL", "3600"))
+    
+    # Participant post metadata (message id, channel) by unique_post_id; it never changes, so the TTL is long
+    POST_METADATA_CACHE_SIZE = int(os.getenv("POST_METADATA_CACHE_SIZE", "20000"))
+    POST_METADATA_CACHE_TTL = int(os.getenv("POST_METADATA_CACHE_TTL", "86400"))
+    
+    # Participant documents per bulk_write when reconciling post vote counts
+    RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "1000"))
+    
+    # Keep hot post vote counts in memory and flush them in bulk (interval in ms, idle TTL in seconds)
+    WRITE_BEHIND_COUNTERS = os.getenv("WRITE_BEHIND_COUNTERS", "true").lower() == "true"
+    COUNTER_FLUSH_INTERVAL_MS = int(os.getenv("COUNTER_FLUSH_INTERVAL_MS", "500"))
+    COUNTER_IDLE_TTL = int(os.getenv("COUNTER_IDLE_TTL", "600"))
+    
+    # Answer vote taps immediately and verify subscriptions in a background worker pool
+    OPTIMISTIC_VOTES = os.getenv("OPTIMISTIC_VOTES", "false").lower() == "true"
+    VERIFICATION_WORKERS = int(os.getenv("VERIFICATION_WORKERS", "5"))
+    VERIFICATION_QUEUE_SIZE = int(os.getenv("VERIFICATION_QUEUE_SIZE", "1000"))
+    # Votes Telegram couldn't answer for are retried after attempt * VERIFICATION_RETRY_DELAY seconds
+    VERIFICATION_RETRY_DELAY = int(os.getenv("VERIFICATION_RETRY_DELAY", "30"))
+    VERIFICATION_MAX_RETRIES = int(os.getenv("VERIFICATION_MAX_RETRIES", "5"))
+    
+    # Append-only vote event log; compaction interval in minutes, lag in seconds
+    VOTE_EVENTS_ENABLED = os.getenv("VOTE_EVENTS_ENABLED", "true").lower() == "true"
+    VOTE_EVENTS_COMPACT_INTERVAL = int(os.getenv("VOTE_EVENTS_COMPACT_INTERVAL", "10"))
+    VOTE_EVENTS_COMPACTION_LAG = int(os.getenv("VOTE_EVENTS_COMPACTION_LAG", "60"))
+    
+    # Vote tap throttling per voter: sustained taps per second, burst size, tracked voters
+    VOTE_TAP_RATE = float(os.getenv("VOTE_TAP_RATE", "0.5"))
+    VOTE_TAP_BURST = int(os.getenv("VOTE_TAP_BURST", "5"))
+    VOTE_THROTTLE_SIZE = int(os.getenv("VOTE_THROTTLE_SIZE", "100000"))
+    
+    # Channel username -> chat id resolver refresh interval (in minutes)
+    CHANNEL_RESOLVER_REFRESH = int(os.getenv("CHANNEL_RESOLVER_REFRESH", "60"))
+    
     # Random emojis for vote polls
     VOTE_EMOJIS = ["⚡", "🔥", "💎", "🎯", "🚀", "⭐", "💫", "🌟", "✨", "🎭"]
     
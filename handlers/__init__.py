@@ -6,6 +6,7 @@ from . import vote
 from . import verify
 from . import admin
 from . import force_subscribe
+from . import membership
 
 # Make handlers available at package level
 __all__ = [
@@ -13,5 +14,6 @@ __all__ = [
     'vote', 
     'verify',
     'admin',
-    'force_subscribe'
+    'force_subscribe',
+    'membership'
 ]
\ No newline at end of file
@@ -1,6 +1,11 @@
+import time
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from config import Config
+from utils.resolver import channel_resolver
+from utils.health import channel_health
+from utils.reconcile import VoteReconciler
+from utils.sweep import SweepRuns
 
 class AdminHandler:
     def __init__(self, app: Client, db):
@@ -68,6 +73,50 @@ class AdminHandler:
             
             await self.delete_vote_poll(message, channel_username)
 
+        @self.app.on_message(filters.command("channelhealth") & filters.private)
+        async def channel_health_command(client: Client, message: Message):
+            """Show broken/degraded channels, or reset one with /channelhealth reset @channel"""
+            if not await self.is_owner(message.from_user.id):
+                await message.reply_text("❌ **Access denied!** Only bot owner can use this command.")
+                return
+            
+            if len(message.command) >= 3 and message.command[1].lower() == "reset":
+                channel_username = message.command[2]
+                if not channel_username.startswith("@"):
+                    channel_username = f"@{channel_username}"
+                
+                if channel_health.reset(channel_username):
+                    await message.reply_text(f"✅ **Health state reset for {channel_username}**")
+                else:
+                    await message.reply_text(f"ℹ️ **{channel_username} is already healthy**")
+                return
+            
+            await self.send_channel_health(message)
+        
+        @self.app.on_message(filters.command("sweepstatus") & filters.private)
+        async def sweep_status_command(client: Client, message: Message):
+            """Show the telemetry of recent subscription sweeps and their trend"""
+            if not await self.is_owner(message.from_user.id):
+                await message.reply_text("❌ **Access denied!** Only bot owner can use this command.")
+                return
+            
+            await self.send_sweep_status(message)
+        
+        @self.app.on_message(filters.command("reconcile") & filters.private)
+        async def reconcile_command(client: Client, message: Message):
+            """Recompute post vote counts: /reconcile [@channel_username] [dry]"""
+            if not await self.is_owner(message.from_user.id):
+                await message.reply_text("❌ **Access denied!** Only bot owner can use this command.")
+                return
+            
+            args = message.command[1:]
+            dry_run = "dry" in [arg.lower() for arg in args]
+            channel_username = next((arg for arg in args if arg.lower() != "dry"), None)
+            if channel_username and not channel_username.startswith("@"):
+                channel_username = f"@{channel_username}"
+            
+            await self.reconcile_vote_counts(message, channel_username, dry_run)
+        
         @self.app.on_message(filters.command("debug_admin") & filters.private)
         async def debug_admin_command(client: Client, message: Message):
             """Debug admin status for a channel and user"""
@@ -217,6 +266,114 @@ class AdminHandler:
         except Exception as e:
             await message.reply_text(f"❌ **Error deleting vote poll:** {str(e)}")
 
+    async def send_channel_health(self, message: Message):
+        """Send the state of every unhealthy channel"""
+        try:
+            channels = channel_health.snapshot()
+            
+            if not channels:
+                await message.reply_text("✅ **All channels are healthy!**")
+                return
+            
+            now = time.time()
+            health_text = "🩺 **Channel Health**\n\n"
+            for record in sorted(channels, key=lambda r: r["state"]):
+                icon = "🔴" if record["state"] == "broken" else "🟡"
+                health_text += f"{icon} **{record['channel']}** - {record['state']}\n"
+                health_text += f"• Failures: {record['failures']}\n"
+                health_text += f"• Last Error: {record['last_error']}\n"
+                if record["state"] == "broken":
+                    retry_in = max(0, int(record["next_retry_at"] - now))
+                    health_text += f"• Next Retry: {retry_in}s\n"
+                health_text += "\n"
+            
+            health_text += "**Reset:** `/channelhealth reset @channel_username`"
+            await message.reply_text(health_text)
+            
+        except Exception as e:
+            await message.reply_text(f"❌ **Error fetching channel health:** {str(e)}")
+    
+    async def send_sweep_status(self, message: Message):
+        """Send the last sweep runs from sweep_runs and how throughput is moving"""
+        try:
+            runs = await SweepRuns(self.db).recent(10)
+            
+            if not runs:
+                await message.reply_text("ℹ️ **No sweep runs recorded yet**")
+                return
+            
+            last = runs[0]
+            status_text = "🧹 **Subscription Sweeps**\n\n"
+            status_text += f"**Last Run ({last['mode']})** - {last['started_at'].strftime('%Y-%m-%d %H:%M')}\n"
+            status_text += f"• Duration: {last['duration_seconds']}s\n"
+            status_text += f"• Channels: {last['channels_scanned']}\n"
+            status_text += f"• Voters Checked: {last['voters_checked']} ({last['users_per_second']}/s)\n"
+            status_text += f"• Cache Hits: {last['cache_hits']}\n"
+            status_text += f"• Telegram Calls: {last['telegram_calls']}\n"
+            status_text += f"• FloodWait: {last['flood_wait_seconds']}s\n"
+            status_text += f"• Votes Removed: {last['votes_removed']}\n"
+            for removal in last["removals_by_channel"][:5]:
+                status_text += f"  - {removal['channel']}: {removal['removed']}\n"
+            if last["errors_by_class"]:
+                errors = ", ".join(f"{name} x{count}" for name, count in last["errors_by_class"].items())
+                status_text += f"• Errors: {errors}\n"
+            
+            status_text += "\n**Recent Runs**\n"
+            for run in runs:
+                status_text += (
+                    f"• {run['started_at'].strftime('%m-%d %H:%M')} {run['mode']}: "
+                    f"{run['voters_checked']} voters, {run['users_per_second']}/s, "
+                    f"-{run['votes_removed']} votes, {run['flood_wait_seconds']}s flood\n"
+                )
+            
+            trend = SweepRuns.trend(runs)
+            if trend["users_per_second"]["previous"] is not None:
+                status_text += "\n**Trend (last 5 vs previous 5)**\n"
+                for field, label in (("users_per_second", "Users/sec"), ("votes_removed", "Removed"),
+                                     ("flood_wait_seconds", "FloodWait s"), ("duration_seconds", "Duration s")):
+                    status_text += f"• {label}: {trend[field]['previous']} → {trend[field]['latest']}\n"
+            
+            await message.reply_text(status_text)
+            
+        except Exception as e:
+            await message.reply_text(f"❌ **Error fetching sweep status:** {str(e)}")
+    
+    async def reconcile_vote_counts(self, message: Message, channel_username: str = None, dry_run: bool = False):
+        """Run the bulk reconcile and report progress in one edited message"""
+        status_message = await message.reply_text(f"🔄 **Reconciling vote counts for {channel_username or 'all channels'}...**")
+        last_edit = 0
+        
+        async def report_progress(report: dict):
+            nonlocal last_edit
+            # Editing more often than this would only hit flood limits
+            if time.time() - last_edit < 3:
+                return
+            last_edit = time.time()
+            try:
+                await status_message.edit_text(
+                    f"🔄 **Reconciling vote counts for {report['channel']}...**\n\n"
+                    f"• Checked: {report['checked']}/{report['posts']} posts\n"
+                    f"• Changed: {report['changed']}"
+                )
+            except Exception:
+                pass
+        
+        try:
+            reconciler = VoteReconciler(self.app, self.db)
+            report = await reconciler.reconcile(channel_username, dry_run=dry_run, progress=report_progress)
+            
+            await status_message.edit_text(
+                f"✅ **Vote counts reconciled for {report['channel']}**{' (dry run)' if dry_run else ''}\n\n"
+                f"• Posts Checked: {report['checked']}\n"
+                f"• Counts Changed: {report['changed']}\n"
+                f"• Buttons Queued: {report['buttons_queued']}\n"
+                f"• Votes Counted: {report['votes']}\n"
+                f"• Time: {report['elapsed']}s"
+            )
+            
+        except Exception as e:
+            await status_message.edit_text(f"❌ **Error reconciling vote counts:** {str(e)}")
+    
     async def debug_admin_status(self, message: Message, channel_username: str, user_id: int):
         """Debug admin status for a channel and user"""
         try:
@@ -226,13 +383,13 @@ class AdminHandler:
             
             # Get channel info
             try:
-                chat = await self.app.get_chat(channel_username)
-                debug_text += f"✅ **Channel Found:** {chat.title}\n"
-                debug_text += f"**Chat ID:** {chat.id}\n\n"
+                chat = await channel_resolver.resolve(self.app, self.db, channel_username)
+                debug_text += f"✅ **Channel Found:** {chat['title']}\n"
+                debug_text += f"**Chat ID:** {chat['chat_id']}\n\n"
                 
                 # Check bot admin status
                 try:
-                    bot_member = await self.app.get_chat_member(chat.id, "me")
+                    bot_member = await self.app.get_chat_member(chat['chat_id'], "me")
                     bot_status_str = str(bot_member.status).split('.')[-1].lower()
                     debug_text += f"🤖 **Bot Status:** {bot_member.status}\n"
                     debug_text += f"🤖 **Bot Status String:** {bot_status_str}\n"
@@ -242,7 +399,7 @@ class AdminHandler:
                 
                 # Check user admin status
                 try:
-                    user_member = await self.app.get_chat_member(chat.id, user_id)
+                    user_member = await self.app.get_chat_member(chat['chat_id'], user_id)
                     user_status_str = str(user_member.status).split('.')[-1].lower()
                     debug_text += f"👤 **User Status:** {user_member.status}\n"
                     debug_text += f"👤 **User Status String:** {user_status_str}\n"
@@ -0,0 +1,82 @@
+from pyrogram import Client
+from pyrogram.types import ChatMemberUpdated
+from config import Config
+from utils.cache import membership_cache, bot_admin_cache, channel_key
+from utils.check import bot_identity
+
+# Statuses that count as subscribed - same list SubscriptionChecker uses
+ACTIVE_STATUSES = ["member", "administrator", "creator", "owner"]
+
+class MembershipHandler:
+    """React to chat-member updates pushed by Telegram instead of waiting for the sweep"""
+
+    def __init__(self, app: Client, db, scheduler):
+        self.app = app
+        self.db = db
+        self.scheduler = scheduler
+        self.cache = membership_cache
+        self.required_channels = {channel_key(Config.SUPPORT_CHANNEL), channel_key(Config.UPDATE_CHANNEL)}
+
+    def register(self):
+        """Register chat-member update handler"""
+
+        @self.app.on_chat_member_updated()
+        async def handle_member_update(client: Client, update: ChatMemberUpdated):
+            try:
+                await self.process_member_update(update)
+            except Exception as e:
+                print(f"Error handling chat member update: {e}")
+
+    def is_active(self, member) -> bool:
+        """Check if a ChatMember snapshot counts as subscribed"""
+        if member is None:
+            return False
+
+        status_str = str(member.status).split('.')[-1].lower()
+        if status_str == "restricted":
+            return bool(getattr(member, "is_member", False))
+        return status_str in ACTIVE_STATUSES
+
+    async def process_member_update(self, update: ChatMemberUpdated):
+        """Update the membership cache and drop votes of users who left"""
+        member = update.new_chat_member or update.old_chat_member
+        if member is None or member.user is None:
+            return
+
+        # Bot's own status changed - the cached admin status is stale
+        if member.user.id == bot_identity.id:
+            bot_admin_cache.invalidate(update.chat.id)
+            print(f"Bot status changed in {update.chat.id} - admin cache refreshed")
+            return
+
+        # Votes are stored by channel username, so chats without one have nothing to clean up
+        if not update.chat.username:
+            return
+
+        user_id = member.user.id
+        channel_username = f"@{update.chat.username}"
+        was_member = self.is_active(update.old_chat_member)
+        is_member = self.is_active(update.new_chat_member)
+
+        # Telegram just told us the answer - store it instead of invalidating
+        self.cache.set_membership(user_id, channel_username, is_member)
+
+        if was_member and not is_member:
+            await self.handle_user_left(user_id, channel_username)
+
+    async def handle_user_left(self, user_id: int, channel_username: str):
+        """Remove a leaving user's votes in the channel, or everywhere for required channels"""
+        # Stored usernames keep the case the vote creator typed, so match by normalized key
+        channels = await self.db.db["user_votes"].distinct("channel_username", {"voter_id": user_id})
+
+        if channel_key(channel_username) not in self.required_channels:
+            channels = [channel for channel in channels if channel_key(channel) == channel_key(channel_username)]
+        # Leaving SUPPORT/UPDATE invalidates every vote the user cast, so keep them all
+
+        for channel in channels:
+            removed = await self.scheduler.remove_user_votes(user_id, channel)
+
+            if removed and Config.LOG_CHANNEL_ID:
+                await self.scheduler.log_participant_removal(user_id, channel)
+
+        print(f"User {user_id} left {channel_username} - cleaned votes in {len(channels)} channels")
@@ -2,7 +2,7 @@ import random
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 from config import Config
-from utils.check import SubscriptionChecker
+from utils.check import SubscriptionChecker, bot_identity
 from utils.keyboards import Keyboards
 from database import permanent_db
 
@@ -202,7 +202,7 @@ class StartHandler:
             
             # Get participation link for the button
             channel_username = vote_data.get("channel", vote_data.get("channel_username", ""))
-            me = await self.app.get_me()
+            me = await bot_identity.get(self.app)
             participation_link = f"https://t.me/{me.username}?start={channel_username[1:]}"
             
             # Create updated keyboard
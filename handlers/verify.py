@@ -1,15 +1,21 @@
-import asyncio
 from datetime import datetime
 from pyrogram import Client, filters
 from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from utils.check import SubscriptionChecker
+from utils.health import channel_health
+from utils.cache import post_metadata_cache
+from utils.buttons import button_coalescer, vote_button_markup
+from utils.callback_data import VOTE_CALLBACK_PATTERN, decode_vote_callback, encode_vote_token, new_post_key
+from utils.throttle import vote_limiter, vote_inflight
+from utils.ledger import verification_ledger
 
 class VerifyHandler:
-    def __init__(self, app: Client, db):
+    def __init__(self, app: Client, db, verifier=None):
         self.app = app
         self.db = db
         self.checker = SubscriptionChecker(app, db)
+        self.verifier = verifier  # VoteVerifier when OPTIMISTIC_VOTES is on
     
     def register(self):
         """Register verification callback handlers"""
@@ -53,132 +59,79 @@ class VerifyHandler:
             # Just acknowledge the click, don't do anything else
             await query.answer("📊 Current vote count!", show_alert=False)
             
-        @self.app.on_callback_query(filters.regex(r"^channel_vote_"))
+        @self.app.on_callback_query(filters.regex(VOTE_CALLBACK_PATTERN))
         async def handle_channel_vote_button(client: Client, query: CallbackQuery):
-            """Handle channel vote button clicks"""
+            """Throttle spam taps in memory before any Mongo or Telegram work"""
+            tap_key = (query.from_user.id, query.data)
+            if not vote_inflight.claim(tap_key):
+                await query.answer("⏳ Your vote is already being processed, please wait.", show_alert=False)
+                return
             try:
-                print(f"DEBUG: Full callback data: {query.data}")
-                
-                # More flexible parsing - handle channel names that might contain underscores
-                callback_data = query.data
-                if not callback_data.startswith("channel_vote_"):
-                    await query.answer("**❌ ɪɴᴠᴀʟɪᴅ ᴠᴏᴛᴇ ᴅᴀᴛᴀ! ❖**", show_alert=True)
+                if not vote_limiter.allow(query.from_user.id):
+                    await query.answer("⚠️ Too many taps! Please slow down.", show_alert=True)
                     return
-                
-                # Remove the "channel_vote_" prefix
-                remaining_data = callback_data[13:]  # Remove "channel_vote_"
-                print(f"DEBUG: Remaining data after prefix removal: {remaining_data}")
-                
-                # Split by underscore and find the last two numeric parts
-                parts = remaining_data.split("_")
-                print(f"DEBUG: All parts: {parts}")
-                
-                if len(parts) < 3:
+                await process_channel_vote(query)
+            finally:
+                vote_inflight.release(tap_key)
+        
+        async def process_channel_vote(query: CallbackQuery):
+            """Handle channel vote button clicks"""
+            try:
+                decoded = decode_vote_callback(query.data)
+                if decoded is None:
                     await query.answer("**❌ ɪɴᴠᴀʟɪᴅ ᴠᴏᴛᴇ ᴅᴀᴛᴀ! ❖**", show_alert=True)
                     return
                 
-                # Find the last numeric part (timestamp) and second last numeric part (user_id)
-                user_id_str = None
-                timestamp_str = None
-                
-                # Look from the end to find two consecutive numeric parts
-                for i in range(len(parts) - 1, 0, -1):
-                    if parts[i].isdigit() and parts[i-1].isdigit():
-                        user_id_str = parts[i-1]
-                        timestamp_str = parts[i]
-                        # Channel name is everything before these two parts
-                        channel_name = "_".join(parts[:i-1])
-                        break
-                
-                if not user_id_str or not timestamp_str:
-                    await query.answer("**❌ ɪɴᴠᴀʟɪᴅ ᴠᴏᴛᴇ ᴅᴀᴛᴀ! ❖**", show_alert=True)
-                    return
+                if decoded["version"] == 1:
+                    # Compact token - the post key points at the participant document
+                    post = await self.db.get_participant_by_post_key(decoded["post_key"])
+                    if not post:
+                        await query.answer("**❌ ɪɴᴠᴀʟɪᴅ ᴠᴏᴛᴇ ᴅᴀᴛᴀ! ❖**", show_alert=True)
+                        return
+                    channel_username = post["channel_username"]
+                    participant_user_id = post["user_id"]
+                    unique_post_id = post["unique_post_id"]
+                else:
+                    # Legacy button: channel_vote_{channel}_{user_id}_{micros}
+                    channel_username = decoded["channel_username"]
+                    participant_user_id = decoded["participant_user_id"]
+                    unique_post_id = decoded["unique_post_id"]
                 
-                print(f"DEBUG: Channel name: {channel_name}")
-                print(f"DEBUG: User ID string: {user_id_str}")
-                print(f"DEBUG: Timestamp string: {timestamp_str}")
+                voter_id = query.from_user.id
                 
-                # Validate user ID
-                try:
-                    participant_user_id = int(user_id_str)
-                    unique_post_id = f"{user_id_str}_{timestamp_str}"
-                    print(f"DEBUG: Participant user ID: {participant_user_id}")
-                    print(f"DEBUG: Unique post ID: {unique_post_id}")
-                except ValueError:
-                    print(f"DEBUG: Invalid user_id format: {user_id_str}")
-                    await query.answer("**❌ ɪɴᴠᴀʟɪᴅ ᴠᴏᴛᴇ ᴅᴀᴛᴀ! ❖**", show_alert=True)
+                if self.verifier is not None:
+                    await self.accept_optimistic_vote(query, voter_id, participant_user_id, unique_post_id, channel_username)
                     return
                 
-                # Check if voter is subscribed to the channel
-                voter_id = query.from_user.id
-                channel_username = f"@{channel_name}"
-                
                 # Verify subscription to all required channels
                 subscription_status = await self.checker.check_all_subscriptions(
                     voter_id, [Config.SUPPORT_CHANNEL, Config.UPDATE_CHANNEL, channel_username]
                 )
                 
                 if subscription_status["all_subscribed"]:
-                    # Check if user has already voted for this specific participant post
-                    print(f"DEBUG: Checking vote - Voter: {voter_id}, Participant: {participant_user_id}, Post ID: {unique_post_id}, Channel: {channel_username}")
-                    existing_vote = await self.db.get_user_vote_on_post(voter_id, unique_post_id)
-                    print(f"DEBUG: Existing vote found: {existing_vote}")
+                    # Record the vote and bump the post counter - None means already voted
+                    vote_record = {
+                        "voter_id": voter_id,
+                        "participant_user_id": participant_user_id,
+                        "unique_post_id": unique_post_id,
+                        "channel_username": channel_username,
+                        "vote_timestamp": datetime.now()
+                    }
+                    participant_data = await self.db.record_vote(vote_record)
                     
-                    if existing_vote:
+                    if participant_data is None:
                         # User has already voted for this specific participant post
                         print(f"DEBUG: Duplicate vote prevented for voter {voter_id} on post {unique_post_id}")
                         await query.answer("❌ You have already voted for this participant!", show_alert=True)
                     else:
-                        # Allow vote - first time voting for this specific participant post
-                        print(f"DEBUG: Allowing vote for voter {voter_id} on post {unique_post_id}")
-                        await query.answer("✅ Vote counted! Thank you for voting.", show_alert=True)
-                        
-                        # Record the vote to prevent duplicate voting for same participant post
-                        vote_record = {
-                            "voter_id": voter_id,
-                            "participant_user_id": participant_user_id,
-                            "unique_post_id": unique_post_id,
-                            "channel_username": channel_username,
-                            "vote_timestamp": datetime.now()
-                        }
-                        await self.db.add_user_vote(vote_record)
                         print(f"DEBUG: Vote recorded: {vote_record}")
+                        await query.answer("✅ Vote counted! Thank you for voting.", show_alert=True)
                         
-                        # Update vote count for this specific post
-                        new_count = await self.db.get_post_vote_count(unique_post_id)
-                        await self.db.update_post_vote_count(unique_post_id, new_count)
+                        self.schedule_button_update(query, channel_username, participant_data)
                         
-                        # Update button text with new count for this specific post
-                        participant_data = await self.db.db[Config.PARTICIPANTS_COLLECTION].find_one(
-                            {"channel_username": channel_username, "unique_post_id": unique_post_id}
-                        )
-                        if participant_data:
-                            new_count = participant_data.get("post_vote_count", 1)
-                            emoji = "⚡"
-                            updated_button = InlineKeyboardMarkup([
-                                [InlineKeyboardButton(f"{emoji} Vote for this participant ({new_count})", callback_data=f"channel_vote_{channel_name}_{unique_post_id}")]
-                            ])
-                            
-                            try:
-                                await query.edit_message_reply_markup(reply_markup=updated_button)
-                                print(f"DEBUG: Button updated successfully for post {unique_post_id} with count {new_count}")
-                            except Exception as e:
-                                print(f"DEBUG: Error updating button for post {unique_post_id}: {e}")
-                                # Try to update the message in the channel directly
-                                try:
-                                    # Find the message ID from database
-                                    message_data = await self.db.db[Config.PARTICIPANTS_COLLECTION].find_one(
-                                        {"channel_username": channel_username, "unique_post_id": unique_post_id}
-                                    )
-                                    if message_data and message_data.get("channel_message_id"):
-                                        await self.app.edit_message_reply_markup(
-                                            chat_id=channel_username,
-                                            message_id=message_data["channel_message_id"],
-                                            reply_markup=updated_button
-                                        )
-                                        print(f"DEBUG: Channel message updated successfully for post {unique_post_id}")
-                                except Exception as e2:
-                                    print(f"DEBUG: Error updating channel message: {e2}")
+                        # Just verified - the sweep doesn't need to look at this voter for a while
+                        if Config.VERIFICATION_LEDGER_ENABLED:
+                            await verification_ledger.record(self.db, voter_id, channel_username, True)
                 else:
                     # Not subscribed to required channels
                     missing_channels = subscription_status.get("missing_channels", [])
@@ -211,6 +164,46 @@ class VerifyHandler:
                 reply_markup=keyboards.get_start_keyboard()
             )
     
+    def schedule_button_update(self, query: CallbackQuery, channel_username: str, participant_data: dict):
+        """Queue the button update - taps on a hot post share one edit"""
+        message_id = participant_data.get("channel_message_id") or (query.message.message_id if query.message else None)
+        if participant_data and message_id and not channel_health.is_broken(channel_username):
+            button_coalescer.schedule(
+                self.app, channel_username, message_id, query.data,
+                participant_data.get("post_vote_count", 1)
+            )
+    
+    async def accept_optimistic_vote(self, query: CallbackQuery, voter_id: int, participant_user_id: int, unique_post_id: str, channel_username: str):
+        """Count the vote now and verify subscriptions in the background"""
+        channels = self.verifier.required_channels(channel_username)
+        
+        # Only reject up front when the cache already knows the voter is missing
+        missing_channels = [
+            channel for channel in channels
+            if self.checker.cache.get_membership(voter_id, channel) is False
+        ]
+        if missing_channels:
+            await query.answer(f"**❌ ʏᴏᴜ ᴍᴜsᴛ sᴜʙsᴄʀɪʙᴇ ᴛᴏ ᴀʟʟ ʀᴇǫᴜɪʀᴇᴅ ᴄʜᴀɴɴᴇʟs: {', '.join(missing_channels)} ❖**", show_alert=True)
+            return
+        
+        vote_record = {
+            "voter_id": voter_id,
+            "participant_user_id": participant_user_id,
+            "unique_post_id": unique_post_id,
+            "channel_username": channel_username,
+            "vote_timestamp": datetime.now(),
+            "provisional": True
+        }
+        participant_data = await self.db.record_vote(vote_record)
+        
+        if participant_data is None:
+            await query.answer("❌ You have already voted for this participant!", show_alert=True)
+            return
+        
+        await query.answer("✅ Vote counted! Thank you for voting.", show_alert=True)
+        self.schedule_button_update(query, channel_username, participant_data)
+        await self.verifier.submit(vote_record)
+    
     async def verify_support_channels(self, query: CallbackQuery):
         """Verify subscription to support and update channels"""
         user_id = query.from_user.id
@@ -430,15 +423,9 @@ class VerifyHandler:
             import time
             unique_participant_id = f"{user_data['user_id']}_{int(time.time() * 1000000)}"  # Microsecond precision
             
-            # Get channel name without @ symbol
-            channel_name = channel_username[1:] if channel_username.startswith('@') else channel_username
-            
-            callback_data = f"channel_vote_{channel_name}_{unique_participant_id}"
-            print(f"DEBUG: Generated callback data: {callback_data}")
-            
-            vote_button = InlineKeyboardMarkup([
-                [InlineKeyboardButton(f"{emoji} Vote for this participant (0)", callback_data=callback_data)]
-            ])
+            # The button carries only a short post key - long channel names can't overflow 64 bytes
+            post_key = new_post_key()
+            vote_button = vote_button_markup(encode_vote_token(post_key), 0, emoji)
             
             # Send message to channel with voting button and image
             try:
@@ -467,12 +454,14 @@ class VerifyHandler:
                     "user_id": user_data["user_id"],
                     "channel_username": channel_username,
                     "unique_post_id": unique_participant_id,
+                    "post_key": post_key,
                     "channel_message_id": sent_message.id,
                     "channel_chat_id": channel_username,
                     "post_vote_count": 0,  # Individual vote count for this specific post
                     "created_at": datetime.now()
                 }
                 await self.db.db[Config.PARTICIPANTS_COLLECTION].insert_one(participant_entry)
+                post_metadata_cache.remember(participant_entry)
                 print(f"DEBUG: Participant entry created with unique_post_id: {unique_participant_id}")
                 
                 # Also update the original vote entry
@@ -81,8 +81,8 @@ class VoteHandler:
             
             # Check if bot can access the channel
             try:
-                chat = await self.app.get_chat(channel_username)
-                chat_id = chat.id
+                chat = await self.checker.resolve_channel(channel_username)
+                chat_id = chat["chat_id"]
                 
                 # Try to get bot's membership status
                 try:
@@ -176,11 +176,11 @@ class VoteHandler:
             
             # Save channel permanently to database
             try:
-                channel_info = await self.app.get_chat(channel_username)
+                channel_info = await self.checker.resolve_channel(channel_username)
                 channel_data = {
                     "channel_username": channel_username,
-                    "channel_id": channel_info.id,
-                    "channel_title": channel_info.title,
+                    "channel_id": channel_info["chat_id"],
+                    "channel_title": channel_info["title"],
                     "added_by_user_id": creator_id
                 }
                 await self.permanent_db.save_channel(channel_data)
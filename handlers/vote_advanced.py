@@ -371,8 +371,8 @@ Example: @KomalMusicUpdate
         """Comprehensive channel validation"""
         try:
             # Get channel info
-            chat = await self.app.get_chat(channel_username)
-            chat_id = chat.id
+            chat = await self.checker.resolve_channel(channel_username)
+            chat_id = chat["chat_id"]
             
             # Check if bot is member and has admin rights
             try:
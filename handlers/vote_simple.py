@@ -2,7 +2,7 @@ from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from pyrogram.errors import PeerIdInvalid, UserNotParticipant, ChannelPrivate, ChatAdminRequired
 from config import Config
-from utils.check import SubscriptionChecker
+from utils.check import SubscriptionChecker, bot_identity
 import random
 from datetime import datetime
 
@@ -66,8 +66,8 @@ class SimpleVoteHandler:
         try:
             # Step 1: Check if bot is in the channel
             try:
-                chat = await self.app.get_chat(channel_username)
-                chat_id = chat.id
+                chat = await self.checker.resolve_channel(channel_username)
+                chat_id = chat["chat_id"]
             except PeerIdInvalid:
                 await message.reply_text("❌ **Please add me in your channel.**")
                 return
@@ -89,7 +89,7 @@ class SimpleVoteHandler:
             
             try:
                 # Get user's membership status in the channel
-                user_member = await self.app.get_chat_member(chat_id, user_id)
+                user_member = await self.checker.get_chat_member(chat_id, user_id)
                 status_str = str(user_member.status).split('.')[-1].lower()
                 is_channel_admin = status_str in ["administrator", "creator", "owner"]
                 
@@ -140,7 +140,7 @@ class SimpleVoteHandler:
             vote_object_id = ObjectId(vote_id)
             
             # Step 6: Get actual bot username and create participation link
-            me = await self.app.get_me()
+            me = await bot_identity.get(self.app)
             bot_username = me.username
             participation_link = f"https://t.me/{bot_username}?start={channel_username[1:]}"
             
@@ -5,6 +5,11 @@ from pyrogram.errors import FloodWait
 from config import Config
 from utils.db import Database
 from utils.scheduler import VoteScheduler
+from utils.resolver import channel_resolver
+from utils.check import bot_identity
+from utils.buttons import button_coalescer
+from utils.counters import post_counters
+from utils.verification import VoteVerifier
 from handlers import start, vote, verify, admin, broadcast
 from database import permanent_db
 
@@ -25,8 +30,11 @@ class VoteBot:
             sleep_threshold=60
         )
         self.db = Database()
+        self.me = None  # Bot's own User, resolved once in start_bot
         self.permanent_db = permanent_db
         self.scheduler = VoteScheduler(self.app, self.db)
+        self.verifier = VoteVerifier(self.app, self.db) if Config.OPTIMISTIC_VOTES else None
+        self.scheduler.verifier = self.verifier
         
     async def start_bot(self):
         """Start the bot and initialize services"""
@@ -36,10 +44,22 @@ class VoteBot:
             await self.app.start()
             logger.info("Bot started successfully!")
             
+            # Resolve the bot's own identity once for every handler
+            self.me = await bot_identity.get(self.app)
+            logger.info(f"Running as @{self.me.username} ({self.me.id})")
+            
             # Initialize database
             await self.db.connect()
             logger.info("Database connected!")
             
+            # Warm channel resolver from stored peers
+            await channel_resolver.load(self.db)
+            
+            # Counts may have missed unflushed taps if the last run crashed
+            if Config.WRITE_BEHIND_COUNTERS:
+                await post_counters.recount(self.db)
+                post_counters.start(self.db)
+            
             # Initialize permanent database
             await self.permanent_db.connect()
             logger.info("Permanent database connected!")
@@ -48,6 +68,10 @@ class VoteBot:
             await self.scheduler.start()
             logger.info("Scheduler started!")
             
+            # Verify optimistically accepted votes in the background
+            if self.verifier is not None:
+                await self.verifier.start()
+            
             # Register handlers
             self.register_handlers()
             
@@ -74,13 +98,15 @@ class VoteBot:
         from handlers.verify import VerifyHandler
         from handlers.admin import AdminHandler
         from handlers.force_subscribe import ForceSubscribeHandler
+        from handlers.membership import MembershipHandler
         
         # Initialize handlers with dependencies
         start_handler = StartHandler(self.app, self.db)
         vote_handler = SimpleVoteHandler(self.app, self.db)
-        verify_handler = VerifyHandler(self.app, self.db)
+        verify_handler = VerifyHandler(self.app, self.db, self.verifier)
         admin_handler = AdminHandler(self.app, self.db)
         force_subscribe_handler = ForceSubscribeHandler(self.app, self.db)
+        membership_handler = MembershipHandler(self.app, self.db, self.scheduler)
         from handlers.broadcast_advanced import AdvancedBroadcastHandler, ServedTracker
         from handlers.track import TrackHandler
         broadcast_handler = AdvancedBroadcastHandler(self.app, self.db)
@@ -95,6 +121,8 @@ class VoteBot:
         admin_handler.register()
         broadcast_handler.register()
         track_handler.register()
+        if Config.MEMBER_UPDATES_ENABLED:
+            membership_handler.register()
         served_tracker.register_middleware(self.app)
         
         logger.info("All handlers registered successfully!")
@@ -103,6 +131,10 @@ class VoteBot:
         """Cleanup resources"""
         try:
             await self.scheduler.stop()
+            if self.verifier is not None:
+                await self.verifier.stop()
+            await post_counters.stop(self.db)
+            await button_coalescer.flush_all()
             await self.db.close()
             await self.app.stop()
             logger.info("Bot stopped and resources cleaned up!")
@@ -6,6 +6,8 @@ Manual vote removal script for testing scheduler functionality
 import asyncio
 from utils.db import Database
 from utils.check import SubscriptionChecker
+from utils.buttons import button_coalescer
+from utils.reconcile import VoteReconciler
 from config import Config
 from pyrogram import Client
 import os
@@ -54,6 +56,8 @@ async def manual_vote_removal():
             user_vote_map[user_id].append(vote)
         
         print(f"Votes from {len(user_vote_map)} unique users")
+        removed_any = False
+        affected_posts = {}  # unique_post_id -> new count
         
         # Check each user's subscription
         for user_id, votes in user_vote_map.items():
@@ -69,65 +73,25 @@ async def manual_vote_removal():
             if not subscription_status["all_subscribed"]:
                 print(f"User {user_id} is not subscribed - removing votes...")
                 
-                # Remove each vote
-                for vote in votes:
-                    unique_post_id = vote.get("unique_post_id")
-                    participant_user_id = vote["participant_user_id"]
-                    
-                    if unique_post_id:
-                        # Decrement post vote count
-                        result = await db.db["participants"].update_one(
-                            {
-                                "channel_username": channel_username,
-                                "unique_post_id": unique_post_id
-                            },
-                            {"$inc": {"post_vote_count": -1}}
-                        )
-                        
-                        if result.modified_count > 0:
-                            print(f"Decremented vote count for post {unique_post_id}")
-                            
-                            # Get updated participant data
-                            participant_data = await db.db["participants"].find_one({
-                                "channel_username": channel_username,
-                                "unique_post_id": unique_post_id
-                            })
-                            
-                            if participant_data and participant_data.get("channel_message_id"):
-                                new_count = participant_data.get("post_vote_count", 0)
-                                print(f"New vote count for post {unique_post_id}: {new_count}")
-                                
-                                # Update channel button
-                                try:
-                                    from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                                    emoji = "⚡"
-                                    channel_name = channel_username[1:]
-                                    updated_button = InlineKeyboardMarkup([
-                                        [InlineKeyboardButton(f"{emoji} Vote for this participant ({new_count})", 
-                                                            callback_data=f"channel_vote_{channel_name}_{unique_post_id}")]
-                                    ])
-                                    
-                                    await app.edit_message_reply_markup(
-                                        chat_id=channel_username,
-                                        message_id=participant_data["channel_message_id"],
-                                        reply_markup=updated_button
-                                    )
-                                    
-                                    print(f"Updated channel button for post {unique_post_id}")
-                                    
-                                except Exception as e:
-                                    print(f"Error updating button: {e}")
+                # Remove the votes in bulk; buttons are refreshed below
+                result = await db.remove_voter_votes(user_id, channel_username)
+                affected_posts.update(result["posts"])
                 
-                # Remove user votes from database
-                delete_result = await db.db["user_votes"].delete_many({
-                    "voter_id": user_id,
-                    "channel_username": channel_username
-                })
-                
-                print(f"Deleted {delete_result.deleted_count} vote records for user {user_id}")
+                print(f"Deleted {result['removed']} vote records for user {user_id}")
+                removed_any = True
             else:
                 print(f"User {user_id} is subscribed - keeping votes")
         
+        if removed_any:
+            reconciler = VoteReconciler(app, db)
+            for unique_post_id, new_count in affected_posts.items():
+                await reconciler.queue_button(unique_post_id, new_count)
+            
+            # One aggregation catches any count that had drifted before the removal
+            report = await reconciler.reconcile(channel_username)
+            await button_coalescer.flush_all()
+            print(f"Updated {len(affected_posts)} posts, fixed {report['changed']} drifted counts")
+        
         print("\nManual vote removal completed!")
         
     except Exception as e:
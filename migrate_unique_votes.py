@@ -0,0 +1,95 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from config import Config
+from utils.db import Database
+from utils.events import vote_events, REMOVE
+
+BATCH_SIZE = 1000
+
+async def migrate_unique_votes():
+    """Collapse duplicate user_votes, recount affected posts and create the unique index
+
+    Each deleted duplicate gets a REMOVE event when the vote event log is in
+    use, so replaying vote_events still matches user_votes. An unseeded log is
+    left alone; seeding at the next start reads the cleaned collection.
+    """
+    client = None
+    try:
+        client = AsyncIOMotorClient(Config.MONGO_DB_URI)
+        db = client[Config.DATABASE_NAME]
+        database = Database()
+        database.client = client
+        database.db = db
+        log_events = Config.VOTE_EVENTS_ENABLED and await vote_events.is_seeded(database)
+
+        print("=== FINDING DUPLICATE VOTES ===")
+
+        # Group votes by voter and post, oldest first so the original vote is kept.
+        # Legacy votes without a unique_post_id are distinct votes, not duplicates
+        duplicates = await db["user_votes"].aggregate([
+            {"$match": {"unique_post_id": {"$exists": True}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": {"voter_id": "$voter_id", "unique_post_id": "$unique_post_id"},
+                "ids": {"$push": "$_id"},
+                "channel_username": {"$first": "$channel_username"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True).to_list(length=None)
+
+        extra_votes = [
+            dict(group["_id"], _id=vote_id, channel_username=group.get("channel_username"))
+            for group in duplicates for vote_id in group["ids"][1:]
+        ]
+        affected_posts = list({group["_id"]["unique_post_id"] for group in duplicates})
+        print(f"Found {len(duplicates)} duplicated votes ({len(extra_votes)} extra documents) on {len(affected_posts)} posts")
+
+        deleted = 0
+        for start in range(0, len(extra_votes), BATCH_SIZE):
+            batch = extra_votes[start:start + BATCH_SIZE]
+            # One delete per vote so only the documents this run removed are logged
+            results = await asyncio.gather(*(db["user_votes"].delete_one({"_id": vote["_id"]}) for vote in batch))
+            removed = [vote for vote, result in zip(batch, results) if result.deleted_count]
+            deleted += len(removed)
+            if log_events:
+                await vote_events.append_votes(database, REMOVE, removed)
+        print(f"Deleted {deleted} duplicate votes{' and logged their REMOVE events' if log_events else ''}")
+
+        print("=== RECOUNTING AFFECTED POSTS ===")
+
+        # One aggregation and one bulk write instead of a count per post
+        counts = await db["user_votes"].aggregate([
+            {"$match": {"unique_post_id": {"$in": affected_posts}}},
+            {"$group": {"_id": "$unique_post_id", "count": {"$sum": 1}}}
+        ]).to_list(length=None)
+        live_counts = {post_id: 0 for post_id in affected_posts}
+        live_counts.update({group["_id"]: group["count"] for group in counts})
+
+        # By _id, so every participant document of a post is fixed, not just the first
+        participants = await db[Config.PARTICIPANTS_COLLECTION].find(
+            {"unique_post_id": {"$in": affected_posts}}, {"unique_post_id": 1}
+        ).to_list(length=None)
+        updates = [
+            UpdateOne({"_id": participant["_id"]}, {"$set": {"post_vote_count": live_counts[participant["unique_post_id"]]}})
+            for participant in participants
+        ]
+        for start in range(0, len(updates), BATCH_SIZE):
+            result = await db[Config.PARTICIPANTS_COLLECTION].bulk_write(updates[start:start + BATCH_SIZE], ordered=False)
+            print(f"Updated {result.modified_count} post vote counts")
+
+        print("=== CREATING UNIQUE INDEX ===")
+
+        await database.create_indexes()
+
+        print("=== MIGRATION COMPLETE ===")
+
+    except Exception as e:
+        print(f"Error migrating votes: {e}")
+    finally:
+        if client:
+            client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_unique_votes())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Rebuild participant post vote counts from the vote event log
+
+Usage:
+    python replay_vote_events.py --backfill          # seed the log from user_votes if the bot never did
+    python replay_vote_events.py                     # replay every post and fix drifted counts
+    python replay_vote_events.py --post 123_456 ...  # replay selected posts
+    python replay_vote_events.py --full --dry-run    # ignore snapshots, only report drift
+"""
+
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from config import Config
+from utils.db import Database
+from utils.events import vote_events
+
+BATCH_SIZE = 1000
+
+async def replay_vote_events(args):
+    """Replay the log and write the rebuilt counts in bulk"""
+    db = Database()
+    await db.connect()
+
+    try:
+        if args.backfill:
+            seeded = await vote_events.seed(db)
+            print(f"Seeded {seeded} cast events from user_votes")
+
+        if not await vote_events.is_seeded(db) and not args.dry_run:
+            # Without the seeded baseline the log only holds deltas since it was enabled
+            print("Vote event log was never seeded - run with --backfill first (or --dry-run)")
+            return
+
+        if args.compact:
+            compacted = await vote_events.compact(db)
+            print(f"Compacted events for {compacted} posts")
+
+        counts = await vote_events.replay(db, args.post or None, from_snapshots=not args.full)
+        print(f"Rebuilt counts for {len(counts)} posts from the event log")
+
+        # Compare with what the participants collection currently shows
+        participants = await db.db[Config.PARTICIPANTS_COLLECTION].find(
+            {"unique_post_id": {"$in": list(counts)}},
+            {"_id": 1, "unique_post_id": 1, "post_vote_count": 1}
+        ).to_list(length=None)
+
+        updates = []
+        for participant in participants:
+            unique_post_id = participant["unique_post_id"]
+            stored_count = participant.get("post_vote_count", 0)
+            if stored_count != counts[unique_post_id]:
+                print(f"Post {unique_post_id}: stored {stored_count}, log says {counts[unique_post_id]}")
+                updates.append(UpdateOne(
+                    {"_id": participant["_id"]},
+                    {"$set": {"post_vote_count": counts[unique_post_id]}}
+                ))
+
+        print(f"{len(updates)} of {len(participants)} posts have drifted")
+
+        if updates and not args.dry_run:
+            for start in range(0, len(updates), BATCH_SIZE):
+                await db.db[Config.PARTICIPANTS_COLLECTION].bulk_write(updates[start:start + BATCH_SIZE], ordered=False)
+            print(f"Fixed {len(updates)} post vote counts (run update_channel_buttons.py to refresh buttons)")
+
+    except Exception as e:
+        print(f"Error replaying vote events: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        await db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--post", nargs="*", help="unique_post_id values to replay (default: all)")
+    parser.add_argument("--full", action="store_true", help="replay the whole log instead of snapshot + tail")
+    parser.add_argument("--backfill", action="store_true", help="seed cast events from user_votes if the log was never seeded")
+    parser.add_argument("--compact", action="store_true", help="run a compaction before replaying")
+    parser.add_argument("--dry-run", action="store_true", help="only report drifted counts")
+    asyncio.run(replay_vote_events(parser.parse_args()))
@@ -0,0 +1,1258 @@
+#!/usr/bin/env python3
+"""
+Test script to verify membership cache and subscription checker behaviour
+"""
+
+import asyncio
+import gc
+import os
+import time
+from datetime import timedelta
+from pyrogram.errors import FloodWait
+
+# Keep imports from reaching the production database
+os.environ.setdefault("MONGO_DB_URI", "mongodb://localhost:27017")
+
+from config import Config
+from utils.cache import TTLCache, MembershipCache, PostMetadataCache
+from utils.check import SubscriptionChecker
+from utils.health import ChannelHealth, BROKEN, DEGRADED, HEALTHY
+from utils.singleflight import SingleFlight
+from utils.buttons import ButtonCoalescer
+from utils.counters import PostCounters
+from utils.verification import VoteVerifier
+from utils.throttle import TokenBucketLimiter, InFlightSet, FloodGate
+from utils.reconcile import VoteReconciler
+from utils.callback_data import decode_vote_callback, encode_vote_token, new_post_key, vote_callback_data, MAX_CALLBACK_BYTES
+
+
+class FakeMember:
+    def __init__(self, status):
+        self.status = status
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.title = str(chat_id)
+        self.username = str(chat_id).lstrip("@")
+        self.type = "channel"
+
+
+class FakeApp:
+    """Counts Telegram round-trips made by the checker"""
+
+    def __init__(self, not_member_chats=(), delay=0):
+        self.calls = 0
+        self.not_member_chats = set(not_member_chats)
+        self.delay = delay
+
+    async def get_chat(self, channel_username):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return FakeChat(channel_username)
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return FakeMember("left" if chat_id in self.not_member_chats else "member")
+
+
+def test_lru_eviction():
+    """Oldest untouched entry is evicted first"""
+    cache = TTLCache(max_size=2, default_ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.evictions == 1
+    print("✅ LRU eviction works")
+
+
+def test_ttl_expiry():
+    """Entries disappear after their TTL"""
+    cache = TTLCache(max_size=10, default_ttl=60)
+    cache.set("short", True, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("short") is None
+    assert cache.misses == 1
+    print("✅ TTL expiry works")
+
+
+def test_membership_ttls_and_invalidate():
+    """Positive and negative results use separate TTLs and can be invalidated"""
+    cache = MembershipCache(max_size=10, positive_ttl=60, negative_ttl=0.01)
+    cache.set_membership(1, "@Channel", True)
+    cache.set_membership(2, "@Channel", False)
+    time.sleep(0.02)
+
+    assert cache.get_membership(1, "channel") is True
+    assert cache.get_membership(2, "@Channel") is None
+
+    cache.set_membership(1, "@Other", True)
+    assert cache.invalidate_membership(1) == 2
+    assert cache.get_membership(1, "@Channel") is None
+    print("✅ Membership TTLs and invalidation work")
+
+
+def test_checker_uses_cache():
+    """Repeated taps on the same channel cost one membership lookup"""
+    app = FakeApp()
+    checker = SubscriptionChecker(app, None)
+    checker.cache = MembershipCache(max_size=10, positive_ttl=60, negative_ttl=60)
+
+    async def spam_taps():
+        for _ in range(5):
+            assert await checker.check_subscription(42, "@Channel")
+
+    asyncio.run(spam_taps())
+
+    assert app.calls == 2
+    assert checker.cache.hits == 4
+
+    # Concurrent uncached lookups share one call and are counted once
+    app.delay = 0.01
+    checker.telegram_calls = 0
+
+    async def concurrent_lookups():
+        await asyncio.gather(*(checker.get_chat_member("@Channel", 43) for _ in range(5)))
+
+    asyncio.run(concurrent_lookups())
+    assert checker.telegram_calls == 1
+    print(f"✅ Checker cache stats: {checker.cache.stats()}")
+
+
+def test_channel_resolver_resolve_refresh_invalidate():
+    """Peers come from memory, then Mongo, then Telegram; refresh and invalidate keep them honest"""
+    from pyrogram.errors import UsernameNotOccupied
+    from utils.resolver import ChannelResolver
+
+    class Peers:
+        def __init__(self):
+            self.docs = {"stored": {"_id": 1, "key": "stored", "chat_id": -5, "title": "Stored", "username": "stored", "resolved_at": 0}}
+
+        async def find_one(self, query):
+            return dict(self.docs[query["key"]]) if query["key"] in self.docs else None
+
+        async def update_one(self, query, update, upsert=False):
+            self.docs[query["key"]] = dict(update["$set"])
+
+        async def delete_one(self, query):
+            self.docs.pop(query["key"], None)
+
+    class RenamingApp(FakeApp):
+        gone = set()
+
+        async def get_chat(self, channel_username):
+            if channel_username in self.gone:
+                self.calls += 1
+                raise UsernameNotOccupied()
+            return await super().get_chat(channel_username)
+
+    peers = Peers()
+    db = type("FakeDB", (), {"db": {Config.CHANNEL_PEERS_COLLECTION: peers}})()
+    app = RenamingApp()
+    resolver = ChannelResolver()
+
+    async def run():
+        stored = await resolver.resolve(app, db, "@Stored")
+        fetched = await resolver.resolve(app, db, "@fresh")
+        again = await resolver.resolve(app, db, "@fresh")
+        assert stored["chat_id"] == -5 and app.calls == 1 and again is fetched
+        assert peers.docs["fresh"]["chat_id"] == "@fresh"
+
+        # Only the entry older than max_age is re-resolved; one that stopped resolving is dropped
+        app.gone.add("@stored")
+        assert await resolver.refresh(app, db, max_age=60) == 0
+        assert "stored" not in peers.docs and resolver.stats()["size"] == 1
+
+        assert await resolver.invalidate(db, "@FRESH")
+        assert not await resolver.invalidate(db, "@fresh")
+        assert peers.docs == {}
+        await resolver.resolve(app, db, "@fresh")
+
+    asyncio.run(run())
+    assert app.calls == 3
+    assert resolver.stats() == {"size": 1, "hits": 2, "misses": 2}
+    print(f"✅ Channel resolver stats: {resolver.stats()}")
+
+
+def test_channel_member_count_is_live():
+    """The member count isn't read from the resolver's stored record"""
+    class CountingApp(FakeApp):
+        members = 10
+
+        async def get_chat_members_count(self, chat_id):
+            self.calls += 1
+            return self.members
+
+    app = CountingApp()
+    checker = SubscriptionChecker(app, None)
+
+    async def run():
+        first = await checker.get_channel_member_count("@counted")
+        app.members = 12
+        return first, await checker.get_channel_member_count("@counted")
+
+    assert asyncio.run(run()) == (10, 12)
+    print("✅ Member count fetched live")
+
+
+def test_check_all_concurrent_fail_fast():
+    """Concurrent checks keep the result shape and stop early on a missing channel"""
+    app = FakeApp(not_member_chats={"@missing"}, delay=0.05)
+    checker = SubscriptionChecker(app, None)
+    checker.cache = MembershipCache(max_size=10, positive_ttl=60, negative_ttl=60)
+
+    started = time.monotonic()
+    status = asyncio.run(checker.check_all_subscriptions(7, ["@a", "@b", "@missing"]))
+    elapsed = time.monotonic() - started
+
+    assert status["all_subscribed"] is False
+    assert status["missing_channels"] == ["@missing"]
+    assert set(status["subscription_results"]) == {"@a", "@b", "@missing"}
+    assert elapsed < 0.25
+
+    checker.cache.clear()
+    app.not_member_chats = {"@a"}
+    app.delay = 0
+    status = asyncio.run(checker.check_all_subscriptions(8, ["@a"], fail_fast=True))
+    assert status["missing_channels"] == ["@a"]
+
+    # Several channels with fail_fast: the slow checks are cancelled, and a
+    # raised FloodWait leaves no sibling exception unretrieved
+    class SlowApp(FakeApp):
+        async def get_chat_member(self, chat_id, user_id):
+            self.calls += 1
+            if chat_id.startswith("@flood"):
+                raise FloodWait(x=5)
+            await asyncio.sleep(0.01 if chat_id in self.not_member_chats else 0.5)
+            return FakeMember("left" if chat_id in self.not_member_chats else "member")
+
+    unretrieved = []
+
+    async def fail_fast(channels):
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        checker.app = SlowApp(not_member_chats={"@missing"})
+        checker.cache.clear()
+        started = time.monotonic()
+        try:
+            return await checker.check_all_subscriptions(9, channels, fail_fast=True), time.monotonic() - started
+        finally:
+            gc.collect()
+
+    status, fast_elapsed = asyncio.run(fail_fast(["@slow1", "@missing", "@slow2"]))
+    assert status["missing_channels"] == ["@missing"]
+    assert set(status["subscription_results"]) == {"@missing"}
+    assert fast_elapsed < 0.25
+
+    checker.flood_gate = FloodGate(rate=0)
+    try:
+        asyncio.run(fail_fast(["@slow1", "@flood1", "@flood2"]))
+        assert False, "FloodWait should reach the sweep"
+    except FloodWait:
+        pass
+    finally:
+        checker.flood_gate = None
+    gc.collect()
+    assert unretrieved == []
+    print(f"✅ Concurrent check finished in {elapsed:.3f}s, fail-fast in {fast_elapsed:.3f}s")
+
+
+def test_membership_handler_removes_votes_on_leave():
+    """A leave updates the cached membership and removes the voter's votes in that channel"""
+    from types import SimpleNamespace
+    from handlers.membership import MembershipHandler
+    removed = []
+
+    class UserVotes:
+        async def distinct(self, field, query):
+            return ["@Chan", "@other", "@Support"]
+
+    class Scheduler:
+        async def remove_user_votes(self, user_id, channel_username, votes=None):
+            removed.append((user_id, channel_username))
+            return 0
+
+    def update(username, user_id, old, new):
+        return SimpleNamespace(
+            chat=SimpleNamespace(id=-100, username=username),
+            old_chat_member=SimpleNamespace(status=old, user=SimpleNamespace(id=user_id)),
+            new_chat_member=SimpleNamespace(status=new, user=SimpleNamespace(id=user_id))
+        )
+
+    db = type("FakeDB", (), {"db": {"user_votes": UserVotes()}})()
+    handler = MembershipHandler(FakeApp(), db, Scheduler())
+    handler.cache = MembershipCache(max_size=10, positive_ttl=60, negative_ttl=60)
+    handler.required_channels = {"support"}
+    handler.cache.set_membership(7, "@chan", True)
+
+    async def run():
+        await handler.process_member_update(update("chan", 7, "member", "left"))
+        # Joining removes nothing and is cached as well
+        await handler.process_member_update(update("chan", 8, "left", "member"))
+        # Leaving a required channel drops the voter's votes everywhere
+        await handler.process_member_update(update("support", 9, "ChatMemberStatus.MEMBER", "ChatMemberStatus.BANNED"))
+
+    asyncio.run(run())
+
+    assert handler.cache.get_membership(7, "@chan") is False
+    assert handler.cache.get_membership(8, "@chan") is True
+    assert removed == [(7, "@Chan"), (9, "@Chan"), (9, "@other"), (9, "@Support")]
+    print(f"✅ Membership handler removed votes in {len(removed)} channels")
+
+
+def test_bot_identity_and_admin_cache():
+    """get_me runs once; the bot's admin status is cached per chat until invalidated"""
+    from types import SimpleNamespace
+    from handlers.membership import MembershipHandler
+    from utils.cache import bot_admin_cache
+    from utils.check import BotIdentity
+    import handlers.membership
+    import utils.check
+
+    class AdminApp(FakeApp):
+        get_me_calls = 0
+
+        async def get_me(self):
+            self.get_me_calls += 1
+            await asyncio.sleep(0)
+            return SimpleNamespace(id=999, username="vote_bot")
+
+        async def get_chat_member(self, chat_id, user_id):
+            self.calls += 1
+            return FakeMember("administrator")
+
+    app = AdminApp()
+    identity = BotIdentity()
+    original = utils.check.bot_identity
+    utils.check.bot_identity = handlers.membership.bot_identity = identity
+    checker = SubscriptionChecker(app, None)
+    bot_admin_cache.invalidate(-200)
+
+    async def run():
+        assert identity.id is None and identity.username == Config.BOT_USERNAME
+        me = await identity.get(app)
+        assert await identity.get(app) is me and identity.id == 999
+
+        first = await checker.check_bot_admin_status(-200)
+        assert await checker.check_bot_admin_status(-200) is first and app.calls == 1
+
+        # The bot's own chat-member update drops the cached status
+        await MembershipHandler(app, None, None).process_member_update(SimpleNamespace(
+            chat=SimpleNamespace(id=-200, username="chan"),
+            old_chat_member=None,
+            new_chat_member=SimpleNamespace(status="member", user=SimpleNamespace(id=999))
+        ))
+        assert -200 not in bot_admin_cache
+        return first, await checker.check_bot_admin_status(-200)
+
+    try:
+        first, refetched = asyncio.run(run())
+    finally:
+        utils.check.bot_identity = handlers.membership.bot_identity = original
+        bot_admin_cache.invalidate(-200)
+
+    assert first["is_admin"] and refetched["is_admin"]
+    assert app.get_me_calls == 1 and app.calls == 2
+    print("✅ Bot identity fetched once, admin cache invalidated on the bot's own update")
+
+
+def test_channel_health_backoff():
+    """Channels go degraded, then broken, and let one probe through after backoff"""
+    health = ChannelHealth(broken_after=2, base_backoff=0.05, max_backoff=1)
+    error = Exception("CHAT_ADMIN_REQUIRED")
+
+    assert health.record_failure("@dead", error, verdict=True) == DEGRADED
+    assert not health.should_skip("@dead")
+    assert health.record_failure("@dead", error, verdict=True) == BROKEN
+    assert health.should_skip("@dead")
+    assert health.verdict("@dead") is True
+
+    time.sleep(0.06)
+    assert not health.should_skip("@dead")  # probe
+    assert health.should_skip("@dead")  # others keep skipping
+
+    health.record_success("@dead")
+    assert health.get_state("@dead") == HEALTHY
+    assert health.snapshot() == []
+    print("✅ Channel health state machine works")
+
+
+def test_singleflight_coalesces():
+    """Concurrent identical lookups share one call"""
+    flight = SingleFlight()
+    app = FakeApp(delay=0.02)
+
+    async def burst():
+        return await asyncio.gather(*(
+            flight.do(("get_chat", "@viral"), lambda: app.get_chat("@viral"))
+            for _ in range(20)
+        ))
+
+    chats = asyncio.run(burst())
+
+    assert app.calls == 1
+    assert flight.suppressed == 19
+    assert all(chat is chats[0] for chat in chats)
+    print(f"✅ Single-flight stats: {flight.stats()}")
+
+
+def test_singleflight_leader_cancellation():
+    """A caller timing out doesn't cancel the lookup others are waiting on"""
+    flight = SingleFlight()
+    app = FakeApp(delay=0.1)
+
+    async def run():
+        leader = asyncio.ensure_future(asyncio.wait_for(
+            flight.do(("get_chat", "@slow"), lambda: app.get_chat("@slow")), 0.02
+        ))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do(("get_chat", "@slow"), lambda: app.get_chat("@slow")))
+        leader_result = await asyncio.gather(leader, return_exceptions=True)
+        return leader_result[0], await waiter
+
+    leader_error, chat = asyncio.run(run())
+
+    assert isinstance(leader_error, asyncio.TimeoutError)
+    assert chat.id == "@slow"
+    assert app.calls == 1
+    assert flight.stats()["inflight"] == 0
+    print("✅ Single-flight: a timed out leader leaves the shared call running")
+
+
+def test_button_coalescer():
+    """Taps on one post collapse into few edits showing the latest count"""
+    coalescer = ButtonCoalescer(interval=0.05)
+    edits = []
+
+    class EditApp:
+        async def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+            edits.append(reply_markup.inline_keyboard[0][0].text)
+
+    async def taps():
+        app = EditApp()
+        for count in range(1, 11):
+            coalescer.schedule(app, "@hot", 7, "v1:abc", count)
+            await asyncio.sleep(0.01)
+        await coalescer.flush_all()
+        # Same count again is not re-sent
+        coalescer.schedule(app, "@hot", 7, "v1:abc", 10)
+        await coalescer.flush_all()
+
+    asyncio.run(taps())
+
+    assert len(edits) < 5
+    assert edits[-1].endswith("(10)")
+    assert coalescer.unchanged == 1
+    print(f"✅ Button coalescer stats: {coalescer.stats()}")
+
+
+def test_post_counters_write_behind():
+    """Taps only touch memory; one bulk_write persists the summed delta"""
+    writes = []
+
+    class Participants:
+        async def find_one(self, query, projection=None):
+            return {"_id": 1, "post_vote_count": 5, "channel_message_id": 7}
+
+        async def bulk_write(self, updates, ordered=True):
+            writes.append(updates)
+
+    db = type("FakeDB", (), {"db": {"participants": Participants()}})()
+    counters = PostCounters(flush_interval_ms=10, idle_ttl=60)
+
+    async def taps():
+        for _ in range(20):
+            participant_data = await counters.increment(db, "1_2")
+        flushed = await counters.flush(db)
+        return participant_data, flushed
+
+    participant_data, flushed = asyncio.run(taps())
+
+    assert participant_data["post_vote_count"] == 25
+    assert participant_data["channel_message_id"] == 7
+    assert flushed == 1
+    assert len(writes) == 1 and writes[0][0]._doc == {"$inc": {"post_vote_count": 20}}
+
+    # user_votes of 1_2 as a recount sees them
+    votes = ["old"] * 40
+
+    async def tap(vote):
+        async with counters.vote_write():
+            votes.append(vote)
+            await asyncio.sleep(0)
+            await counters.increment(db, "1_2")
+
+    # A tap half done when the recount starts finishes first and is counted;
+    # one between the snapshot and the count waits, so it is added on top once
+    async def recount():
+        started = asyncio.ensure_future(tap("before"))
+        await asyncio.sleep(0)
+        async with counters.counting() as since:
+            late = asyncio.ensure_future(tap("during"))
+            await asyncio.sleep(0.01)
+            count = len(votes)
+        await late
+        await counters.increment(db, "1_2", -1)
+        await counters.increment(db, "1_2")
+        async with counters.write_lock:
+            counters.set_count("1_2", count, since)
+        await counters.flush(db)
+        return started.done(), count
+
+    assert asyncio.run(recount()) == (True, 41)
+    assert counters.get_count("1_2") == 42 == len(votes)
+    assert writes[-1][0]._doc == {"$inc": {"post_vote_count": 1}}
+    print(f"✅ Post counters stats: {counters.stats()}")
+
+
+def test_roster_complete_only_when_count_is_stable():
+    """A missing id means "left" only if nobody joined or left while the roster was paged"""
+    from types import SimpleNamespace
+    from utils.roster import build_roster
+
+    class RosterApp(FakeApp):
+        def __init__(self, counts):
+            super().__init__()
+            self.counts = list(counts)
+
+        async def get_chat_members_count(self, chat_id):
+            return self.counts.pop(0)
+
+        async def iter_chat_members(self, chat_id):
+            for user_id in (1, 2, 3):
+                yield SimpleNamespace(user=SimpleNamespace(id=user_id))
+
+    async def run():
+        stable = await build_roster(RosterApp([3, 3]), -1, "@chan", 100, 1000)
+        # Member 4 left mid-paging and member 3 joined: three ids, but not everyone
+        churned = await build_roster(RosterApp([3, 4]), -1, "@chan", 100, 1000)
+        return stable, churned
+
+    stable, churned = asyncio.run(run())
+
+    assert stable.complete and stable.lookup(4) is False and stable.lookup(2) is True
+    assert not churned.complete and churned.lookup(4) is None and churned.lookup(2) is True
+    print("✅ Roster snapshots trust missing ids only when the member count held")
+
+
+def test_callback_data_formats():
+    """v1 tokens stay short and legacy buttons still decode"""
+    post_key = new_post_key()
+    token = encode_vote_token(post_key)
+    assert len(token.encode()) <= 14 < MAX_CALLBACK_BYTES
+    assert decode_vote_callback(token) == {"version": 1, "post_key": post_key}
+
+    legacy = decode_vote_callback("channel_vote_my_cool_channel_7840521426_1751953634004009")
+    assert legacy["channel_username"] == "@my_cool_channel"
+    assert legacy["participant_user_id"] == 7840521426
+    assert legacy["unique_post_id"] == "7840521426_1751953634004009"
+
+    assert vote_callback_data("@chan", "1_2") == "channel_vote_chan_1_2"
+    assert decode_vote_callback("channel_vote_chan_12") is None
+    assert decode_vote_callback("v1:bad!") is None
+    print("✅ Callback data encoding works")
+
+
+def test_optimistic_vote_verification():
+    """Provisional votes are confirmed or rolled back by the worker pool"""
+
+    class VoteDB:
+        db = None
+
+        def __init__(self):
+            self.confirmed, self.rolled_back = [], []
+
+        async def get_provisional_votes(self):
+            return []
+
+        async def confirm_vote(self, voter_id, unique_post_id):
+            self.confirmed.append(voter_id)
+
+        async def rollback_vote(self, voter_id, unique_post_id):
+            self.rolled_back.append(voter_id)
+            return {"post_vote_count": 0}
+
+    class FlakyApp(FakeApp):
+        async def get_chat_member(self, chat_id, user_id):
+            if chat_id == "@flaky_votes":
+                raise FloodWait(x=30)
+            return await super().get_chat_member(chat_id, user_id)
+
+    async def run():
+        db = VoteDB()
+        verifier = VoteVerifier(FlakyApp(not_member_chats={"@private_votes"}), db, workers=2, queue_size=10)
+        verifier.checker.cache = MembershipCache(max_size=10, positive_ttl=60, negative_ttl=60)
+        await verifier.start()
+        await verifier.submit({"voter_id": 1, "unique_post_id": "1_1", "channel_username": "@open_votes"})
+        await verifier.submit({"voter_id": 2, "unique_post_id": "1_2", "channel_username": "@private_votes"})
+        await verifier.submit({"voter_id": 3, "unique_post_id": "1_3", "channel_username": "@flaky_votes"})
+        await verifier._queue.join()
+        stats = verifier.stats()
+        await verifier.stop()
+        return db, stats
+
+    db, stats = asyncio.run(run())
+
+    assert db.confirmed == [1]
+    # A FloodWait is no answer about the user: the vote stays provisional for a retry
+    assert db.rolled_back == [2]
+    assert stats["provisional"] == 1 and stats["retried"] == 1
+    assert stats["confirmed"] == 1 and stats["rolled_back"] == 1
+    print(f"✅ Vote verifier stats: {stats}")
+
+
+def test_verifier_requeues_backlog_in_background():
+    """A provisional backlog larger than the queue doesn't hold up start() and isn't verified inline"""
+
+    class BacklogDB:
+        db = None
+        confirmed = []
+
+        async def get_provisional_votes(self):
+            return [{"voter_id": voter_id, "unique_post_id": f"1_{voter_id}", "channel_username": "@open_votes"} for voter_id in range(5)]
+
+        async def confirm_vote(self, voter_id, unique_post_id):
+            self.confirmed.append(voter_id)
+
+    async def run():
+        db = BacklogDB()
+        verifier = VoteVerifier(FakeApp(delay=0.01), db, workers=1, queue_size=1)
+        verifier.checker.cache = MembershipCache(max_size=10, positive_ttl=60, negative_ttl=60)
+        await verifier.start()
+        started = verifier.verifications
+        while len(db.confirmed) < 5:
+            await asyncio.sleep(0.01)
+        stats = verifier.stats()
+        await verifier.stop()
+        return started, db.confirmed, stats
+
+    started, confirmed, stats = asyncio.run(run())
+
+    assert started == 0 and confirmed == [0, 1, 2, 3, 4]
+    assert stats["inline_verifications"] == 0 and stats["accepted"] == 5
+    print(f"✅ Verifier requeued {stats['accepted']} provisional votes in the background")
+
+
+def test_vote_throttle():
+    """Bursts beyond the bucket are refused and duplicates in flight are rejected"""
+    limiter = TokenBucketLimiter(rate=100, burst=3, max_size=2)
+    assert [limiter.allow(1) for _ in range(4)] == [True, True, True, False]
+    time.sleep(0.02)
+    assert limiter.allow(1)
+
+    limiter.allow(2)
+    limiter.allow(3)
+    assert len(limiter._buckets) == 2
+
+    inflight = InFlightSet()
+    assert inflight.claim((1, "v1:abc"))
+    assert not inflight.claim((1, "v1:abc"))
+    inflight.release((1, "v1:abc"))
+    assert inflight.claim((1, "v1:abc"))
+    print(f"✅ Vote throttle stats: {limiter.stats()} {inflight.stats()}")
+
+
+def test_post_metadata_cache():
+    """Published posts resolve by unique_post_id and by post key without a query"""
+    cache = PostMetadataCache(max_size=2, ttl=60)
+    cache.remember({
+        "unique_post_id": "5_1", "post_key": "abc", "channel_username": "@chan",
+        "channel_chat_id": "@chan", "channel_message_id": 9, "user_id": 5, "post_vote_count": 3
+    })
+    assert cache.get("5_1")["channel_message_id"] == 9
+    assert "post_vote_count" not in cache.get("5_1")
+    assert cache.get_by_post_key("abc")["unique_post_id"] == "5_1"
+    assert cache.get_by_post_key("missing") is None
+
+    cache.remember({"unique_post_id": "6_1", "channel_message_id": 10})
+    cache.remember({"unique_post_id": "7_1", "channel_message_id": 11})
+    assert cache.get_by_post_key("abc") is None
+    print(f"✅ Post metadata cache stats: {cache.stats()}")
+
+
+def test_flood_gate_pauses_all_workers():
+    """Calls are paced, and one FloodWait holds every waiting worker"""
+    async def run():
+        gate = FloodGate(rate=100)
+        started = time.monotonic()
+        for _ in range(5):
+            await gate.wait()
+        paced = time.monotonic() - started
+
+        gate.pause(0.05)
+        started = time.monotonic()
+        await asyncio.gather(*(gate.wait_open() for _ in range(3)))
+        return paced, time.monotonic() - started, gate.stats()
+
+    paced, paused, stats = asyncio.run(run())
+    assert paced >= 0.035
+    assert paused >= 0.045
+    assert stats["pauses"] == 1
+    print(f"✅ Flood gate stats: {stats}")
+
+
+def test_bulk_vote_removal():
+    """One delete_many and one bulk_write however many votes; events only for votes this call claimed"""
+    import utils.db
+    from utils.db import Database
+    calls = []
+    events = []
+
+    class Result:
+        def __init__(self, items=(), **fields):
+            self.items = list(items)
+            self.__dict__.update(fields)
+
+        async def to_list(self, length=None):
+            return self.items
+
+    class UserVotes:
+        votes = [{"_id": i, "unique_post_id": f"1_{i % 3}"} for i in range(50)]
+        # Removed by a concurrent remove_user_vote, which logged them itself
+        gone = {0, 1}
+        claims = {}
+
+        def find(self, query, projection=None):
+            calls.append("find")
+            if "removal" in query:
+                return Result([{"_id": vote_id} for vote_id, claim in self.claims.items() if claim == query["removal"]])
+            return Result(self.votes)
+
+        async def update_many(self, query, update):
+            calls.append("update_many")
+            claimed = [vote_id for vote_id in query["_id"]["$in"] if vote_id not in self.gone]
+            self.claims.update((vote_id, update["$set"]["removal"]) for vote_id in claimed)
+            return Result(modified_count=len(claimed))
+
+        async def delete_many(self, query):
+            calls.append("delete_many")
+            deleted = [vote_id for vote_id in query["_id"]["$in"] if self.claims.get(vote_id) == query["removal"]]
+            return Result(deleted_count=len(deleted))
+
+    class Participants:
+        async def bulk_write(self, updates, ordered=True):
+            calls.append(("bulk_write", sorted(update._doc["$inc"]["post_vote_count"] for update in updates)))
+
+        def find(self, query, projection=None):
+            return Result([{"unique_post_id": post_id, "post_vote_count": 100} for post_id in query["unique_post_id"]["$in"]])
+
+    class Events:
+        async def append_many(self, db, event_type, voter_id, unique_post_ids, channel_username=None):
+            events.extend(unique_post_ids)
+
+    db = Database()
+    db.db = {"user_votes": UserVotes(), "participants": Participants()}
+    original_events = utils.db.vote_events
+    original = Config.VOTE_EVENTS_ENABLED
+    utils.db.vote_events = Events()
+    Config.VOTE_EVENTS_ENABLED = True
+    try:
+        result = asyncio.run(db.remove_voter_votes(7, "@chan"))
+    finally:
+        Config.VOTE_EVENTS_ENABLED = original
+        utils.db.vote_events = original_events
+
+    assert result["removed"] == 48 and len(result["posts"]) == 3
+    # Claimed fewer than read, so the claimed ids are read back once
+    assert calls == ["find", "update_many", "find", "delete_many", ("bulk_write", [-16, -16, -16])]
+    assert len(events) == 48 and "1_0" in events
+    assert events.count("1_1") == 16
+    print(f"✅ Bulk removal: {result['removed']} votes across {len(result['posts'])} posts")
+
+
+def test_record_vote_counts_each_voter_once():
+    """A repeat tap records nothing, a missing post returns {}, a new vote bumps the counter once"""
+    from pymongo.errors import DuplicateKeyError
+    from utils.db import Database
+    from utils.counters import post_counters
+
+    class UserVotes:
+        keys = set()
+
+        async def update_one(self, query, update, upsert=False):
+            key = (query["voter_id"], query["unique_post_id"])
+            if query["voter_id"] == 3:
+                # Lost the race to a concurrent tap on the unique index
+                raise DuplicateKeyError("E11000")
+            if key in self.keys:
+                return type("Result", (), {"upserted_id": None})()
+            self.keys.add(key)
+            return type("Result", (), {"upserted_id": len(self.keys)})()
+
+    class Participants:
+        counts = {"1_1": 4}
+
+        async def find_one_and_update(self, query, update, projection=None, return_document=None):
+            if query["unique_post_id"] not in self.counts:
+                return None
+            self.counts[query["unique_post_id"]] += update["$inc"]["post_vote_count"]
+            return {"post_vote_count": self.counts[query["unique_post_id"]], "channel_message_id": 10}
+
+        async def find_one(self, query, projection=None):
+            if query["unique_post_id"] not in self.counts:
+                return None
+            return {"_id": 1, "post_vote_count": self.counts[query["unique_post_id"]], "channel_message_id": 10}
+
+    db = Database()
+    db.db = {"user_votes": UserVotes(), Config.PARTICIPANTS_COLLECTION: Participants()}
+
+    def vote(voter_id, unique_post_id="1_1"):
+        return db.record_vote({"voter_id": voter_id, "unique_post_id": unique_post_id, "channel_username": "@chan"})
+
+    async def run(write_behind):
+        Config.WRITE_BEHIND_COUNTERS = write_behind
+        return [await vote(1), await vote(1), await vote(3), await vote(2, "9_9")]
+
+    original = Config.WRITE_BEHIND_COUNTERS, Config.VOTE_EVENTS_ENABLED
+    Config.VOTE_EVENTS_ENABLED = False
+    try:
+        stored = asyncio.run(run(False))
+        UserVotes.keys = set()
+        in_memory = asyncio.run(run(True))
+        live_count = post_counters.get_count("1_1")
+    finally:
+        Config.WRITE_BEHIND_COUNTERS, Config.VOTE_EVENTS_ENABLED = original
+        post_counters._posts.pop("1_1", None)
+
+    assert stored == [{"post_vote_count": 5, "channel_message_id": 10}, None, None, {}]
+    assert in_memory[0]["post_vote_count"] == 6 and in_memory[1:] == [None, None, {}]
+    # Write-behind counts stay in memory until the flusher runs
+    assert live_count == 6 and Participants.counts["1_1"] == 5
+    print(f"✅ record_vote results: {stored}")
+
+
+def test_verification_ledger_due_times():
+    """Voters on top-ranked posts come due sooner than everyone else"""
+    from utils.ledger import VerificationLedger
+    writes = {}
+
+    pipelines = []
+    indexes = []
+
+    def evaluate(expression, doc):
+        if isinstance(expression, str) and expression.startswith("$"):
+            return doc.get(expression[1:])
+        if not isinstance(expression, dict):
+            return expression
+        operator, operands = next(iter(expression.items()))
+        if operator == "$literal":
+            return operands
+        values = [evaluate(operand, doc) for operand in operands]
+        if operator == "$ifNull":
+            return values[0] if values[0] is not None else values[1]
+        if operator == "$divide":
+            return values[0] / values[1]
+        return values[0] + timedelta(milliseconds=values[1])  # $add to a date
+
+    class Pairs:
+        async def update_one(self, query, update, upsert=False):
+            doc = writes.setdefault(query["voter_id"], {})
+            for stage in update:
+                doc.update({field: evaluate(expression, doc) for field, expression in stage["$set"].items()})
+
+        async def create_index(self, keys, **kwargs):
+            indexes.append(keys)
+
+    class UserVotes:
+        def aggregate(self, pipeline, allowDiskUse=False):
+            pipelines.append(pipeline)
+            return type("Cursor", (), {"to_list": lambda self, length=None: asyncio.sleep(0, [])})()
+
+    db = type("FakeDB", (), {"db": {Config.VOTER_VERIFICATION_COLLECTION: Pairs(), "user_votes": UserVotes()}})()
+    ledger = VerificationLedger(stale_after=3600, top_post_weight=3)
+
+    async def run():
+        await ledger.record(db, 1, "@chan", True)
+        await ledger.record(db, 2, "@chan", True, top_votes=2)
+        # A tap re-verifies voter 2 without knowing its rank: the weight stays
+        await ledger.record(db, 2, "@chan", True)
+        await ledger.seed(db, {"1_7"})
+
+    asyncio.run(run())
+
+    # The seed builds its unique index first and weights voters on top posts
+    assert indexes[0] == [("voter_id", 1), ("channel_username", 1)]
+    group, project = pipelines[0][1]["$group"], pipelines[0][2]["$project"]
+    assert group["top_votes"]["$sum"]["$cond"][0] == {"$in": ["$unique_post_id", ["1_7"]]}
+    assert project["weight"]["$cond"][1:] == [4, 1]
+
+    plain = (writes[1]["due_at"] - writes[1]["verified_at"]).total_seconds()
+    top = (writes[2]["due_at"] - writes[2]["verified_at"]).total_seconds()
+    assert plain == 3600 and top == 900 and writes[2]["weight"] == 4
+    assert ledger.recorded == 3
+    print(f"✅ Verification ledger: plain voters due after {plain:.0f}s, top-post voters after {top:.0f}s")
+
+
+def test_sweep_telemetry_deltas_and_trend():
+    """Sweep telemetry counts only what happened during the run"""
+    from utils.sweep import SweepTelemetry, SweepRuns
+    checker = type("Checker", (), {"cache_hits": 5, "telegram_calls": 40})()
+    gate = type("Gate", (), {"paused_seconds": 2.0})()
+
+    telemetry = SweepTelemetry("full", checker, gate)
+    checker.cache_hits += 3
+    checker.telegram_calls += 7
+    gate.paused_seconds += 1.5
+    telemetry.record_removal("@a", 2)
+    telemetry.record_removal("@b", 0)
+    telemetry.record_removal("@a", 1)
+    telemetry.record_error(asyncio.TimeoutError())
+    telemetry.record_error(asyncio.TimeoutError())
+    run = telemetry.to_dict()
+
+    assert run["cache_hits"] == 3 and run["telegram_calls"] == 7 and run["flood_wait_seconds"] == 1.5
+    assert run["votes_removed"] == 3 and run["removals_by_channel"] == [{"channel": "@a", "removed": 3}]
+    assert run["errors_by_class"] == {"TimeoutError": 2}
+
+    runs = [{"users_per_second": 20}] * 5 + [{"users_per_second": 10}] * 5
+    trend = SweepRuns.trend(runs)
+    assert trend["users_per_second"] == {"latest": 20, "previous": 10}
+    assert SweepRuns.trend(runs[:3])["users_per_second"]["previous"] is None
+    print(f"✅ Sweep telemetry: {run['telegram_calls']} calls, {run['cache_hits']} cache hits, trend {trend['users_per_second']}")
+
+
+def test_sweep_checkpoint_resume_and_retry():
+    """A sweep stops starting voters at its deadline, then resumes with the voters it owes"""
+    from utils.scheduler import VoteScheduler
+    checked, removed = [], []
+    answers = {3: False, 2: None}  # everyone else is subscribed
+
+    class Cursor:
+        def __init__(self, votes):
+            self.votes = votes
+
+        def sort(self, field, direction):
+            self.votes.sort(key=lambda vote: vote[field])
+            return self
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            for vote in self.votes:
+                yield vote
+
+        async def close(self):
+            pass
+
+    class UserVotes:
+        votes = [{"voter_id": voter_id, "unique_post_id": f"1_{voter_id}", "channel_username": "@chan"} for voter_id in range(1, 11)]
+
+        def matches(self, vote, query):
+            if "$or" in query:
+                return vote["voter_id"] > query["$or"][0]["voter_id"]["$gt"] or vote["voter_id"] in query["$or"][1]["voter_id"]["$in"]
+            return "voter_id" not in query or vote["voter_id"] > query["voter_id"]["$gt"]
+
+        def find(self, query, projection=None):
+            return Cursor([vote for vote in self.votes if self.matches(vote, query)])
+
+        async def count_documents(self, query):
+            return len(self.find(query).votes)
+
+    class Checkpoints:
+        docs = {}
+
+        async def find_one(self, query):
+            return self.docs.get(query["_id"])
+
+        async def update_one(self, query, update, upsert=False):
+            doc = self.docs.setdefault(query["_id"], {})
+            doc.update(update["$set"])
+            for field, amount in update.get("$inc", {}).items():
+                doc[field] = doc.get(field, 0) + amount
+
+    db = type("FakeDB", (), {"db": {"user_votes": UserVotes(), Config.SWEEP_CHECKPOINTS_COLLECTION: Checkpoints()}})()
+    scheduler = VoteScheduler(FakeApp(), db)
+
+    async def usable(channel_username):
+        return True
+
+    async def no_channels():
+        return []
+
+    async def no_roster(channel_username, voter_count):
+        return None
+
+    async def verify_voter(channel_username, user_id, roster, required_status, required_channels):
+        checked.append(user_id)
+        if user_id == 3:
+            # The deadline runs out while this voter is being checked
+            await asyncio.sleep(0.1)
+        return answers.get(user_id, True)
+
+    async def remove_user_votes(user_id, channel_username, votes=None):
+        removed.append(user_id)
+        return len(votes)
+
+    scheduler.channel_is_usable = usable
+    scheduler.get_required_channels = no_channels
+    scheduler.get_roster = no_roster
+    scheduler.verify_voter = verify_voter
+    scheduler.remove_user_votes = remove_user_votes
+
+    original = Config.SWEEP_CHUNK_SIZE, Config.SWEEP_CONCURRENCY
+    Config.SWEEP_CHUNK_SIZE, Config.SWEEP_CONCURRENCY = 4, 1
+    try:
+        first = asyncio.run(scheduler.check_vote_subscriptions({"channel_username": "@chan"}, deadline=time.monotonic() + 0.05))
+        checkpoint = dict(asyncio.run(scheduler.checkpoints.load("@chan")))
+        first_checked = list(checked)
+
+        checked.clear()
+        answers[2] = True
+        second = asyncio.run(scheduler.check_vote_subscriptions({"channel_username": "@chan"}))
+        finished = asyncio.run(scheduler.checkpoints.load("@chan"))
+    finally:
+        Config.SWEEP_CHUNK_SIZE, Config.SWEEP_CONCURRENCY = original
+
+    # Voter 4 was never started, voter 2 was unknown: both are owed a check
+    assert first_checked == [1, 2, 3] and first == 1 and removed == [3]
+    assert checkpoint["last_voter_id"] == 4 and checkpoint["retry_voter_ids"] == [2, 4]
+    assert checked == [2, 4, 5, 6, 7, 8, 9, 10] and second == 0
+    assert finished["last_voter_id"] is None and finished["retry_voter_ids"] == []
+    print(f"✅ Sweep paused at voter {checkpoint['last_voter_id']} and retried {checkpoint['retry_voter_ids']}")
+
+
+def test_vote_event_log_compaction_and_replay():
+    """Appended events replay to the live counts, and re-running a compaction is harmless"""
+    from bson import ObjectId
+    from pymongo.errors import BulkWriteError
+    from utils.events import VoteEventLog, CAST, REMOVE, COMPACTION_STATE_ID
+
+    def matches(doc, query):
+        for field, expected in query.items():
+            value = doc.get(field)
+            if not isinstance(expected, dict):
+                if value != expected:
+                    return False
+            elif ("$gt" in expected and not value > expected["$gt"]) or ("$lte" in expected and not value <= expected["$lte"]) \
+                    or ("$in" in expected and value not in expected["$in"]) or ("$ne" in expected and value == expected["$ne"]) \
+                    or ("$exists" in expected and (field in doc) != expected["$exists"]):
+                return False
+        return True
+
+    class Result:
+        def __init__(self, items):
+            self.items = items
+
+        async def to_list(self, length=None):
+            return self.items
+
+    class Collection:
+        def __init__(self):
+            self.docs = []
+            # Events get one ObjectId second each, starting well past the compaction lag
+            self.clock = int(time.time()) - 100
+
+        async def insert_one(self, doc):
+            self.clock += 1
+            self.docs.append(dict(doc, _id=doc.get("_id", ObjectId("%08x" % self.clock + "0" * 16))))
+
+        async def insert_many(self, docs, ordered=True):
+            for doc in docs:
+                await self.insert_one(doc)
+
+        async def find_one(self, query, sort=None):
+            docs = sorted(self.docs, key=lambda doc: doc[sort[0][0]], reverse=sort[0][1] < 0) if sort else self.docs
+            return next((doc for doc in docs if matches(doc, query)), None)
+
+        async def delete_many(self, query):
+            self.docs = [doc for doc in self.docs if not matches(doc, query)]
+
+        def find(self, query, projection=None):
+            return Result([doc for doc in self.docs if matches(doc, query)])
+
+        def aggregate(self, pipeline, allowDiskUse=False):
+            sums = {}
+            for doc in self.docs:
+                if matches(doc, pipeline[0]["$match"]):
+                    sums[doc["unique_post_id"]] = sums.get(doc["unique_post_id"], 0) + doc["delta"]
+            return Result([{"_id": post_id, "delta": delta} for post_id, delta in sums.items()])
+
+        async def update_one(self, query, update, upsert=False):
+            doc = await self.find_one(query)
+            if doc is None:
+                if not upsert:
+                    return
+                if "unique_post_id" in query and any(other.get("unique_post_id") == query["unique_post_id"] for other in self.docs):
+                    raise BulkWriteError({"writeErrors": [{"code": 11000}]})
+                doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+                self.docs.append(doc)
+            for field, amount in update.get("$inc", {}).items():
+                doc[field] = doc.get(field, 0) + amount
+            doc.update(update.get("$set", {}))
+            for field in update.get("$unset", {}):
+                doc.pop(field, None)
+
+        async def bulk_write(self, updates, ordered=True):
+            errors = []
+            for update in updates:
+                try:
+                    await self.update_one(update._filter, update._doc, update._upsert)
+                except BulkWriteError as e:
+                    errors.extend(e.details["writeErrors"])
+            if errors:
+                raise BulkWriteError({"writeErrors": errors})
+
+    db = type("FakeDB", (), {"db": {Config.VOTE_EVENTS_COLLECTION: Collection(), Config.VOTE_COUNTS_COLLECTION: Collection(), "user_votes": Collection()}})()
+    log = VoteEventLog(compaction_lag=50)
+    events, counts = db.db[Config.VOTE_EVENTS_COLLECTION], db.db[Config.VOTE_COUNTS_COLLECTION]
+    # Votes from before the log existed, plus a legacy vote seeding must skip
+    db.db["user_votes"].docs = [
+        {"voter_id": 9, "unique_post_id": "1_1", "channel_username": "@chan"},
+        {"voter_id": 8, "unique_post_id": "1_3", "channel_username": "@chan"},
+        {"voter_id": 7, "post_id": 3}
+    ]
+
+    async def run():
+        assert not await log.is_seeded(db)
+        # Logged by a run that never seeded: already part of user_votes, so superseded
+        await log.append(db, REMOVE, 8, "1_3", "@chan")
+        await log.compact(db)
+        assert await log.seed(db) == 2
+        assert await log.seed(db) == 0 and await log.is_seeded(db)
+
+        await log.append(db, CAST, 1, "1_1", "@chan")
+        await log.append_many(db, CAST, 2, ["1_1", "1_2"], "@chan")
+        await log.append_votes(db, REMOVE, [{"voter_id": 2, "unique_post_id": "1_2", "channel_username": "@chan"}])
+        assert await log.compact(db) == 3
+
+        # A compaction interrupted after its snapshots but before its watermark
+        state = await counts.find_one({"_id": COMPACTION_STATE_ID})
+        await counts.update_one({"_id": COMPACTION_STATE_ID}, {"$set": {"through": None, "pending": state["through"]}})
+        await log.compact(db)
+
+        # Written after the compaction's range end, so only the tail holds it
+        events.clock = int(time.time()) - 10
+        await log.append(db, REMOVE, 1, "1_1", "@chan")
+        return await log.replay(db, ["1_1", "1_2", "1_3"]), await log.replay(db, ["1_1", "1_2"], from_snapshots=False)
+
+    from_snapshots, full_log = asyncio.run(run())
+
+    assert from_snapshots == {"1_1": 2, "1_2": 0, "1_3": 1}
+    assert full_log == {"1_1": 2, "1_2": 0}
+    assert log.stats()["appended"] == 6
+    print(f"✅ Vote event log replays to {from_snapshots}")
+
+
+def test_reconcile_writes_only_changed_counts():
+    """One aggregation, one bulk_write with the drifted posts, buttons only for those"""
+    writes, scheduled = [], []
+
+    class Result:
+        def __init__(self, items):
+            self.items = items
+
+        async def to_list(self, length=None):
+            return self.items
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            for item in self.items:
+                yield item
+
+    votes = {"1_1": 3, "1_2": 1}
+    taps = []
+
+    async def tap():
+        async with post_counters.vote_write():
+            votes["1_2"] += 1
+            await post_counters.increment(None, "1_2")
+
+    class UserVotes:
+        def aggregate(self, pipeline, allowDiskUse=False):
+            # A live tap on 1_2 arrives while the reconcile is counting
+            taps.append(asyncio.ensure_future(tap()))
+            return Result([{"_id": post_id, "count": count} for post_id, count in votes.items()])
+
+    class Participants:
+        posts = [
+            {"_id": 1, "unique_post_id": "1_1", "post_vote_count": 3},
+            {"_id": 2, "unique_post_id": "1_2", "post_vote_count": 4},
+            {"_id": 3, "unique_post_id": "1_3", "post_vote_count": 2}
+        ]
+
+        async def count_documents(self, query):
+            await asyncio.sleep(0)
+            return len(self.posts)
+
+        def find(self, query, projection=None):
+            return Result(self.posts)
+
+        async def bulk_write(self, updates, ordered=True):
+            writes.extend(updates)
+
+    class ReconcileDB:
+        db = {"user_votes": UserVotes(), "participants": Participants()}
+
+        async def get_post_metadata(self, unique_post_id):
+            return {"channel_username": "@chan", "channel_message_id": 10, "post_key": None}
+
+    class Coalescer:
+        def schedule(self, app, channel_username, message_id, callback_data, count):
+            scheduled.append((callback_data, count))
+
+    import utils.reconcile
+    from utils.counters import post_counters
+    original = utils.reconcile.button_coalescer
+    utils.reconcile.button_coalescer = Coalescer()
+    post_counters._posts["1_2"] = {"count": 4, "delta": 0, "applied": 0, "dirty_since": None, "touched_at": time.time(), "metadata": {}}
+    try:
+        async def run():
+            report = await VoteReconciler(FakeApp(), ReconcileDB(), batch_size=1).reconcile("@chan")
+            await asyncio.gather(*taps)
+            return report
+
+        report = asyncio.run(run())
+        live = post_counters._posts["1_2"]
+    finally:
+        utils.reconcile.button_coalescer = original
+        post_counters._posts.pop("1_2", None)
+
+    assert [update._doc for update in writes] == [{"$set": {"post_vote_count": 1}}, {"$set": {"post_vote_count": 0}}]
+    # The tap waited for the count, survives the $set and is flushed again on top of it
+    assert votes["1_2"] == 2
+    assert live["count"] == 2 and live["delta"] == 1
+    assert scheduled == [("channel_vote_chan_1_2", 2), ("channel_vote_chan_1_3", 0)]
+    assert report["checked"] == 3 and report["changed"] == 2 and report["votes"] == 4
+    print(f"✅ Reconcile report: {report}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Membership Cache\n")
+    test_lru_eviction()
+    test_ttl_expiry()
+    test_membership_ttls_and_invalidate()
+    test_checker_uses_cache()
+    test_channel_resolver_resolve_refresh_invalidate()
+    test_channel_member_count_is_live()
+    test_check_all_concurrent_fail_fast()
+    test_membership_handler_removes_votes_on_leave()
+    test_bot_identity_and_admin_cache()
+    test_channel_health_backoff()
+    test_singleflight_coalesces()
+    test_singleflight_leader_cancellation()
+    test_button_coalescer()
+    test_post_counters_write_behind()
+    test_roster_complete_only_when_count_is_stable()
+    test_callback_data_formats()
+    test_optimistic_vote_verification()
+    test_verifier_requeues_backlog_in_background()
+    test_vote_throttle()
+    test_post_metadata_cache()
+    test_reconcile_writes_only_changed_counts()
+    test_flood_gate_pauses_all_workers()
+    test_bulk_vote_removal()
+    test_record_vote_counts_each_voter_once()
+    test_verification_ledger_due_times()
+    test_sweep_telemetry_deltas_and_trend()
+    test_sweep_checkpoint_resume_and_retry()
+    test_vote_event_log_compaction_and_replay()
+    print("\n✅ All tests passed!")
@@ -7,8 +7,8 @@ import asyncio
 from utils.db import Database
 from config import Config
 from pyrogram import Client
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-import time
+from utils.buttons import button_coalescer
+from utils.reconcile import VoteReconciler
 
 async def update_channel_buttons():
     """Update channel buttons with new vote counts"""
@@ -47,47 +47,15 @@ async def update_channel_buttons():
         channel_username = "@chanel1250kkkzza"
         print(f"Updating buttons for channel: {channel_username}")
         
-        # Get all participants with channel messages
-        participants = await db.db["participants"].find({
-            "channel_username": channel_username,
-            "channel_message_id": {"$exists": True, "$ne": None}
-        }).to_list(length=None)
+        # One aggregation recomputes every post's count; all buttons are queued
+        # because counts may already have been fixed outside the bot
+        reconciler = VoteReconciler(app, db)
+        report = await reconciler.reconcile(channel_username, refresh_all=True)
+        print(f"Fixed {report['changed']} counts, queued {report['buttons_queued']} of {report['posts']} buttons")
         
-        print(f"Found {len(participants)} participants with channel messages")
-        
-        for participant in participants:
-            unique_post_id = participant.get("unique_post_id")
-            message_id = participant.get("channel_message_id")
-            current_count = participant.get("post_vote_count", 0)
-            
-            if unique_post_id and message_id:
-                print(f"Updating button for post {unique_post_id}, message {message_id}, count {current_count}")
-                
-                try:
-                    # Create updated button
-                    emoji = "⚡"
-                    channel_name = channel_username[1:]  # Remove @ prefix
-                    updated_button = InlineKeyboardMarkup([
-                        [InlineKeyboardButton(f"{emoji} Vote for this participant ({current_count})", 
-                                            callback_data=f"channel_vote_{channel_name}_{unique_post_id}")]
-                    ])
-                    
-                    # Update the message
-                    await app.edit_message_reply_markup(
-                        chat_id=channel_username,
-                        message_id=message_id,
-                        reply_markup=updated_button
-                    )
-                    
-                    print(f"✓ Updated button for post {unique_post_id} with count {current_count}")
-                    
-                    # Small delay to avoid rate limiting
-                    await asyncio.sleep(0.5)
-                    
-                except Exception as e:
-                    print(f"✗ Error updating button for post {unique_post_id}: {e}")
-        
-        print("Channel button updates completed!")
+        # The coalescer paces the edits and skips messages that are already current
+        await button_coalescer.flush_all()
+        print(f"Channel button updates completed! {button_coalescer.stats()}")
         
     except Exception as e:
         print(f"Error during button updates: {e}")
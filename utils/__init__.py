@@ -2,7 +2,20 @@
 
 # Import all utility modules
 from . import db
+from . import cache
 from . import check
+from . import resolver
+from . import health
+from . import roster
+from . import singleflight
+from . import buttons
+from . import counters
+from . import verification
+from . import events
+from . import throttle
+from . import reconcile
+from . import sweep
+from . import ledger
 from . import keyboards
 from . import scheduler
 from . import debug
@@ -11,7 +24,20 @@ from . import mongo
 # Make utils available at package level
 __all__ = [
     'db',
+    'cache',
     'check',
+    'resolver',
+    'health',
+    'roster',
+    'singleflight',
+    'buttons',
+    'counters',
+    'verification',
+    'events',
+    'throttle',
+    'reconcile',
+    'sweep',
+    'ledger',
     'keyboards', 
     'scheduler',
     'debug',
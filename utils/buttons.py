@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Dict
+from pyrogram import Client
+from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config import Config
+from utils.cache import TTLCache, channel_key
+from utils.health import channel_health, is_channel_error
+
+
+def vote_button_markup(callback_data: str, count: int, emoji: str = "⚡") -> InlineKeyboardMarkup:
+    """Render the vote button of a participant post (see utils.callback_data)"""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{emoji} Vote for this participant ({count})", callback_data=callback_data)]
+    ])
+
+
+class ButtonCoalescer:
+    """Debounced vote-button edits, one pending update per (channel, message)
+
+    schedule() only stores the latest count. A message is edited at most once per
+    flush interval with whatever count is newest at that moment, and not at all
+    when that count is already what the button shows.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = Config.BUTTON_FLUSH_INTERVAL if interval is None else interval
+        self._pending = {}  # (channel key, message id) -> latest update
+        self._tasks = {}  # (channel key, message id) -> flush task
+        self._next_flush = TTLCache(Config.BUTTON_CACHE_SIZE, Config.BUTTON_CACHE_TTL)  # key -> earliest next edit
+        self._rendered = TTLCache(Config.BUTTON_CACHE_SIZE, Config.BUTTON_CACHE_TTL)
+        self.scheduled = 0
+        self.coalesced = 0
+        self.edits = 0
+        self.unchanged = 0
+        self.failures = 0
+
+    def schedule(self, app: Client, channel_username: str, message_id: int, callback_data: str, count: int):
+        """Queue a button update; the newest count wins"""
+        key = (channel_key(channel_username), message_id)
+        self.scheduled += 1
+        if key in self._pending:
+            self.coalesced += 1
+
+        self._pending[key] = {
+            "app": app,
+            "channel_username": channel_username,
+            "message_id": message_id,
+            "callback_data": callback_data,
+            "count": count
+        }
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        """Edit a message whenever its interval allows until nothing is pending"""
+        try:
+            while key in self._pending:
+                delay = (self._next_flush.get(key) or 0) - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                update = self._pending.pop(key, None)
+                if update:
+                    await self._edit(key, update)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _edit(self, key, update: Dict):
+        channel_username = update["channel_username"]
+        if self._rendered.get(key) == update["count"]:
+            self.unchanged += 1
+            return
+        if channel_health.is_broken(channel_username):
+            return
+
+        try:
+            await update["app"].edit_message_reply_markup(
+                chat_id=channel_username,
+                message_id=update["message_id"],
+                reply_markup=vote_button_markup(update["callback_data"], update["count"])
+            )
+            self.edits += 1
+            self._rendered.set(key, update["count"])
+        except MessageNotModified:
+            self.unchanged += 1
+            self._rendered.set(key, update["count"])
+        except FloodWait as e:
+            # Keep the update unless a newer one arrived while waiting
+            print(f"FloodWait {e.x}s editing vote button {channel_username}/{update['message_id']}")
+            self._next_flush.set(key, time.time() + e.x + self.interval)
+            self._pending.setdefault(key, update)
+            return
+        except Exception as e:
+            self.failures += 1
+            if is_channel_error(e):
+                channel_health.record_failure(channel_username, e)
+            print(f"Error updating vote button {channel_username}/{update['message_id']}: {e}")
+
+        self._next_flush.set(key, time.time() + self.interval)
+
+    async def flush_all(self):
+        """Wait for every pending update to be written (scripts and shutdown)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        """Get coalescer counters for monitoring"""
+        return {
+            "pending": len(self._pending),
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "edits": self.edits,
+            "unchanged": self.unchanged,
+            "failures": self.failures
+        }
+
+
+# Shared by the vote handler, the scheduler and maintenance scripts
+button_coalescer = ButtonCoalescer()
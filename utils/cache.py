@@ -0,0 +1,157 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+from config import Config
+
+_MISSING = object()
+
+
+def channel_key(channel) -> Any:
+    """Normalize a channel reference so '@Name', 'name' and 'NAME' share one key"""
+    if isinstance(channel, str):
+        return channel.lstrip('@').lower()
+    return channel
+
+
+class TTLCache:
+    """Size-bounded LRU cache where every entry expires after its own TTL"""
+
+    def __init__(self, max_size: int, default_ttl: float):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry and mark it as recently used"""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store an entry, evicting the least recently used ones when full"""
+        ttl = self.default_ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Drop a single entry"""
+        return self._data.pop(key, _MISSING) is not _MISSING
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches the predicate"""
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        """Drop all entries"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key, _MISSING)
+        return entry is not _MISSING and entry[0] > time.monotonic()
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class MembershipCache(TTLCache):
+    """Per-(user, channel) subscription results with separate positive/negative TTLs"""
+
+    def __init__(self, max_size: int = None, positive_ttl: float = None, negative_ttl: float = None):
+        super().__init__(
+            max_size if max_size is not None else Config.MEMBERSHIP_CACHE_SIZE,
+            positive_ttl if positive_ttl is not None else Config.MEMBERSHIP_POSITIVE_TTL
+        )
+        self.positive_ttl = self.default_ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else Config.MEMBERSHIP_NEGATIVE_TTL
+
+    def get_membership(self, user_id: int, channel) -> Optional[bool]:
+        """Return the cached subscription result, or None when unknown"""
+        return self.get((user_id, channel_key(channel)))
+
+    def set_membership(self, user_id: int, channel, is_member: bool):
+        """Cache a definitive subscription result"""
+        ttl = self.positive_ttl if is_member else self.negative_ttl
+        self.set((user_id, channel_key(channel)), is_member, ttl)
+
+    def invalidate_membership(self, user_id: int, channel=None) -> int:
+        """Forget one user's result for a channel, or for every channel when none is given"""
+        if channel is not None:
+            return int(self.invalidate((user_id, channel_key(channel))))
+        return self.invalidate_where(lambda key: key[0] == user_id)
+
+    def invalidate_channel(self, channel) -> int:
+        """Forget every cached result for a channel"""
+        channel = channel_key(channel)
+        return self.invalidate_where(lambda key: key[1] == channel)
+
+
+class PostMetadataCache(TTLCache):
+    """unique_post_id -> where a participant post lives, which never changes after posting
+
+    A second index maps v1 post keys to unique_post_id so vote buttons resolve
+    without touching the participants collection.
+    """
+
+    FIELDS = ("unique_post_id", "post_key", "channel_username", "channel_chat_id", "channel_message_id", "user_id")
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        super().__init__(
+            max_size if max_size is not None else Config.POST_METADATA_CACHE_SIZE,
+            ttl if ttl is not None else Config.POST_METADATA_CACHE_TTL
+        )
+        self._post_keys = TTLCache(self.max_size, self.default_ttl)
+
+    def remember(self, participant_data: Dict) -> Dict:
+        """Cache the metadata fields of a participant document and return them"""
+        metadata = {field: participant_data.get(field) for field in self.FIELDS}
+        self.set(metadata["unique_post_id"], metadata)
+        if metadata["post_key"]:
+            self._post_keys.set(metadata["post_key"], metadata["unique_post_id"])
+        return metadata
+
+    def get_by_post_key(self, post_key: str) -> Optional[Dict]:
+        unique_post_id = self._post_keys.get(post_key)
+        return self.get(unique_post_id) if unique_post_id is not None else None
+
+
+# Shared by every SubscriptionChecker so handlers and the scheduler see the same entries
+membership_cache = MembershipCache()
+
+# Bot's own admin status per chat id, refreshed on the bot's chat-member updates
+bot_admin_cache = TTLCache(Config.BOT_ADMIN_CACHE_SIZE, Config.BOT_ADMIN_CACHE_TTL)
+
+# Participant post metadata, filled when a post is published and on first lookup
+post_metadata_cache = PostMetadataCache()
@@ -0,0 +1,75 @@
+import re
+import secrets
+from typing import Dict, Optional
+
+# Telegram rejects callback data longer than this many bytes
+MAX_CALLBACK_BYTES = 64
+
+# v1 tokens: "v1:" + base62 post key stored (indexed) on the participant document
+VOTE_TOKEN_PREFIX = "v1:"
+
+# Legacy buttons: "channel_vote_{channel}_{user_id}_{micros}"
+LEGACY_VOTE_PREFIX = "channel_vote_"
+
+# Matches both formats, for the callback query filter
+VOTE_CALLBACK_PATTERN = r"^(v1:|channel_vote_)"
+
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+POST_KEY_RE = re.compile(r"[0-9A-Za-z]{1,11}")
+
+
+def base62_encode(number: int) -> str:
+    """Encode a non-negative integer in base62"""
+    if number == 0:
+        return BASE62[0]
+    digits = []
+    while number:
+        number, remainder = divmod(number, 62)
+        digits.append(BASE62[remainder])
+    return "".join(reversed(digits))
+
+
+def new_post_key() -> str:
+    """Random 60-bit post key, at most 11 base62 characters"""
+    return base62_encode(secrets.randbits(60))
+
+
+def encode_vote_token(post_key: str) -> str:
+    """Build the callback data of a vote button"""
+    return f"{VOTE_TOKEN_PREFIX}{post_key}"
+
+
+def vote_callback_data(channel_username: str, unique_post_id, post_key: str = None) -> str:
+    """Callback data for a participant post - the v1 token when the post has a key"""
+    if post_key:
+        return encode_vote_token(post_key)
+    channel_name = channel_username[1:] if channel_username.startswith("@") else channel_username
+    return f"{LEGACY_VOTE_PREFIX}{channel_name}_{unique_post_id}"
+
+
+def decode_vote_callback(data: str) -> Optional[Dict]:
+    """Parse vote button callback data in either format
+
+    Returns {"version": 1, "post_key"} for v1 tokens,
+    {"version": 0, "channel_username", "participant_user_id", "unique_post_id"} for
+    legacy buttons, or None when the data is not a valid vote button.
+    """
+    if data.startswith(VOTE_TOKEN_PREFIX):
+        post_key = data[len(VOTE_TOKEN_PREFIX):]
+        if not POST_KEY_RE.fullmatch(post_key):
+            return None
+        return {"version": 1, "post_key": post_key}
+
+    if data.startswith(LEGACY_VOTE_PREFIX):
+        # Channel names may contain underscores; the last two parts are always numeric
+        parts = data[len(LEGACY_VOTE_PREFIX):].rsplit("_", 2)
+        if len(parts) != 3 or not parts[0] or not parts[1].isdigit() or not parts[2].isdigit():
+            return None
+        return {
+            "version": 0,
+            "channel_username": f"@{parts[0]}",
+            "participant_user_id": int(parts[1]),
+            "unique_post_id": f"{parts[1]}_{parts[2]}"
+        }
+
+    return None
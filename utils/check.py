@@ -1,82 +1,257 @@
+import asyncio
 from pyrogram import Client
-from pyrogram.errors import UserNotParticipant, PeerIdInvalid, ChannelPrivate
-from typing import List, Dict
+from pyrogram.errors import UserNotParticipant, PeerIdInvalid, ChannelPrivate, FloodWait
+from typing import List, Dict, Optional
+from config import Config
+from utils.cache import membership_cache, bot_admin_cache
+from utils.resolver import channel_resolver, STALE_PEER_ERRORS
+from utils.health import channel_health, is_channel_error
+from utils.singleflight import telegram_flight
+
+class BotIdentity:
+    """The bot's own User, fetched once with get_me() and shared by every handler"""
+    
+    def __init__(self):
+        self.me = None
+    
+    async def get(self, app: Client):
+        """Get the bot's User, calling get_me() only the first time"""
+        if self.me is None:
+            self.me = await app.get_me()
+        return self.me
+    
+    @property
+    def id(self):
+        return self.me.id if self.me else None
+    
+    @property
+    def username(self):
+        return self.me.username if self.me else Config.BOT_USERNAME
+
+# Resolved at startup by VoteBot
+bot_identity = BotIdentity()
 
 class SubscriptionChecker:
     def __init__(self, app: Client, db):
         self.app = app
         self.db = db
+        self.cache = membership_cache
+        self._semaphore = asyncio.Semaphore(Config.SUBSCRIPTION_CHECK_CONCURRENCY)
+        self.flood_gate = None  # FloodGate shared by the scheduler's sweep workers
+        self.call_timeout = None  # seconds per get_chat_member, after any flood pause
+        self.timeouts = 0
+        self.cache_hits = 0
+        self.telegram_calls = 0
     
-    async def check_subscription(self, user_id: int, channel_username: str) -> bool:
-        """Check if user is subscribed to a specific channel"""
+    async def check_subscription(self, user_id: int, channel_username: str, use_cache: bool = True) -> bool:
+        """Check if user is subscribed to a specific channel (unknown counts as not subscribed)"""
+        return bool(await self.subscription_state(user_id, channel_username, use_cache))
+    
+    async def subscription_state(self, user_id: int, channel_username: str, use_cache: bool = True) -> Optional[bool]:
+        """True/False when Telegram answered for the user, None when it couldn't be told
+        
+        FloodWaits, errors and channels that can't be checked say nothing about the
+        user, so callers that undo votes only act on a definite False.
+        """
+        if use_cache:
+            cached = self.cache.get_membership(user_id, channel_username)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+        
+        # Don't repeat a call that is known to fail for every user
+        if channel_health.should_skip(channel_username):
+            return True if channel_health.verdict(channel_username) else None
+        
         try:
-            # Get chat information
-            chat = await self.app.get_chat(channel_username)
+            # Resolve channel to its numeric chat id
+            chat = await self.resolve_channel(channel_username)
             
-            # Check user membership
-            member = await self.app.get_chat_member(chat.id, user_id)
+            # Check user membership - concurrent taps share one lookup
+            member = await self.get_chat_member(chat["chat_id"], user_id)
             
             # Valid subscription statuses - convert enum to string
             status_str = str(member.status).split('.')[-1].lower()
             valid_statuses = ["member", "administrator", "creator", "owner"]
             
-            return status_str in valid_statuses
+            is_subscribed = status_str in valid_statuses
+            self.cache.set_membership(user_id, channel_username, is_subscribed)
+            channel_health.record_success(channel_username)
+            return is_subscribed
             
         except UserNotParticipant:
+            self.cache.set_membership(user_id, channel_username, False)
+            channel_health.record_success(channel_username)
             return False
-        except (PeerIdInvalid, ChannelPrivate):
+        except STALE_PEER_ERRORS as e:
+            # Stored chat id is no longer valid - resolve again next time
+            await channel_resolver.invalidate(self.db, channel_username)
+            channel_health.record_failure(channel_username, e, verdict=False)
+            return None
+        except ChannelPrivate as e:
             # Channel not accessible or doesn't exist
-            return False
+            channel_health.record_failure(channel_username, e, verdict=False)
+            return None
+        except FloodWait as e:
+            # A rate limit says nothing about the user - the sweep pauses its workers and retries
+            if self.flood_gate is not None:
+                self.flood_gate.pause(e.x)
+                raise
+            print(f"Flood wait of {e.x}s checking {channel_username}")
+            return None
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            print(f"Timed out checking user {user_id} in {channel_username}")
+            return None
         except Exception as e:
             # If we get CHAT_ADMIN_REQUIRED, we'll assume user is subscribed
             # This happens when bot is not admin in the channel
             if "CHAT_ADMIN_REQUIRED" in str(e):
                 print(f"Warning: Cannot verify subscription for {channel_username} - bot needs admin access")
+                channel_health.record_failure(channel_username, e, verdict=True)
                 return True  # Assume subscribed to avoid blocking users
             print(f"Subscription check error for {channel_username}: {e}")
+            return None
+    
+    async def probe_channel(self, channel_username: str) -> bool:
+        """Make one real call to see whether a broken channel has recovered"""
+        try:
+            chat = await self.resolve_channel(channel_username)
+            bot_admin_cache.invalidate(chat["chat_id"])
+            bot_status = await self.check_bot_admin_status(chat["chat_id"])
+            
+            if bot_status["is_admin"]:
+                channel_health.record_success(channel_username)
+                return True
+            
+            # Bot is reachable but can't check members without admin rights
+            channel_health.record_failure(channel_username, bot_status.get("error", "CHAT_ADMIN_REQUIRED"), verdict=True)
+            return False
+            
+        except Exception as e:
+            if is_channel_error(e):
+                channel_health.record_failure(channel_username, e, verdict=channel_health.verdict(channel_username))
+            else:
+                print(f"Channel probe error for {channel_username}: {e}")
             return False
     
-    async def check_all_subscriptions(self, user_id: int, channels: List[str]) -> Dict:
-        """Check subscription to multiple channels"""
-        subscription_results = {}
-        missing_channels = []
+    async def get_chat_member(self, chat_id: int, user_id: int):
+        """get_chat_member with identical in-flight requests coalesced
         
-        for channel in channels:
-            is_subscribed = await self.check_subscription(user_id, channel)
-            subscription_results[channel] = is_subscribed
-            
-            if not is_subscribed:
-                missing_channels.append(channel)
+        call_timeout starts after the flood gate lets the call through, so a long
+        flood pause doesn't time out every waiting worker. Timing out only stops
+        this caller waiting; the shared lookup carries on for the others.
+        """
+        if self.flood_gate is not None:
+            await self.flood_gate.wait()
+        
+        async def fetch():
+            # Counted here so lookups answered by someone else's call aren't
+            self.telegram_calls += 1
+            return await self.app.get_chat_member(chat_id, user_id)
+        
+        lookup = telegram_flight.do(("get_chat_member", chat_id, user_id), fetch)
+        if self.call_timeout:
+            return await asyncio.wait_for(lookup, self.call_timeout)
+        return await lookup
+    
+    async def resolve_channel(self, channel_username: str) -> Dict:
+        """Resolve a channel username to {chat_id, title, ...} without a get_chat per call"""
+        return await channel_resolver.resolve(self.app, self.db, channel_username)
+    
+    def invalidate_subscription(self, user_id: int, channel_username: str = None) -> int:
+        """Forget cached subscription results so the next check hits Telegram"""
+        return self.cache.invalidate_membership(user_id, channel_username)
+    
+    async def check_all_subscriptions(self, user_id: int, channels: List[str], concurrent: bool = True, fail_fast: bool = False) -> Dict:
+        """Check subscription to multiple channels
+        
+        With concurrent=True the channels are checked in parallel, so the latency is
+        roughly one Telegram round-trip. With fail_fast=True the remaining checks are
+        cancelled as soon as one channel isn't confirmed; cancelled channels are
+        left out of subscription_results.
+        
+        missing_channels holds every channel not confirmed; unknown_channels is the
+        part of it Telegram couldn't answer for (see subscription_state).
+        """
+        if concurrent and len(channels) > 1:
+            states = await self._check_concurrently(user_id, channels, fail_fast)
+        else:
+            states = {}
+            for channel in channels:
+                states[channel] = await self.subscription_state(user_id, channel)
+                if fail_fast and not states[channel]:
+                    break
+        
+        missing_channels = [channel for channel in channels if channel in states and not states[channel]]
         
         return {
             "all_subscribed": len(missing_channels) == 0,
-            "subscription_results": subscription_results,
-            "missing_channels": missing_channels
+            "subscription_results": {channel: bool(state) for channel, state in states.items()},
+            "missing_channels": missing_channels,
+            "unknown_channels": [channel for channel in missing_channels if states[channel] is None]
         }
     
+    async def _check_concurrently(self, user_id: int, channels: List[str], fail_fast: bool) -> Dict:
+        """Fan subscription checks out under the checker's semaphore"""
+        async def limited_check(channel: str):
+            async with self._semaphore:
+                return channel, await self.subscription_state(user_id, channel)
+        
+        if not fail_fast:
+            return dict(await asyncio.gather(*(limited_check(channel) for channel in channels)))
+        
+        tasks = [asyncio.ensure_future(limited_check(channel)) for channel in channels]
+        subscription_results = {}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                channel, state = await next_done
+                subscription_results[channel] = state
+                if not state:
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            # Collect what the other checks raised (a FloodWait, a cancellation)
+            # so nothing is left unretrieved
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        return subscription_results
+    
     async def check_bot_admin_status(self, chat_id: int) -> Dict:
-        """Check if bot is admin in the given chat"""
+        """Check if bot is admin in the given chat (cached per chat)"""
+        cached = bot_admin_cache.get(chat_id)
+        if cached is not None:
+            return cached
+        
         try:
-            # Get bot's own user ID first
-            me = await self.app.get_me()
-            bot_member = await self.app.get_chat_member(chat_id, me.id)
+            # Bot's own user ID is resolved once and reused
+            me = await bot_identity.get(self.app)
+            bot_member = await self.get_chat_member(chat_id, me.id)
             
-            is_admin = bot_member.status in ["administrator", "creator"]
+            # Convert enum to string for comparison
+            status_str = str(bot_member.status).split('.')[-1].lower()
+            is_admin = status_str in ["administrator", "creator", "owner"]
             
-            return {
+            result = {
                 "is_member": True,
                 "is_admin": is_admin,
                 "status": bot_member.status,
                 "permissions": bot_member.privileges if hasattr(bot_member, 'privileges') else None
             }
+            bot_admin_cache.set(chat_id, result)
+            return result
             
         except UserNotParticipant:
-            return {
+            result = {
                 "is_member": False,
                 "is_admin": False,
                 "status": "not_member",
                 "permissions": None
             }
+            bot_admin_cache.set(chat_id, result)
+            return result
         except Exception as e:
             print(f"Bot admin check error: {e}")
             return {
@@ -94,18 +269,12 @@ class SubscriptionChecker:
             if channel_username.startswith('@'):
                 channel_username = channel_username[1:]
             
-            # Get chat by username
-            chat = await self.app.get_chat(channel_username)
-            
-            # Get bot's own user ID
-            me = await self.app.get_me()
+            # Resolve chat by username
+            chat = await self.resolve_channel(channel_username)
             
-            # Check bot's membership status
-            bot_member = await self.app.get_chat_member(chat.id, me.id)
-            
-            # Return True if bot is admin or creator - convert enum to string
-            status_str = str(bot_member.status).split('.')[-1].lower()
-            return status_str in ["administrator", "creator", "owner"]
+            # Check bot's (cached) membership status
+            bot_status = await self.check_bot_admin_status(chat["chat_id"])
+            return bot_status["is_admin"]
             
         except Exception as e:
             print(f"Admin check error for {channel_username}: {e}")
@@ -114,7 +283,7 @@ class SubscriptionChecker:
     async def check_user_admin_status(self, chat_id: int, user_id: int) -> Dict:
         """Check if user is admin in the given chat"""
         try:
-            user_member = await self.app.get_chat_member(chat_id, user_id)
+            user_member = await self.get_chat_member(chat_id, user_id)
             
             # Convert enum to string for comparison
             status_str = str(user_member.status).split('.')[-1].lower()
@@ -145,10 +314,17 @@ class SubscriptionChecker:
             }
     
     async def get_channel_member_count(self, channel_username: str) -> int:
-        """Get member count of a channel"""
+        """Get the current member count of a channel
+        
+        Asked from Telegram each time: the resolver's members_count is only as
+        fresh as its last refresh (CHANNEL_RESOLVER_REFRESH minutes).
+        """
         try:
-            chat = await self.app.get_chat(channel_username)
-            return chat.members_count if hasattr(chat, 'members_count') else 0
+            chat = await self.resolve_channel(channel_username)
+            return await telegram_flight.do(
+                ("get_chat_members_count", chat["chat_id"]),
+                lambda: self.app.get_chat_members_count(chat["chat_id"])
+            )
         except Exception as e:
             print(f"Error getting member count for {channel_username}: {e}")
             return 0
@@ -157,18 +333,18 @@ class SubscriptionChecker:
         """Validate bot's access to a channel"""
         try:
             # Try to get chat info
-            chat = await self.app.get_chat(channel_username)
+            chat = await self.resolve_channel(channel_username)
             
             # Check bot status
-            bot_status = await self.check_bot_admin_status(chat.id)
+            bot_status = await self.check_bot_admin_status(chat["chat_id"])
             
             return {
                 "accessible": True,
-                "chat_id": chat.id,
-                "chat_title": chat.title,
-                "chat_type": str(chat.type),
+                "chat_id": chat["chat_id"],
+                "chat_title": chat["title"],
+                "chat_type": chat["chat_type"],
                 "bot_status": bot_status,
-                "member_count": getattr(chat, 'members_count', 0)
+                "member_count": await self.get_channel_member_count(channel_username)
             }
             
         except PeerIdInvalid:
@@ -0,0 +1,263 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from config import Config
+
+
+class PostCounters:
+    """Live vote counts of participant posts, held in memory and written behind
+
+    Taps change the in-memory count immediately; a background task persists the
+    accumulated deltas to participants.post_vote_count with one bulk_write every
+    COUNTER_FLUSH_INTERVAL_MS. Unflushed deltas are lost on a crash, so recount()
+    rebuilds every stored count from user_votes on startup.
+
+    Code that $sets a recomputed count counts user_votes inside counting(),
+    which yields the snapshot for set_count(), and holds write_lock around its
+    write and set_count(), so a flush can't land between them and taps made
+    while it counted are kept. Vote writes run inside vote_write() so that no
+    tap is half done (vote stored, counter not yet bumped) while counting.
+    """
+
+    def __init__(self, flush_interval_ms: int = None, idle_ttl: float = None):
+        self.flush_interval = (Config.COUNTER_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms) / 1000
+        self.idle_ttl = Config.COUNTER_IDLE_TTL if idle_ttl is None else idle_ttl
+        self._posts = {}  # unique_post_id -> {count, delta, applied, dirty_since, touched_at, metadata}
+        self._task = None
+        self.write_lock = asyncio.Lock()
+        self._vote_writes = 0
+        self._vote_writes_done = asyncio.Event()
+        self._counting = 0
+        self._vote_writes_open = asyncio.Event()
+        self._vote_writes_open.set()
+        self.increments = 0
+        self.flushes = 0
+        self.flushed_updates = 0
+        self.flush_errors = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+
+    async def _load(self, db, unique_post_id: str) -> Optional[Dict]:
+        """Read a post's stored count and message metadata once"""
+        participant_data = await db.db[Config.PARTICIPANTS_COLLECTION].find_one(
+            {"unique_post_id": unique_post_id},
+            {"post_vote_count": 1, "channel_message_id": 1, "channel_username": 1, "post_key": 1}
+        )
+        if not participant_data:
+            return None
+
+        # Another tap may have loaded the post while we were waiting
+        if unique_post_id not in self._posts:
+            participant_data.pop("_id", None)
+            self._posts[unique_post_id] = {
+                "count": participant_data.get("post_vote_count", 0) or 0,
+                "delta": 0,
+                "applied": 0,  # every amount ever added, to tell which came after a snapshot
+                "dirty_since": None,
+                "touched_at": time.time(),
+                "metadata": participant_data
+            }
+        return self._posts[unique_post_id]
+
+    async def increment(self, db, unique_post_id: str, amount: int = 1) -> Optional[Dict]:
+        """Change a post's live count and return {post_vote_count, channel_message_id, channel_username}
+
+        Returns None when the participant post doesn't exist.
+        """
+        post = self._posts.get(unique_post_id) or await self._load(db, unique_post_id)
+        if post is None:
+            return None
+
+        now = time.time()
+        post["count"] = max(0, post["count"] + amount)
+        post["delta"] += amount
+        post["applied"] += amount
+        post["touched_at"] = now
+        if post["dirty_since"] is None:
+            post["dirty_since"] = now
+        self.increments += 1
+
+        return dict(post["metadata"], post_vote_count=post["count"])
+
+    @asynccontextmanager
+    async def vote_write(self):
+        """Wrap a user_votes change together with its counter change"""
+        while not self._vote_writes_open.is_set():
+            await self._vote_writes_open.wait()
+        self._vote_writes += 1
+        try:
+            yield
+        finally:
+            self._vote_writes -= 1
+            if not self._vote_writes:
+                self._vote_writes_done.set()
+
+    @asynccontextmanager
+    async def counting(self, unique_post_ids: List[str] = None):
+        """Hold new vote writes while user_votes is counted; yields the snapshot for set_count
+
+        Writes already started finish first, so every tap is either wholly before
+        the snapshot (in the count, its delta dropped) or starts after the count
+        (not in it, its delta kept) - never counted and kept both.
+        """
+        self._counting += 1
+        self._vote_writes_open.clear()
+        try:
+            while self._vote_writes:
+                self._vote_writes_done.clear()
+                await self._vote_writes_done.wait()
+            yield self.snapshot(unique_post_ids)
+        finally:
+            self._counting -= 1
+            if not self._counting:
+                self._vote_writes_open.set()
+
+    def snapshot(self, unique_post_ids: List[str] = None) -> Dict:
+        """Mark the start of a recount, for set_count"""
+        return {
+            unique_post_id: (post, post["applied"]) for unique_post_id, post in self._posts.items()
+            if unique_post_ids is None or unique_post_id in unique_post_ids
+        }
+
+    def set_count(self, unique_post_id: str, count: int, since: Dict = None):
+        """Adopt a count that was just recomputed and stored (call under write_lock)
+
+        Deltas from before the snapshot `since` are already part of count and are
+        dropped; the ones recorded after it are added on top and flushed again as
+        $inc, since the stored $set overwrote them. Without since the count is
+        taken to include every delta.
+        """
+        post = self._posts.get(unique_post_id)
+        if not post:
+            return
+
+        late = 0
+        if since is not None:
+            # A post loaded after the snapshot only holds later taps
+            held, applied = since.get(unique_post_id, (None, 0))
+            late = post["applied"] - applied if held is post else post["applied"]
+
+        now = time.time()
+        post.update({
+            "count": max(0, count + late),
+            "delta": late,
+            "dirty_since": (post["dirty_since"] or now) if late else None,
+            "touched_at": now
+        })
+
+    def get_count(self, unique_post_id: str) -> Optional[int]:
+        """Get a post's live count if it is held in memory"""
+        post = self._posts.get(unique_post_id)
+        return post["count"] if post else None
+
+    async def flush(self, db) -> int:
+        """Persist every pending delta with one bulk_write"""
+        async with self.write_lock:
+            return await self._flush(db)
+
+    async def _flush(self, db) -> int:
+        now = time.time()
+        pending = {}
+        oldest = now
+        for unique_post_id, post in self._posts.items():
+            if post["delta"]:
+                pending[unique_post_id] = post["delta"]
+                oldest = min(oldest, post["dirty_since"] or now)
+                post["delta"] = 0
+                post["dirty_since"] = None
+
+        if pending:
+            updates = [
+                UpdateOne({"unique_post_id": unique_post_id}, {"$inc": {"post_vote_count": delta}})
+                for unique_post_id, delta in pending.items()
+            ]
+            try:
+                await db.db[Config.PARTICIPANTS_COLLECTION].bulk_write(updates, ordered=False)
+                self.flushes += 1
+                self.flushed_updates += len(updates)
+                self.last_flush_lag = time.time() - oldest
+                self.max_flush_lag = max(self.max_flush_lag, self.last_flush_lag)
+            except Exception as e:
+                # Put the deltas back so the next flush retries them
+                self.flush_errors += 1
+                for unique_post_id, delta in pending.items():
+                    post = self._posts.get(unique_post_id)
+                    if post:
+                        post["delta"] += delta
+                        post["dirty_since"] = post["dirty_since"] or oldest
+                print(f"Error flushing vote counters: {e}")
+                return 0
+
+        # Forget quiet posts; they are reloaded from Mongo on the next tap
+        idle_before = time.time() - self.idle_ttl
+        for unique_post_id in [key for key, post in self._posts.items() if not post["delta"] and post["touched_at"] < idle_before]:
+            del self._posts[unique_post_id]
+
+        return len(pending)
+
+    async def recount(self, db) -> int:
+        """Rebuild stored counts from user_votes after a restart (crash recovery)"""
+        try:
+            counts = await db.db["user_votes"].aggregate([
+                {"$group": {"_id": "$unique_post_id", "count": {"$sum": 1}}}
+            ], allowDiskUse=True).to_list(length=None)
+            live_counts = {group["_id"]: group["count"] for group in counts if group["_id"]}
+
+            participants = await db.db[Config.PARTICIPANTS_COLLECTION].find(
+                {"unique_post_id": {"$exists": True}},
+                {"unique_post_id": 1, "post_vote_count": 1}
+            ).to_list(length=None)
+
+            updates = [
+                UpdateOne({"_id": participant["_id"]}, {"$set": {"post_vote_count": live_counts.get(participant["unique_post_id"], 0)}})
+                for participant in participants
+                if participant.get("post_vote_count", 0) != live_counts.get(participant["unique_post_id"], 0)
+            ]
+            if updates:
+                await db.db[Config.PARTICIPANTS_COLLECTION].bulk_write(updates, ordered=False)
+
+            self._posts.clear()
+            print(f"Recounted votes: fixed {len(updates)} of {len(participants)} post counts")
+            return len(updates)
+        except Exception as e:
+            print(f"Error recounting votes: {e}")
+            return 0
+
+    async def _flush_loop(self, db):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush(db)
+
+    def start(self, db):
+        """Start the background flusher"""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush_loop(db))
+
+    async def stop(self, db):
+        """Stop the flusher and write what is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush(db)
+
+    def stats(self) -> Dict:
+        """Get counter and flush lag metrics for monitoring"""
+        now = time.time()
+        dirty = [post["dirty_since"] for post in self._posts.values() if post["dirty_since"]]
+        return {
+            "posts": len(self._posts),
+            "pending": len(dirty),
+            "pending_lag": round(now - min(dirty), 3) if dirty else 0.0,
+            "last_flush_lag": round(self.last_flush_lag, 3),
+            "max_flush_lag": round(self.max_flush_lag, 3),
+            "increments": self.increments,
+            "flushes": self.flushes,
+            "flushed_updates": self.flushed_updates,
+            "flush_errors": self.flush_errors
+        }
+
+
+# Shared by Database.record_vote and the background flusher started in main.py
+post_counters = PostCounters()
@@ -1,10 +1,17 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from config import Config
+from utils.counters import post_counters
+from utils.events import vote_events, CAST, REMOVE, ROLLBACK
+from utils.cache import post_metadata_cache
+from utils.ledger import verification_ledger
+from utils.sweep import SweepRuns
 import logging
 
 # Configure logging
@@ -13,6 +20,13 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+# Fields cached in post_metadata_cache
+POST_METADATA_PROJECTION = {field: 1 for field in post_metadata_cache.FIELDS}
+
+# Votes claimed by a remove_voter_votes that died before deleting them can be
+# claimed again after this many seconds
+VOTE_REMOVAL_CLAIM_TTL = 300
+
 def LOGGER(name):
     return logging.getLogger(name)
 
@@ -32,6 +46,8 @@ class Database:
             await self.client.admin.command('ping')
             LOGGER(__name__).info("Connected to your Mongo Database.")
             print("Connected to MongoDB successfully!")
+            
+            await self.create_indexes()
                 
         except Exception as e:
             LOGGER(__name__).error("Failed to connect to your Mongo Database.")
@@ -39,6 +55,77 @@ class Database:
             print("Please check your MONGO_DB_URI environment variable")
             exit()
     
+    async def create_indexes(self):
+        """Create the indexes the vote hot path relies on"""
+        try:
+            # One vote per voter per post - enforced by Mongo instead of a find_one check.
+            # Legacy votes have no unique_post_id and are left out, or every voter
+            # with two of them would collide on null
+            try:
+                await self.create_vote_unique_index()
+            except OperationFailure as e:
+                if e.code not in (85, 86):  # IndexOptionsConflict, IndexKeySpecsConflict
+                    raise
+                # Built by an older version without the partial filter
+                await self.db["user_votes"].drop_index("voter_post_unique")
+                await self.create_vote_unique_index()
+        except DuplicateKeyError:
+            # record_vote's upsert still skips repeat taps, but racing taps can both count
+            print("Duplicate votes exist in user_votes - run migrate_unique_votes.py to create the unique index")
+        except Exception as e:
+            print(f"Error creating user_votes index: {e}")
+        
+        try:
+            # Subscription sweeps stream a channel's votes sorted by voter
+            await self.db["user_votes"].create_index([("channel_username", 1), ("voter_id", 1)])
+        except Exception as e:
+            print(f"Error creating user_votes sweep index: {e}")
+        
+        try:
+            await self.db[Config.PARTICIPANTS_COLLECTION].create_index("unique_post_id")
+            # Vote buttons carry only the post key (see utils.callback_data)
+            await self.db[Config.PARTICIPANTS_COLLECTION].create_index("post_key", unique=True, sparse=True)
+        except Exception as e:
+            print(f"Error creating participants index: {e}")
+        
+        try:
+            # A channel's top-ranked posts, for the verification ledger's weights
+            await self.db[Config.PARTICIPANTS_COLLECTION].create_index([("channel_username", 1), ("post_vote_count", -1)])
+        except Exception as e:
+            print(f"Error creating participants ranking index: {e}")
+        
+        try:
+            await verification_ledger.create_indexes(self)
+        except Exception as e:
+            print(f"Error creating verification ledger indexes: {e}")
+        
+        try:
+            await SweepRuns(self).create_indexes()
+        except Exception as e:
+            print(f"Error creating sweep_runs index: {e}")
+        
+        try:
+            await vote_events.create_indexes(self)
+        except Exception as e:
+            print(f"Error creating vote event indexes: {e}")
+        
+        if Config.VOTE_EVENTS_ENABLED:
+            try:
+                # Before the first append, or replay would only see post-deploy deltas
+                seeded = await vote_events.seed(self)
+                if seeded:
+                    print(f"Seeded the vote event log with {seeded} existing votes")
+            except Exception as e:
+                print(f"Error seeding vote event log: {e}")
+    
+    async def create_vote_unique_index(self):
+        await self.db["user_votes"].create_index(
+            [("voter_id", 1), ("unique_post_id", 1)],
+            unique=True,
+            partialFilterExpression={"unique_post_id": {"$exists": True}},
+            name="voter_post_unique"
+        )
+    
     async def close(self):
         """Close database connection"""
         if self.client:
@@ -112,6 +199,8 @@ class Database:
     async def add_user_vote(self, vote_data: Dict) -> str:
         """Add a user vote for a specific participant post"""
         result = await self.db["user_votes"].insert_one(vote_data)
+        if vote_data.get("unique_post_id") and Config.VOTE_EVENTS_ENABLED:
+            await vote_events.append(self, CAST, vote_data.get("voter_id"), vote_data["unique_post_id"], vote_data.get("channel_username"))
         return str(result.inserted_id)
     
     async def get_user_vote_on_post(self, voter_id: int, unique_post_id: str) -> Optional[Dict]:
@@ -125,22 +214,207 @@ class Database:
         """Remove user vote from a specific post"""
         result = await self.db["user_votes"].delete_one({
             "voter_id": voter_id,
-            "unique_post_id": unique_post_id
+            "unique_post_id": unique_post_id,
+            "removal": {"$exists": False}
         })
+        if result.deleted_count and Config.VOTE_EVENTS_ENABLED:
+            await vote_events.append(self, REMOVE, voter_id, unique_post_id)
         return result.deleted_count > 0
     
+    async def remove_voter_votes(self, voter_id: int, channel_username: str, votes: List[Dict] = None) -> Dict:
+        """Delete every vote a voter cast in a channel and adjust post counters in bulk
+        
+        votes may hold the voter's vote documents (_id, unique_post_id, participant_user_id)
+        when the caller already read them. Returns {"removed", "posts": {unique_post_id: new count}, "legacy": [participant_user_id, ...]}
+        where legacy lists the participants of old votes without a unique_post_id.
+        """
+        if votes is None:
+            votes = await self.db["user_votes"].find(
+                {"voter_id": voter_id, "channel_username": channel_username},
+                {"unique_post_id": 1, "participant_user_id": 1}
+            ).to_list(length=None)
+        if not votes:
+            return {"removed": 0, "posts": {}, "legacy": []}
+        
+        # One delete_one per vote, VOTE_DELETE_BATCH at a time: each result says
+        # whether this call removed the vote or someone else (remove_user_vote,
+        # a rollback) got there first and already logged and counted it
+        async with post_counters.vote_write():
+            # Claim the votes with one update_many before the single delete_many:
+            # remove_user_vote and rollback_vote skip claimed votes, so whatever
+            # this call claimed is deleted, logged and counted by it alone
+            ids = [vote["_id"] for vote in votes]
+            claim = ObjectId()
+            stale = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=VOTE_REMOVAL_CLAIM_TTL))
+            claimed = await self.db["user_votes"].update_many(
+                {"_id": {"$in": ids}, "$or": [{"removal": {"$exists": False}}, {"removal": {"$lt": stale}}]},
+                {"$set": {"removal": claim}}
+            )
+            deleted = votes
+            if claimed.modified_count != len(ids):
+                # Someone else removed (or is removing) some of them
+                mine = await self.db["user_votes"].find({"_id": {"$in": ids}, "removal": claim}, {"_id": 1}).to_list(length=None)
+                mine = {vote["_id"] for vote in mine}
+                deleted = [vote for vote in votes if vote["_id"] in mine]
+            if deleted:
+                await self.db["user_votes"].delete_many({"_id": {"$in": ids}, "removal": claim})
+            
+            deltas = {}
+            legacy = []
+            for vote in deleted:
+                if vote.get("unique_post_id"):
+                    deltas[vote["unique_post_id"]] = deltas.get(vote["unique_post_id"], 0) - 1
+                elif vote.get("participant_user_id"):
+                    legacy.append(vote["participant_user_id"])
+            
+            if Config.VOTE_EVENTS_ENABLED:
+                post_ids = [vote["unique_post_id"] for vote in deleted if vote.get("unique_post_id")]
+                await vote_events.append_many(self, REMOVE, voter_id, post_ids, channel_username)
+            
+            posts = await self.apply_post_vote_deltas(deltas)
+        return {"removed": len(deleted), "posts": posts, "legacy": legacy}
+    
+    async def apply_post_vote_deltas(self, deltas: Dict[str, int]) -> Dict[str, int]:
+        """Add each amount to its post's counter and return the new counts
+        
+        Posts held by post_counters change in memory; the rest get one bulk_write of $inc.
+        """
+        counts = {}
+        if Config.WRITE_BEHIND_COUNTERS:
+            for unique_post_id, amount in deltas.items():
+                if post_counters.get_count(unique_post_id) is not None:
+                    participant_data = await post_counters.increment(self, unique_post_id, amount)
+                    counts[unique_post_id] = participant_data["post_vote_count"]
+        
+        stored = {unique_post_id: amount for unique_post_id, amount in deltas.items() if unique_post_id not in counts}
+        if stored:
+            await self.db[Config.PARTICIPANTS_COLLECTION].bulk_write([
+                UpdateOne({"unique_post_id": unique_post_id}, {"$inc": {"post_vote_count": amount}})
+                for unique_post_id, amount in stored.items()
+            ], ordered=False)
+            participants = await self.db[Config.PARTICIPANTS_COLLECTION].find(
+                {"unique_post_id": {"$in": list(stored)}},
+                {"unique_post_id": 1, "post_vote_count": 1}
+            ).to_list(length=None)
+            for participant in participants:
+                counts.setdefault(participant["unique_post_id"], max(0, participant.get("post_vote_count") or 0))
+        
+        return counts
+    
     async def get_post_vote_count(self, unique_post_id: str) -> int:
         """Get vote count for a specific participant post"""
         return await self.db["user_votes"].count_documents({"unique_post_id": unique_post_id})
     
-    async def update_post_vote_count(self, unique_post_id: str, new_count: int) -> bool:
-        """Update the stored vote count for a participant post"""
-        result = await self.db[Config.PARTICIPANTS_COLLECTION].update_one(
+    async def update_post_vote_count(self, unique_post_id: str, new_count: int, since: Dict = None) -> bool:
+        """Update the stored vote count for a participant post
+        
+        since is the snapshot post_counters.counting() yielded while new_count was
+        counted; live taps recorded after it are kept on top of the new count.
+        """
+        async with post_counters.write_lock:
+            result = await self.db[Config.PARTICIPANTS_COLLECTION].update_one(
+                {"unique_post_id": unique_post_id},
+                {"$set": {"post_vote_count": new_count}}
+            )
+            post_counters.set_count(unique_post_id, new_count, since)
+        return result.modified_count > 0
+    
+    async def record_vote(self, vote_data: Dict) -> Optional[Dict]:
+        """Record a vote and bump the post's counter without count_documents
+        
+        With WRITE_BEHIND_COUNTERS the counter is bumped in memory and flushed later,
+        otherwise it is a find_one_and_update $inc.
+        
+        Returns None if the voter already voted on this post, otherwise the participant
+        post after the increment (post_vote_count, channel_message_id, channel_username),
+        or an empty dict when the post record is missing. The $setOnInsert upsert
+        skips repeat taps even where the unique (voter_id, unique_post_id) index
+        couldn't be built; with the index, two racing taps can't both count either.
+        """
+        async with post_counters.vote_write():
+            try:
+                result = await self.db["user_votes"].update_one(
+                    {"voter_id": vote_data["voter_id"], "unique_post_id": vote_data["unique_post_id"]},
+                    {"$setOnInsert": vote_data},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                return None
+            if result.upserted_id is None:
+                return None
+            
+            if Config.VOTE_EVENTS_ENABLED:
+                await vote_events.append(self, CAST, vote_data["voter_id"], vote_data["unique_post_id"], vote_data.get("channel_username"))
+            return await self.change_post_vote_count(vote_data["unique_post_id"], 1)
+    
+    async def change_post_vote_count(self, unique_post_id: str, amount: int) -> Dict:
+        """Add amount to a post's counter and return the post after the change"""
+        if Config.WRITE_BEHIND_COUNTERS:
+            # Count lives in memory and is flushed in bulk by post_counters
+            participant_data = await post_counters.increment(self, unique_post_id, amount)
+            return participant_data or {}
+        
+        participant_data = await self.db[Config.PARTICIPANTS_COLLECTION].find_one_and_update(
             {"unique_post_id": unique_post_id},
-            {"$set": {"post_vote_count": new_count}}
+            {"$inc": {"post_vote_count": amount}},
+            projection={"post_vote_count": 1, "channel_message_id": 1, "channel_username": 1, "post_key": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return participant_data or {}
+    
+    async def confirm_vote(self, voter_id: int, unique_post_id: str) -> bool:
+        """Mark a provisional vote as verified"""
+        result = await self.db["user_votes"].update_one(
+            {"voter_id": voter_id, "unique_post_id": unique_post_id, "provisional": True},
+            {"$unset": {"provisional": ""}}
         )
         return result.modified_count > 0
     
+    async def rollback_vote(self, voter_id: int, unique_post_id: str) -> Optional[Dict]:
+        """Remove a provisional vote that failed verification
+        
+        Returns the post after the decrement, or None if the vote was already gone.
+        """
+        async with post_counters.vote_write():
+            result = await self.db["user_votes"].delete_one(
+                {"voter_id": voter_id, "unique_post_id": unique_post_id, "provisional": True, "removal": {"$exists": False}}
+            )
+            if not result.deleted_count:
+                return None
+            if Config.VOTE_EVENTS_ENABLED:
+                await vote_events.append(self, ROLLBACK, voter_id, unique_post_id)
+            return await self.change_post_vote_count(unique_post_id, -1)
+    
+    async def get_provisional_votes(self) -> List[Dict]:
+        """Get votes still waiting for verification (e.g. after a restart)"""
+        return await self.db["user_votes"].find({"provisional": True}).to_list(length=None)
+    
+    async def get_participant_by_post_key(self, post_key: str) -> Optional[Dict]:
+        """Get the participant post behind a v1 vote button"""
+        metadata = post_metadata_cache.get_by_post_key(post_key)
+        if metadata is None:
+            participant_data = await self.db[Config.PARTICIPANTS_COLLECTION].find_one(
+                {"post_key": post_key}, POST_METADATA_PROJECTION
+            )
+            if not participant_data:
+                return None
+            metadata = post_metadata_cache.remember(participant_data)
+        return metadata
+    
+    async def get_post_metadata(self, unique_post_id: str) -> Optional[Dict]:
+        """Get where a participant post lives (channel, message id, post key, participant)"""
+        metadata = post_metadata_cache.get(unique_post_id)
+        if metadata is None:
+            # The original participation entry shares unique_post_id but has no post_key,
+            # so prefer the per-post document
+            participant_data = await self.db[Config.PARTICIPANTS_COLLECTION].find_one(
+                {"unique_post_id": unique_post_id}, POST_METADATA_PROJECTION, sort=[("post_key", -1)]
+            )
+            if not participant_data:
+                return None
+            metadata = post_metadata_cache.remember(participant_data)
+        return metadata
+    
     async def get_participant_by_post_id(self, unique_post_id: str) -> Optional[Dict]:
         """Get participant details by unique post ID"""
         return await self.db[Config.PARTICIPANTS_COLLECTION].find_one({"unique_post_id": unique_post_id})
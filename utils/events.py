@@ -0,0 +1,219 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import Config
+
+CAST = "cast"
+REMOVE = "remove"
+ROLLBACK = "rollback"
+
+COMPACTION_STATE_ID = "compaction"
+
+
+class VoteEventLog:
+    """Append-only log of vote casts and removals
+
+    Every change to user_votes is also written to vote_events as a +1/-1 delta.
+    compact() folds events into per-post totals in vote_counts, and replay()
+    rebuilds any post's count as snapshot + events after it, so stored counters
+    can always be reconstructed with a couple of aggregations. seed() writes
+    the baseline for votes cast before the log existed.
+    """
+
+    def __init__(self, compaction_lag: float = None):
+        # Only fold events older than this so late inserts from other clients
+        # (ObjectIds are not strictly ordered across processes) aren't skipped
+        self.compaction_lag = Config.VOTE_EVENTS_COMPACTION_LAG if compaction_lag is None else compaction_lag
+        self.appended = 0
+        self.append_errors = 0
+
+    def _events(self, db):
+        return db.db[Config.VOTE_EVENTS_COLLECTION]
+
+    def _counts(self, db):
+        return db.db[Config.VOTE_COUNTS_COLLECTION]
+
+    async def create_indexes(self, db):
+        await self._events(db).create_index([("unique_post_id", 1), ("_id", 1)])
+        await self._counts(db).create_index("unique_post_id", unique=True, sparse=True)
+
+    async def append(self, db, event_type: str, voter_id: int, unique_post_id: str, channel_username: str = None):
+        """Write one event; a failed log write never fails the vote itself"""
+        try:
+            await self._events(db).insert_one({
+                "type": event_type,
+                "delta": 1 if event_type == CAST else -1,
+                "voter_id": voter_id,
+                "unique_post_id": unique_post_id,
+                "channel_username": channel_username,
+                "at": datetime.now()
+            })
+            self.appended += 1
+        except Exception as e:
+            self.append_errors += 1
+            print(f"Error appending vote event for post {unique_post_id}: {e}")
+
+    async def append_many(self, db, event_type: str, voter_id: int, unique_post_ids: List[str], channel_username: str = None):
+        """Write one event per post id with a single insert_many"""
+        if not unique_post_ids:
+            return
+        try:
+            await self._events(db).insert_many([{
+                "type": event_type,
+                "delta": 1 if event_type == CAST else -1,
+                "voter_id": voter_id,
+                "unique_post_id": unique_post_id,
+                "channel_username": channel_username,
+                "at": datetime.now()
+            } for unique_post_id in unique_post_ids], ordered=False)
+            self.appended += len(unique_post_ids)
+        except Exception as e:
+            self.append_errors += 1
+            print(f"Error appending {len(unique_post_ids)} vote events for voter {voter_id}: {e}")
+
+    async def append_votes(self, db, event_type: str, votes: List[Dict]):
+        """Write one event per vote document (voter_id, unique_post_id, channel_username)"""
+        events = [{
+            "type": event_type,
+            "delta": 1 if event_type == CAST else -1,
+            "voter_id": vote.get("voter_id"),
+            "unique_post_id": vote["unique_post_id"],
+            "channel_username": vote.get("channel_username"),
+            "at": datetime.now()
+        } for vote in votes if vote.get("unique_post_id")]
+        for start in range(0, len(events), 1000):
+            await self._events(db).insert_many(events[start:start + 1000], ordered=False)
+        self.appended += len(events)
+
+    async def _compaction_state(self, db) -> Dict:
+        return await self._counts(db).find_one({"_id": COMPACTION_STATE_ID}) or {"_id": COMPACTION_STATE_ID, "through": None}
+
+    async def is_seeded(self, db) -> bool:
+        """True once seed() has written the baseline every replay starts from"""
+        return (await self._compaction_state(db)).get("seeded_at") is not None
+
+    def _range(self, start: Optional[ObjectId], end: ObjectId = None) -> Dict:
+        id_range = {}
+        if start is not None:
+            id_range["$gt"] = start
+        if end is not None:
+            id_range["$lte"] = end
+        return {"_id": id_range} if id_range else {}
+
+    async def _sum_events(self, db, query: Dict) -> Dict[str, int]:
+        groups = await self._events(db).aggregate([
+            {"$match": query},
+            {"$group": {"_id": "$unique_post_id", "delta": {"$sum": "$delta"}}}
+        ], allowDiskUse=True).to_list(length=None)
+        return {group["_id"]: group["delta"] for group in groups if group["_id"]}
+
+    async def compact(self, db) -> int:
+        """Fold settled events into vote_counts snapshots, idempotently
+
+        The range being folded is stored before any snapshot is touched, and every
+        snapshot records the range end it includes, so a compaction interrupted
+        half way is simply redone with the same range on the next run.
+        """
+        state = await self._compaction_state(db)
+        end = state.get("pending")
+        if end is None:
+            end = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=self.compaction_lag))
+            if state["through"] is not None and end <= state["through"]:
+                return 0
+            await self._counts(db).update_one({"_id": COMPACTION_STATE_ID}, {"$set": {"pending": end}}, upsert=True)
+
+        sums = await self._sum_events(db, self._range(state["through"], end))
+        updates = [
+            UpdateOne(
+                {"unique_post_id": unique_post_id, "through": {"$ne": end}},
+                {"$inc": {"count": delta}, "$set": {"through": end}},
+                upsert=True
+            )
+            for unique_post_id, delta in sums.items()
+        ]
+        if updates:
+            try:
+                await self._counts(db).bulk_write(updates, ordered=False)
+            except BulkWriteError as e:
+                # Snapshots already at this range end hit the unique index - that's the idempotency
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+        await self._counts(db).update_one(
+            {"_id": COMPACTION_STATE_ID},
+            {"$set": {"through": end, "compacted_at": datetime.now()}, "$unset": {"pending": ""}}
+        )
+        return len(updates)
+
+    async def replay(self, db, unique_post_ids: List[str] = None, from_snapshots: bool = True) -> Dict[str, int]:
+        """Rebuild post counts from the log: snapshot + events since, or the whole log"""
+        post_filter = {"unique_post_id": {"$in": unique_post_ids}} if unique_post_ids else {"unique_post_id": {"$exists": True}}
+        counts = {}
+        state = await self._compaction_state(db)
+        # Events before the seed watermark are superseded by the seeded baseline
+        through = state.get("seeded_through")
+
+        if from_snapshots:
+            if state.get("pending") is not None:
+                # Finish an interrupted compaction so snapshots and watermark agree
+                await self.compact(db)
+                state = await self._compaction_state(db)
+            through = state["through"]
+            snapshots = await self._counts(db).find(post_filter, {"unique_post_id": 1, "count": 1}).to_list(length=None)
+            counts = {snapshot["unique_post_id"]: snapshot["count"] for snapshot in snapshots}
+
+        tail = await self._sum_events(db, dict(post_filter, **self._range(through)))
+        for unique_post_id, delta in tail.items():
+            counts[unique_post_id] = counts.get(unique_post_id, 0) + delta
+
+        for unique_post_id in unique_post_ids or []:
+            counts.setdefault(unique_post_id, 0)
+        return counts
+
+    async def seed(self, db) -> int:
+        """Write one cast event per existing vote, once, above a watermark
+
+        Events logged before the seed (the log was enabled after votes already
+        existed) only hold post-deploy deltas, so replay and compaction start
+        from the watermark and the seeded events stand in for everything before
+        it. Runs at connect, before any handler can append; an interrupted seed
+        is redone with a new watermark on the next start.
+        """
+        if await self.is_seeded(db):
+            return 0
+
+        last = await self._events(db).find_one({}, sort=[("_id", -1)])
+        watermark = last["_id"] if last else None
+        votes = await db.db["user_votes"].find(
+            {"unique_post_id": {"$exists": True}},
+            {"voter_id": 1, "unique_post_id": 1, "channel_username": 1}
+        ).to_list(length=None)
+        events = [{
+            "type": CAST,
+            "delta": 1,
+            "voter_id": vote.get("voter_id"),
+            "unique_post_id": vote["unique_post_id"],
+            "channel_username": vote.get("channel_username"),
+            "at": datetime.now(),
+            "backfilled": True
+        } for vote in votes]
+        for start in range(0, len(events), 1000):
+            await self._events(db).insert_many(events[start:start + 1000], ordered=False)
+
+        # Snapshots folded from pre-seed events are as partial as the events themselves
+        await self._counts(db).delete_many({"unique_post_id": {"$exists": True}})
+        await self._counts(db).update_one(
+            {"_id": COMPACTION_STATE_ID},
+            {"$set": {"through": watermark, "seeded_through": watermark, "seeded_at": datetime.now()}, "$unset": {"pending": ""}},
+            upsert=True
+        )
+        return len(events)
+
+    def stats(self) -> Dict:
+        return {"appended": self.appended, "append_errors": self.append_errors}
+
+
+# Shared by Database (writes), the scheduler (compaction) and replay_vote_events.py
+vote_events = VoteEventLog()
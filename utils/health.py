@@ -0,0 +1,122 @@
+import time
+from typing import Dict, List
+from pyrogram.errors import ChannelPrivate, ChannelInvalid, ChatAdminRequired, PeerIdInvalid, UsernameNotOccupied
+from config import Config
+from utils.cache import channel_key
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+BROKEN = "broken"
+
+# Errors that will fail the same way for every user until the channel itself changes
+CHANNEL_ERRORS = (ChannelPrivate, ChannelInvalid, ChatAdminRequired, PeerIdInvalid, UsernameNotOccupied)
+
+
+def is_channel_error(error: Exception) -> bool:
+    """Check if an error is about the channel rather than the user"""
+    return isinstance(error, CHANNEL_ERRORS) or "CHAT_ADMIN_REQUIRED" in str(error)
+
+
+class ChannelHealth:
+    """Per-channel healthy / degraded / broken state with exponential backoff
+
+    A channel turns degraded on its first channel-level failure and broken after
+    CHANNEL_BROKEN_AFTER consecutive ones. While broken, callers skip it until the
+    backoff expires; then a single probe is let through and either heals the
+    channel or doubles the backoff.
+    """
+
+    def __init__(self, broken_after: int = None, base_backoff: float = None, max_backoff: float = None):
+        self.broken_after = broken_after if broken_after is not None else Config.CHANNEL_BROKEN_AFTER
+        self.base_backoff = base_backoff if base_backoff is not None else Config.CHANNEL_BACKOFF_BASE
+        self.max_backoff = max_backoff if max_backoff is not None else Config.CHANNEL_BACKOFF_MAX
+        self._channels = {}  # channel key -> state record
+
+    def _record(self, channel) -> Dict:
+        key = channel_key(channel)
+        if key not in self._channels:
+            self._channels[key] = {
+                "channel": channel,
+                "state": HEALTHY,
+                "failures": 0,
+                "last_error": None,
+                "verdict": False,
+                "next_retry_at": 0,
+                "updated_at": time.time()
+            }
+        return self._channels[key]
+
+    def get_state(self, channel) -> str:
+        """Get the current state of a channel"""
+        record = self._channels.get(channel_key(channel))
+        return record["state"] if record else HEALTHY
+
+    def is_broken(self, channel) -> bool:
+        """Check if a channel is broken, regardless of backoff"""
+        return self.get_state(channel) == BROKEN
+
+    def should_skip(self, channel) -> bool:
+        """Check if calls for a channel should be skipped right now
+
+        Once the backoff has expired the first caller gets through as a probe and
+        the retry time is pushed out so concurrent callers keep skipping.
+        """
+        record = self._channels.get(channel_key(channel))
+        if not record or record["state"] != BROKEN:
+            return False
+
+        now = time.time()
+        if now < record["next_retry_at"]:
+            return True
+
+        record["next_retry_at"] = now + self.base_backoff
+        return False
+
+    def verdict(self, channel) -> bool:
+        """Subscription result to report while a channel is skipped"""
+        record = self._channels.get(channel_key(channel))
+        return record["verdict"] if record else False
+
+    def record_success(self, channel):
+        """Mark a channel healthy after a successful call"""
+        record = self._channels.get(channel_key(channel))
+        if record and record["state"] != HEALTHY:
+            print(f"Channel {channel} recovered after {record['failures']} failures")
+            record.update({
+                "state": HEALTHY,
+                "failures": 0,
+                "last_error": None,
+                "next_retry_at": 0,
+                "updated_at": time.time()
+            })
+
+    def record_failure(self, channel, error: Exception, verdict: bool = False) -> str:
+        """Register a channel-level failure and return the new state"""
+        record = self._record(channel)
+        record["failures"] += 1
+        record["last_error"] = type(error).__name__ if not isinstance(error, str) else error
+        record["verdict"] = verdict
+        record["updated_at"] = time.time()
+
+        if record["failures"] >= self.broken_after:
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (record["failures"] - self.broken_after))
+            if record["state"] != BROKEN:
+                print(f"Channel {channel} marked broken ({record['last_error']}) - backing off {backoff:.0f}s")
+            record["state"] = BROKEN
+            record["next_retry_at"] = time.time() + backoff
+        else:
+            record["state"] = DEGRADED
+
+        return record["state"]
+
+    def reset(self, channel) -> bool:
+        """Forget a channel's health state"""
+        return self._channels.pop(channel_key(channel), None) is not None
+
+    def snapshot(self) -> List[Dict]:
+        """Get all unhealthy channels for the admin command"""
+        return [dict(record) for record in self._channels.values() if record["state"] != HEALTHY]
+
+
+# Shared by the checker, scheduler and button updaters
+channel_health = ChannelHealth()
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config import Config
+
+# Pairs seeded from user_votes have never been verified and are due at once
+NEVER = datetime(1970, 1, 1)
+
+
+class VerificationLedger:
+    """When each (voter, channel) pair was last verified, in voter_verification
+
+    Every pair carries a due_at time: a verified pair is due again after
+    VERIFICATION_STALE_AFTER seconds, divided by its weight, so voters on the
+    channel's top-ranked posts come round sooner. The sweep only takes the
+    VERIFICATION_TICK_BUDGET pairs that are most overdue, which keeps each
+    tick's Telegram cost fixed however many votes there are.
+    """
+
+    def __init__(self, stale_after: float = None, top_post_weight: float = None):
+        self.stale_after = Config.VERIFICATION_STALE_AFTER if stale_after is None else stale_after
+        self.top_post_weight = Config.VERIFICATION_TOP_POST_WEIGHT if top_post_weight is None else top_post_weight
+        self.recorded = 0
+        self.seeded_at = None
+
+    def _collection(self, db):
+        return db.db[Config.VOTER_VERIFICATION_COLLECTION]
+
+    async def create_indexes(self, db):
+        await self._collection(db).create_index([("voter_id", 1), ("channel_username", 1)], unique=True)
+        await self._collection(db).create_index("due_at")
+
+    async def seed(self, db, top_post_ids: List[str] = ()):
+        """Add a never-verified pair for every (voter, channel) in user_votes, server side
+
+        Voters with a vote on one of top_post_ids get the top-post weight, so the
+        initial backlog is verified top-ranked posts first too. The indexes are
+        ensured first because $merge needs the unique (voter_id, channel_username) one.
+        """
+        await self.create_indexes(db)
+        top_votes = {"$sum": {"$cond": [{"$in": ["$unique_post_id", list(top_post_ids)]}, 1, 0]}}
+        await db.db["user_votes"].aggregate([
+            {"$match": {"channel_username": {"$exists": True}}},
+            {"$group": {"_id": {"voter_id": "$voter_id", "channel_username": "$channel_username"}, "top_votes": top_votes}},
+            {"$project": {
+                "voter_id": "$_id.voter_id",
+                "channel_username": "$_id.channel_username",
+                "due_at": NEVER,
+                "weight": {"$cond": [{"$gt": ["$top_votes", 0]}, self.weight(1), self.weight(0)]}
+            }},
+            {"$merge": {
+                "into": Config.VOTER_VERIFICATION_COLLECTION,
+                "on": ["voter_id", "channel_username"],
+                "whenMatched": "keepExisting",
+                "whenNotMatched": "insert"
+            }}
+        ], allowDiskUse=True).to_list(length=None)
+        self.seeded_at = datetime.now()
+
+    def weight(self, top_votes: int) -> float:
+        """Voters with votes on top-ranked posts are re-verified more often"""
+        return 1 + self.top_post_weight if top_votes else 1
+
+    async def record(self, db, voter_id: int, channel_username: str, subscribed: bool, top_votes: Optional[int] = None):
+        """Store a verification result and when the pair is due again
+
+        Without top_votes (a vote tap doesn't know the voter's rank) the stored
+        weight is kept. A failed write only means the pair is verified again sooner.
+        """
+        now = datetime.now()
+        if top_votes is None:
+            weight = {"$ifNull": ["$weight", self.weight(0)]}
+        else:
+            weight = {"$literal": self.weight(top_votes)}
+        try:
+            # Pipeline update, so due_at follows whichever weight is stored
+            await self._collection(db).update_one(
+                {"voter_id": voter_id, "channel_username": channel_username},
+                [
+                    {"$set": {"verified_at": now, "subscribed": subscribed, "weight": weight}},
+                    {"$set": {"due_at": {"$add": ["$verified_at", {"$divide": [self.stale_after * 1000, "$weight"]}]}}}
+                ],
+                upsert=True
+            )
+            self.recorded += 1
+        except Exception as e:
+            print(f"Error recording verification of {voter_id} in {channel_username}: {e}")
+
+    async def forget(self, db, voter_id: int, channel_username: str):
+        """Drop a pair whose votes are gone"""
+        await self._collection(db).delete_one({"voter_id": voter_id, "channel_username": channel_username})
+
+    async def due(self, db, channels: List[str], limit: int) -> List[Dict]:
+        """The most overdue pairs in the given channels, heaviest first on ties"""
+        return await self._collection(db).find(
+            {"channel_username": {"$in": channels}, "due_at": {"$lte": datetime.now()}}
+        ).sort([("due_at", 1), ("weight", -1)]).limit(limit).to_list(length=None)
+
+    async def stats(self, db) -> Dict:
+        collection = self._collection(db)
+        return {
+            "pairs": await collection.estimated_document_count(),
+            "due": await collection.count_documents({"due_at": {"$lte": datetime.now()}}),
+            "recorded": self.recorded
+        }
+
+
+# Shared by the scheduler and the vote handlers
+verification_ledger = VerificationLedger()
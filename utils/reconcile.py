@@ -0,0 +1,134 @@
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from pymongo import UpdateOne
+from config import Config
+from utils.buttons import button_coalescer
+from utils.callback_data import vote_callback_data
+from utils.counters import post_counters
+from utils.health import channel_health
+
+
+class VoteReconciler:
+    """Recompute stored post vote counts from user_votes in bulk
+
+    One $group aggregation counts the votes of every post (in a channel, or
+    everywhere), the participants are streamed and diffed against it, and only
+    the counts that changed are written with bulk_write. Buttons are queued on
+    the coalescer for those posts only. The bot keeps voting meanwhile: taps
+    wait only while the aggregation runs (PostCounters.counting), and the ones
+    made after it survive the reconcile's $set (see PostCounters.set_count).
+    """
+
+    def __init__(self, app, db, batch_size: int = None):
+        self.app = app
+        self.db = db
+        self.batch_size = Config.RECONCILE_BATCH_SIZE if batch_size is None else batch_size
+
+    async def live_counts(self, channel_username: str = None) -> Dict[str, int]:
+        """unique_post_id -> number of votes in user_votes"""
+        match = {"unique_post_id": {"$exists": True}}
+        if channel_username:
+            match["channel_username"] = channel_username
+
+        groups = await self.db.db["user_votes"].aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$unique_post_id", "count": {"$sum": 1}}}
+        ], allowDiskUse=True).to_list(length=None)
+        return {group["_id"]: group["count"] for group in groups if group["_id"]}
+
+    async def reconcile(self, channel_username: str = None, refresh_all: bool = False, dry_run: bool = False,
+                        progress: Optional[Callable[[Dict], Awaitable]] = None) -> Dict:
+        """Fix drifted post counts and queue their button refreshes
+
+        With refresh_all every post's button is queued, not only the changed ones
+        (for counts that were already fixed outside the bot). progress is awaited
+        after each batch with the running report.
+        """
+        started = time.time()
+
+        # Write pending in-memory deltas first so the stored counts are comparable
+        if Config.WRITE_BEHIND_COUNTERS:
+            await post_counters.flush(self.db)
+
+        participants_collection = self.db.db[Config.PARTICIPANTS_COLLECTION]
+        query = {"unique_post_id": {"$exists": True}}
+        if channel_username:
+            query["channel_username"] = channel_username
+
+        async with post_counters.counting() as since:
+            counts = await self.live_counts(channel_username)
+        report = {
+            "channel": channel_username or "all",
+            "posts": await participants_collection.count_documents(query),
+            "checked": 0,
+            "changed": 0,
+            "buttons_queued": 0,
+            "votes": sum(counts.values()),
+            "dry_run": dry_run
+        }
+
+        updates = []
+        changed = {}  # unique_post_id -> new count, for the batch being written
+        refresh = {}  # unique_post_id -> new count
+        cursor = participants_collection.find(query, {"unique_post_id": 1, "post_vote_count": 1})
+        async for participant in cursor:
+            unique_post_id = participant["unique_post_id"]
+            count = counts.get(unique_post_id, 0)
+            report["checked"] += 1
+
+            # The original participation entry shares unique_post_id, so several
+            # documents may map to one post; each is fixed by _id
+            if (participant.get("post_vote_count") or 0) != count:
+                updates.append(UpdateOne({"_id": participant["_id"]}, {"$set": {"post_vote_count": count}}))
+                changed[unique_post_id] = count
+                refresh[unique_post_id] = count
+            elif refresh_all:
+                refresh[unique_post_id] = count
+
+            if len(updates) >= self.batch_size:
+                await self._write(updates, changed, since, report, dry_run)
+                updates = []
+                changed = {}
+                if progress:
+                    await progress(report)
+
+        await self._write(updates, changed, since, report, dry_run)
+
+        if not dry_run and self.app is not None:
+            for unique_post_id, count in refresh.items():
+                # Show taps made during the reconcile too
+                live_count = post_counters.get_count(unique_post_id)
+                if await self.queue_button(unique_post_id, count if live_count is None else live_count):
+                    report["buttons_queued"] += 1
+
+        report["elapsed"] = round(time.time() - started, 2)
+        if progress:
+            await progress(report)
+        print(f"Reconciled vote counts: {report}")
+        return report
+
+    async def _write(self, updates, changed: Dict[str, int], since: Dict, report: Dict, dry_run: bool):
+        """Store a batch of counts and adopt them in memory for the posts that changed"""
+        report["changed"] += len(updates)
+        if updates and not dry_run:
+            # No flush may land between the $set and set_count
+            async with post_counters.write_lock:
+                await self.db.db[Config.PARTICIPANTS_COLLECTION].bulk_write(updates, ordered=False)
+                for unique_post_id, count in changed.items():
+                    post_counters.set_count(unique_post_id, count, since)
+
+    async def queue_button(self, unique_post_id: str, count: int) -> bool:
+        """Queue a coalesced refresh of one post's button"""
+        metadata = await self.db.get_post_metadata(unique_post_id)
+        if not metadata or not metadata.get("channel_message_id"):
+            return False
+
+        channel_username = metadata["channel_username"]
+        if channel_health.is_broken(channel_username):
+            return False
+
+        button_coalescer.schedule(
+            self.app, channel_username, metadata["channel_message_id"],
+            vote_callback_data(channel_username, unique_post_id, metadata.get("post_key")), count
+        )
+        return True
@@ -0,0 +1,145 @@
+import time
+from typing import Dict
+from pyrogram import Client
+from pyrogram.errors import PeerIdInvalid, UsernameNotOccupied, UsernameInvalid
+from config import Config
+from utils.cache import channel_key
+from utils.singleflight import telegram_flight
+
+# Errors meaning the username no longer points at the chat we stored
+STALE_PEER_ERRORS = (PeerIdInvalid, UsernameNotOccupied, UsernameInvalid)
+
+
+class ChannelResolver:
+    """Maps channel usernames to numeric chat ids and titles
+
+    Lookups are served from memory, then from the channel_peers collection, and only
+    fall back to get_chat when neither knows the channel.
+    """
+
+    def __init__(self):
+        self._peers = {}  # channel key -> peer record
+        self.hits = 0
+        self.misses = 0
+
+    def _collection(self, db):
+        if db is None or getattr(db, "db", None) is None:
+            return None
+        return db.db[Config.CHANNEL_PEERS_COLLECTION]
+
+    async def load(self, db) -> int:
+        """Warm the in-memory map from Mongo"""
+        collection = self._collection(db)
+        if collection is None:
+            return 0
+
+        try:
+            records = await collection.find({}).to_list(length=None)
+            for record in records:
+                record.pop("_id", None)
+                self._peers[record["key"]] = record
+            print(f"Loaded {len(records)} channel peers from database")
+            return len(records)
+        except Exception as e:
+            print(f"Error loading channel peers: {e}")
+            return 0
+
+    async def resolve(self, app: Client, db, channel) -> Dict:
+        """Get {chat_id, title, username, chat_type, members_count} for a channel"""
+        key = channel_key(channel)
+
+        record = self._peers.get(key)
+        if record:
+            self.hits += 1
+            return record
+
+        collection = self._collection(db)
+        if collection is not None:
+            try:
+                record = await collection.find_one({"key": key})
+            except Exception as e:
+                print(f"Error reading channel peer {channel}: {e}")
+                record = None
+            if record:
+                record.pop("_id", None)
+                self._peers[key] = record
+                self.hits += 1
+                return record
+
+        self.misses += 1
+        return await self._fetch(app, db, channel)
+
+    async def _fetch(self, app: Client, db, channel) -> Dict:
+        """Resolve a channel through Telegram and store the result"""
+        key = channel_key(channel)
+        try:
+            # Viral posts trigger many identical resolves at once - share one
+            chat = await telegram_flight.do(("get_chat", key), lambda: app.get_chat(channel))
+        except STALE_PEER_ERRORS:
+            await self.invalidate(db, channel)
+            raise
+
+        record = {
+            "key": key,
+            "chat_id": chat.id,
+            "title": chat.title,
+            "username": chat.username,
+            "chat_type": str(chat.type),
+            "members_count": getattr(chat, "members_count", 0) or 0,
+            "resolved_at": time.time()
+        }
+        self._peers[key] = record
+
+        collection = self._collection(db)
+        if collection is not None:
+            try:
+                await collection.update_one({"key": key}, {"$set": record}, upsert=True)
+            except Exception as e:
+                print(f"Error saving channel peer {channel}: {e}")
+
+        return record
+
+    async def invalidate(self, db, channel) -> bool:
+        """Forget a channel in memory and in Mongo"""
+        key = channel_key(channel)
+        removed = self._peers.pop(key, None) is not None
+
+        collection = self._collection(db)
+        if collection is not None:
+            try:
+                await collection.delete_one({"key": key})
+            except Exception as e:
+                print(f"Error deleting channel peer {channel}: {e}")
+
+        return removed
+
+    async def refresh(self, app: Client, db, max_age: float = None) -> int:
+        """Re-resolve entries older than max_age seconds (run in the background)"""
+        max_age = Config.CHANNEL_RESOLVER_REFRESH * 60 if max_age is None else max_age
+        cutoff = time.time() - max_age
+        stale = [record for record in list(self._peers.values()) if record.get("resolved_at", 0) < cutoff]
+
+        refreshed = 0
+        for record in stale:
+            channel = f"@{record['username']}" if record.get("username") else record["key"]
+            try:
+                await self._fetch(app, db, channel)
+                refreshed += 1
+            except STALE_PEER_ERRORS:
+                print(f"Channel {channel} no longer resolves - removed from resolver")
+            except Exception as e:
+                print(f"Error refreshing channel peer {channel}: {e}")
+
+        return refreshed
+
+    def stats(self) -> Dict:
+        """Get resolver counters for monitoring"""
+        return {
+            "size": len(self._peers),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Shared so every handler reuses the same resolved peers
+channel_resolver = ChannelResolver()
@@ -0,0 +1,92 @@
+from typing import Dict, Optional
+from pyrogram import Client
+
+# Telegram returns at most this many members per GetParticipants page
+ROSTER_PAGE_SIZE = 200
+
+
+class RosterSnapshot:
+    """Member ids of one channel, fetched once per sweep
+
+    When the snapshot holds every member a missing id means "not subscribed".
+    Telegram may cap the list for bots though, and members join and leave while
+    it is paged; an incomplete snapshot can only confirm members, and unknown
+    users fall back to a get_chat_member call. The snapshot only counts as
+    complete when the member count was the same before and after paging.
+    """
+
+    def __init__(self, channel_username: str, member_ids: set, expected_count: int, pages: int, final_count: int):
+        self.channel_username = channel_username
+        self.member_ids = member_ids
+        self.expected_count = expected_count
+        self.final_count = final_count
+        self.pages = pages
+        self.complete = final_count == expected_count and len(member_ids) >= expected_count
+
+    def lookup(self, user_id: int) -> Optional[bool]:
+        """True/False when the snapshot knows the answer, None when it can't tell"""
+        if user_id in self.member_ids:
+            return True
+        if self.complete:
+            return False
+        return None
+
+
+def roster_cost(member_count: int) -> int:
+    """API calls needed to snapshot a channel: count before and after, member pages and the final empty page"""
+    return 3 + -(-member_count // ROSTER_PAGE_SIZE)
+
+
+async def build_roster(app: Client, chat_id: int, channel_username: str, max_size: int, voter_count: int) -> Optional[RosterSnapshot]:
+    """Page through a channel's members, or return None when per-user checks are cheaper"""
+    expected_count = await app.get_chat_members_count(chat_id)
+    if expected_count > max_size:
+        print(f"Roster for {channel_username} has {expected_count} members (limit {max_size}) - using per-user checks")
+        return None
+    if roster_cost(expected_count) >= voter_count:
+        return None
+
+    member_ids = set()
+    async for member in app.iter_chat_members(chat_id):
+        member_ids.add(member.user.id)
+        if len(member_ids) > max_size:
+            return None
+
+    # Someone who left mid-paging could be missing from a list that still looks full
+    final_count = await app.get_chat_members_count(chat_id)
+    return RosterSnapshot(channel_username, member_ids, expected_count, roster_cost(len(member_ids)), final_count)
+
+
+class RosterStats:
+    """API calls made vs saved by roster snapshots"""
+
+    def __init__(self):
+        self.rosters_built = 0
+        self.rosters_skipped = 0
+        self.roster_calls = 0
+        self.roster_answers = 0
+        self.fallback_checks = 0
+
+    def record_roster(self, roster: Optional[RosterSnapshot]):
+        if roster is None:
+            self.rosters_skipped += 1
+            return
+        self.rosters_built += 1
+        self.roster_calls += roster.pages
+
+    def record_lookup(self, answered: bool):
+        if answered:
+            self.roster_answers += 1
+        else:
+            self.fallback_checks += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "rosters_built": self.rosters_built,
+            "rosters_skipped": self.rosters_skipped,
+            "roster_calls": self.roster_calls,
+            "roster_answers": self.roster_answers,
+            "fallback_checks": self.fallback_checks,
+            # Each roster answer replaces one get_chat_member call
+            "api_calls_saved": self.roster_answers - self.roster_calls
+        }
@@ -1,9 +1,25 @@
 import asyncio
+import time
+from datetime import datetime
+from typing import Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from pyrogram import Client
+from pyrogram.errors import FloodWait
 from config import Config
 from utils.check import SubscriptionChecker
+from utils.resolver import channel_resolver
+from utils.cache import channel_key, membership_cache
+from utils.health import channel_health
+from utils.roster import build_roster, RosterStats
+from utils.buttons import button_coalescer
+from utils.callback_data import vote_callback_data
+from utils.counters import post_counters
+from utils.events import vote_events
+from utils.throttle import vote_limiter, vote_inflight, FloodGate
+from utils.sweep import SweepCheckpoints, SweepTelemetry, SweepRuns
+from utils.ledger import verification_ledger
+from utils.singleflight import telegram_flight
 
 class VoteScheduler:
     def __init__(self, app: Client, db):
@@ -12,18 +28,46 @@ class VoteScheduler:
         self.scheduler = AsyncIOScheduler()
         self.checker = SubscriptionChecker(app, db)
         self.is_running = False
+        self.roster_stats = RosterStats()
+        self.checkpoints = SweepCheckpoints(db)
+        self.sweep_stats = SweepTelemetry()
+        self.sweep_runs = SweepRuns(db)
+        self.last_sweep = None  # telemetry dict of the last finished run
+        # Sweep workers share one pacer that pauses them all on FloodWait
+        self.flood_gate = FloodGate()
+        self.checker.flood_gate = self.flood_gate
+        self.checker.call_timeout = Config.SWEEP_USER_TIMEOUT
+        self.verifier = None  # VoteVerifier, set by VoteBot in optimistic mode
     
     async def start(self):
         """Start the scheduler"""
         if not self.is_running:
-            # Add subscription check job
+            # Add subscription check job - a low-frequency safety net when
+            # chat-member updates already handle unsubscriptions
             self.scheduler.add_job(
                 self.check_subscriptions,
-                IntervalTrigger(minutes=Config.SUBSCRIPTION_CHECK_INTERVAL),
+                IntervalTrigger(minutes=self.get_sweep_interval()),
                 id='subscription_check',
                 replace_existing=True
             )
             
+            # Keep resolved channel ids and titles fresh
+            self.scheduler.add_job(
+                self.refresh_channel_peers,
+                IntervalTrigger(minutes=Config.CHANNEL_RESOLVER_REFRESH),
+                id='channel_resolver_refresh',
+                replace_existing=True
+            )
+            
+            # Fold the vote event log into per-post snapshots
+            if Config.VOTE_EVENTS_ENABLED:
+                self.scheduler.add_job(
+                    self.compact_vote_events,
+                    IntervalTrigger(minutes=Config.VOTE_EVENTS_COMPACT_INTERVAL),
+                    id='vote_events_compaction',
+                    replace_existing=True
+                )
+            
             # Add cleanup job (runs daily)
             self.scheduler.add_job(
                 self.cleanup_old_data,
@@ -35,7 +79,16 @@ class VoteScheduler:
             # Start scheduler
             self.scheduler.start()
             self.is_running = True
-            print(f"Scheduler started! Checking subscriptions every {Config.SUBSCRIPTION_CHECK_INTERVAL} minutes.")
+            print(f"Scheduler started! Checking subscriptions every {self.get_sweep_interval()} minutes.")
+    
+    def get_sweep_interval(self) -> int:
+        """Get the subscription sweep interval in minutes"""
+        # A ledger tick has a fixed cost, so it can run often
+        if Config.VERIFICATION_LEDGER_ENABLED:
+            return Config.SUBSCRIPTION_CHECK_INTERVAL
+        if Config.MEMBER_UPDATES_ENABLED:
+            return Config.SUBSCRIPTION_SAFETY_SWEEP_INTERVAL
+        return Config.SUBSCRIPTION_CHECK_INTERVAL
     
     async def stop(self):
         """Stop the scheduler"""
@@ -45,25 +98,162 @@ class VoteScheduler:
             print("Scheduler stopped.")
     
     async def check_subscriptions(self):
-        """Check all participants' subscriptions and remove invalid ones"""
+        """Check all participants' subscriptions and remove invalid ones
+        
+        With VERIFICATION_LEDGER_ENABLED only the most overdue voters are checked.
+        Otherwise every voter is swept; the sweep stops once SWEEP_TIME_BUDGET is
+        used up and unfinished channels resume from their checkpoint next interval.
+        """
+        if Config.VERIFICATION_LEDGER_ENABLED:
+            await self.verify_stale_voters()
+            return
+        
         try:
             print("Starting subscription check...")
+            self.roster_stats = RosterStats()
+            self.sweep_stats = SweepTelemetry("full", self.checker, self.flood_gate)
+            deadline = time.monotonic() + Config.SWEEP_TIME_BUDGET if Config.SWEEP_TIME_BUDGET else None
             
             # Get all active votes
             votes = await self.get_active_votes()
             
+            # Unfinished channels first, then the ones swept longest ago, so a
+            # tight budget still reaches every channel over a few intervals
+            checkpoints = await self.checkpoints.load_all()
+            def sweep_order(vote):
+                checkpoint = checkpoints.get(channel_key(vote.get("channel_username") or vote.get("channel", "")))
+                return (not SweepCheckpoints.in_progress(checkpoint), (checkpoint or {}).get("updated_at") or datetime.min)
+            votes.sort(key=sweep_order)
+            
+            # SUPPORT/UPDATE results, checked once per voter across every active vote
+            required_status = {}
+            
             total_removed = 0
             for vote in votes:
-                removed_count = await self.check_vote_subscriptions(vote)
+                if deadline is not None and time.monotonic() >= deadline:
+                    print("Sweep time budget used up - remaining channels continue next interval")
+                    break
+                removed_count = await self.check_vote_subscriptions(vote, required_status, deadline)
                 total_removed += removed_count
             
             if total_removed > 0:
                 print(f"Subscription check completed. Removed {total_removed} invalid participations.")
             else:
                 print("Subscription check completed. No invalid participations found.")
+            
+            if self.roster_stats.rosters_built:
+                print(f"Roster snapshots: {self.roster_stats.to_dict()}")
                 
         except Exception as e:
+            self.sweep_stats.record_error(e)
             print(f"Error in subscription check: {e}")
+        finally:
+            self.sweep_stats.roster_calls = self.roster_stats.roster_calls
+            await self.finish_sweep()
+    
+    async def finish_sweep(self):
+        """Report and persist the telemetry of the run that just ended"""
+        sweep = self.sweep_stats.to_dict()
+        self.last_sweep = sweep
+        print(
+            f"Sweep ({sweep['mode']}): {sweep['voters_checked']} users in {sweep['channels_scanned']} channels "
+            f"in {sweep['duration_seconds']}s ({sweep['users_per_second']} users/sec), "
+            f"{sweep['cache_hits']} cache hits, {sweep['telegram_calls']} Telegram calls, "
+            f"{sweep['flood_wait_seconds']}s flood wait, removed {sweep['votes_removed']} votes, "
+            f"errors {sweep['errors_by_class'] or 'none'}"
+        )
+        await self.sweep_runs.save(sweep)
+    
+    async def verify_stale_voters(self):
+        """Re-verify the VERIFICATION_TICK_BUDGET most overdue (voter, channel) pairs"""
+        self.sweep_stats = SweepTelemetry("ledger", self.checker, self.flood_gate)
+        try:
+            votes = await self.get_active_votes()
+            channels = []
+            for vote in votes:
+                channel_username = vote.get("channel_username") or vote.get("channel", "")
+                if await self.channel_is_usable(channel_username):
+                    channels.append(channel_username)
+            
+            if verification_ledger.seeded_at is None:
+                await self.seed_verification_ledger(channels)
+            
+            pairs = await verification_ledger.due(self.db, channels, Config.VERIFICATION_TICK_BUDGET)
+            if not pairs:
+                print("Verification tick: no voters are due")
+                return
+            
+            required_channels = await self.get_required_channels()
+            required_status = {}
+            top_posts = {
+                channel_username: await self.get_top_posts(channel_username)
+                for channel_username in {pair["channel_username"] for pair in pairs}
+            }
+            self.sweep_stats.channels_scanned = len(top_posts)
+            
+            pending = iter(pairs)
+            
+            async def worker():
+                # Workers share the iterator, so every pair is taken exactly once
+                for pair in pending:
+                    await self.verify_pair(pair, required_status, required_channels, top_posts)
+            
+            await asyncio.gather(*(worker() for _ in range(min(Config.SWEEP_CONCURRENCY, len(pairs)))))
+            
+            print(f"Verification tick: {len(pairs)} due voters, {self.sweep_stats.skipped} left for the next tick")
+            
+        except Exception as e:
+            self.sweep_stats.record_error(e)
+            print(f"Error in verification tick: {e}")
+        finally:
+            await self.finish_sweep()
+    
+    async def verify_pair(self, pair: dict, required_status: dict, required_channels: list, top_posts: dict):
+        """Verify one ledger pair and record when it is due again"""
+        user_id = pair["voter_id"]
+        channel_username = pair["channel_username"]
+        
+        try:
+            votes = await self.db.db["user_votes"].find(
+                {"voter_id": user_id, "channel_username": channel_username},
+                {"unique_post_id": 1, "participant_user_id": 1}
+            ).to_list(length=None)
+            if not votes:
+                await verification_ledger.forget(self.db, user_id, channel_username)
+                return
+            
+            is_subscribed = await self.verify_voter(channel_username, user_id, None, required_status, required_channels)
+            if is_subscribed is None:
+                # Stays due and is retried on the next tick
+                return
+            
+            if not is_subscribed:
+                print(f"User {user_id} is not subscribed - removing {len(votes)} votes")
+                self.sweep_stats.record_removal(channel_username, await self.remove_user_votes(user_id, channel_username, votes))
+                await verification_ledger.forget(self.db, user_id, channel_username)
+                return
+            
+            top_votes = sum(1 for vote in votes if vote.get("unique_post_id") in top_posts.get(channel_username, ()))
+            await verification_ledger.record(self.db, user_id, channel_username, True, top_votes)
+            
+        except Exception as e:
+            self.sweep_stats.record_error(e)
+            print(f"Error verifying user {user_id} in {channel_username}: {e}")
+    
+    async def seed_verification_ledger(self, channels: list):
+        """Seed the ledger, weighting voters on each channel's top-ranked posts"""
+        top_post_ids = set()
+        for channel_username in channels:
+            top_post_ids |= await self.get_top_posts(channel_username)
+        await verification_ledger.seed(self.db, top_post_ids)
+    
+    async def get_top_posts(self, channel_username: str) -> set:
+        """unique_post_ids of the channel's highest-voted posts"""
+        participants = await self.db.db[Config.PARTICIPANTS_COLLECTION].find(
+            {"channel_username": channel_username, "unique_post_id": {"$exists": True}},
+            {"unique_post_id": 1}
+        ).sort("post_vote_count", -1).limit(Config.VERIFICATION_TOP_POSTS).to_list(length=None)
+        return {participant["unique_post_id"] for participant in participants}
     
     async def get_active_votes(self):
         """Get all active vote polls"""
@@ -91,8 +281,36 @@ class VoteScheduler:
             print(f"Error getting active votes: {e}")
             return []
     
-    async def check_vote_subscriptions(self, vote_data: dict):
-        """Check subscriptions for a specific vote and remove invalid participants"""
+    async def get_required_channels(self) -> list:
+        """Get SUPPORT/UPDATE channels that can currently be checked"""
+        return [
+            channel for channel in [Config.SUPPORT_CHANNEL, Config.UPDATE_CHANNEL]
+            if await self.channel_is_usable(channel)
+        ]
+    
+    async def has_required_subscriptions(self, user_id: int, required_channels: list) -> Optional[bool]:
+        """Whether a voter is still in every required channel, None when Telegram couldn't tell"""
+        if not required_channels:
+            return True
+        
+        subscription_status = await self.checker.check_all_subscriptions(
+            user_id, required_channels, fail_fast=True
+        )
+        if len(subscription_status["missing_channels"]) > len(subscription_status["unknown_channels"]):
+            return False
+        if subscription_status["unknown_channels"]:
+            return None
+        return True
+    
+    async def check_vote_subscriptions(self, vote_data: dict, required_status: dict = None, deadline: float = None):
+        """Check subscriptions for a specific vote and remove invalid participants
+        
+        Votes are streamed sorted by voter and checked SWEEP_CHUNK_SIZE voters at a
+        time, saving a checkpoint after each chunk. required_status caches voters'
+        SUPPORT/UPDATE results across the sweep's channels. Once the monotonic
+        deadline passes no further voter is started and the channel is left at
+        its checkpoint, with the voters it didn't reach kept for a retry.
+        """
         removed_count = 0
         
         try:
@@ -104,156 +322,273 @@ class VoteScheduler:
                 print(f"Skipping vote with invalid channel username: '{channel_username}'")
                 return 0
                 
+            # Don't sweep a channel we already know we can't check
+            if not await self.channel_is_usable(channel_username):
+                print(f"Skipping broken channel: {channel_username}")
+                return 0
+            
             print(f"Checking subscriptions for channel: {channel_username}")
+            self.sweep_stats.channels_scanned += 1
             
-            # Get all user votes for this channel (not participants)
-            user_votes = await self.db.db["user_votes"].find({
-                "channel_username": channel_username
-            }).to_list(length=None)
+            if required_status is None:
+                required_status = {}
+            required_channels = await self.get_required_channels()
             
-            # Group votes by user
-            user_vote_map = {}
-            for vote in user_votes:
+            # Continue after the last voter a previous, unfinished sweep checked
+            query = {"channel_username": channel_username}
+            checkpoint = await self.checkpoints.load(channel_username)
+            if SweepCheckpoints.in_progress(checkpoint):
+                query["voter_id"] = {"$gt": checkpoint["last_voter_id"]}
+                if checkpoint.get("retry_voter_ids"):
+                    # Voters left unknown last time come first (they sort before the checkpoint)
+                    query = {"channel_username": channel_username, "$or": [
+                        {"voter_id": {"$gt": checkpoint["last_voter_id"]}},
+                        {"voter_id": {"$in": checkpoint["retry_voter_ids"]}}
+                    ]}
+                print(f"Resuming sweep of {channel_username} after voter {checkpoint['last_voter_id']}")
+            
+            # Snapshot the channel's members once instead of one call per voter
+            # (the vote count is an upper bound on the voters left)
+            roster = await self.get_roster(channel_username, await self.db.db["user_votes"].count_documents(query))
+            
+            cursor = self.db.db["user_votes"].find(query, {"voter_id": 1, "unique_post_id": 1, "participant_user_id": 1}).sort("voter_id", 1)
+            chunk = {}
+            voters_checked = 0
+            # Voters whose result was unknown; the checkpoint keeps them for a retry
+            unknown_voters = []
+            async for vote in cursor:
                 user_id = vote["voter_id"]
-                if user_id not in user_vote_map:
-                    user_vote_map[user_id] = []
-                user_vote_map[user_id].append(vote)
-            
-            print(f"Found votes from {len(user_vote_map)} unique users")
-            
-            # Check each user's subscription
-            for user_id, votes in user_vote_map.items():
-                try:
-                    # Check if user is still subscribed to all required channels
-                    subscription_status = await self.checker.check_all_subscriptions(
-                        user_id, [Config.SUPPORT_CHANNEL, Config.UPDATE_CHANNEL, channel_username]
-                    )
+                if user_id not in chunk and len(chunk) >= Config.SWEEP_CHUNK_SIZE:
+                    removed = await self.check_voter_chunk(channel_username, chunk, roster, required_status, required_channels, unknown_voters, deadline)
+                    removed_count += removed
+                    voters_checked += len(chunk)
+                    await self.checkpoints.save(channel_username, max(chunk), len(chunk), removed, unknown_voters)
+                    chunk = {}
                     
-                    if not subscription_status["all_subscribed"]:
-                        print(f"User {user_id} is not subscribed - removing {len(votes)} votes")
-                        
-                        # Remove each vote and update counts
-                        for vote in votes:
-                            unique_post_id = vote.get("unique_post_id")
-                            
-                            if unique_post_id:
-                                # Remove the vote from user_votes collection
-                                await self.db.remove_user_vote(user_id, unique_post_id)
-                                
-                                # Get live count and update participant record
-                                live_count = await self.db.get_post_vote_count(unique_post_id)
-                                await self.db.update_post_vote_count(unique_post_id, live_count)
-                                
-                                print(f"Removed vote for user {user_id} from post {unique_post_id}, new count: {live_count}")
-                                
-                                # Update channel button
-                                try:
-                                    await self.update_channel_vote_button_by_post_id(channel_username, unique_post_id)
-                                except Exception as button_error:
-                                    print(f"Error updating channel button: {button_error}")
-                        
-                        # Remove all votes from this user
-                        delete_result = await self.db.db["user_votes"].delete_many({
-                            "voter_id": user_id,
-                            "channel_username": channel_username
-                        })
-                        
-                        removed_count += delete_result.deleted_count
-                        print(f"Removed {delete_result.deleted_count} votes from user {user_id}")
-                        
-                except Exception as e:
-                    print(f"Error checking user {user_id}: {e}")
-                    continue
+                    if deadline is not None and time.monotonic() >= deadline:
+                        await cursor.close()
+                        print(f"Sweep of {channel_username} paused after {voters_checked} voters - resuming next interval")
+                        return removed_count
+                    
+                    # Telegram isn't answering; don't pile up more voters to retry
+                    if len(unknown_voters) >= Config.SWEEP_CHUNK_SIZE:
+                        await cursor.close()
+                        print(f"Sweep of {channel_username} paused - {len(unknown_voters)} voters couldn't be checked")
+                        return removed_count
+                
+                # Sorted by voter, so a voter's votes always land in the same chunk
+                chunk.setdefault(user_id, []).append(vote)
+            
+            if chunk:
+                removed = await self.check_voter_chunk(channel_username, chunk, roster, required_status, required_channels, unknown_voters, deadline)
+                removed_count += removed
+                voters_checked += len(chunk)
+                if unknown_voters:
+                    # Keep the channel in progress so the unknown voters are retried first
+                    await self.checkpoints.save(channel_username, max(chunk), len(chunk), removed, unknown_voters)
+            if not unknown_voters:
+                await self.checkpoints.finish(channel_username)
+            
+            print(f"Checked votes from {voters_checked} unique users")
             
         except Exception as e:
             print(f"Error checking subscriptions for vote {vote_data.get('channel_username', 'unknown')}: {e}")
         
         return removed_count
     
-    async def remove_user_votes(self, unsubscribed_user_id: int, channel_username: str):
-        """Remove all votes cast by an unsubscribed user and update participant vote counts"""
+    async def check_voter_chunk(self, channel_username: str, user_vote_map: dict, roster, required_status: dict, required_channels: list,
+                                unknown_voters: list = None, deadline: float = None) -> int:
+        """Check one chunk of voters with a pool of SWEEP_CONCURRENCY workers
+        
+        Voters whose result is unknown, or who weren't started before the
+        monotonic deadline, are appended to unknown_voters.
+        """
+        removed_count = 0
+        voters = iter(user_vote_map.items())
+        
+        async def worker():
+            nonlocal removed_count
+            # Workers share the iterator, so every voter is taken exactly once
+            for user_id, votes in voters:
+                if deadline is not None and time.monotonic() >= deadline:
+                    if unknown_voters is not None:
+                        unknown_voters.append(user_id)
+                    continue
+                removed = await self.check_voter(channel_username, user_id, votes, roster, required_status, required_channels)
+                if removed is None:
+                    if unknown_voters is not None:
+                        unknown_voters.append(user_id)
+                else:
+                    removed_count += removed
+        
+        await asyncio.gather(*(worker() for _ in range(min(Config.SWEEP_CONCURRENCY, len(user_vote_map)))))
+        return removed_count
+    
+    async def check_voter(self, channel_username: str, user_id: int, votes: list, roster, required_status: dict, required_channels: list) -> Optional[int]:
+        """Check one voter and remove their votes if they left; None when the result is unknown"""
+        is_subscribed = await self.verify_voter(channel_username, user_id, roster, required_status, required_channels)
+        if is_subscribed is None:
+            return None
+        if is_subscribed:
+            return 0
+        
+        print(f"User {user_id} is not subscribed - removing {len(votes)} votes")
+        removed_count = await self.remove_user_votes(user_id, channel_username, votes)
+        
+        self.sweep_stats.record_removal(channel_username, removed_count)
+        return removed_count
+    
+    async def verify_voter(self, channel_username: str, user_id: int, roster, required_status: dict, required_channels: list):
+        """Check one voter, retrying after FloodWaits
+        
+        Returns None when the answer is unknown (timeout, repeated floods, errors,
+        a channel that broke); unknown is never a reason to remove votes and the
+        voter is checked again later. Each Telegram call has its own
+        SWEEP_USER_TIMEOUT, which starts after the flood gate opens.
+        """
+        is_subscribed = None
+        for attempt in range(Config.SWEEP_FLOOD_RETRIES + 1):
+            await self.flood_gate.wait_open()
+            try:
+                is_subscribed = await self.voter_is_subscribed(channel_username, user_id, roster, required_status, required_channels)
+                break
+            except FloodWait as e:
+                # The checker already paused the flood gate for every worker
+                self.sweep_stats.flood_retries += 1
+                self.sweep_stats.record_error(e)
+            except Exception as e:
+                self.sweep_stats.record_error(e)
+                print(f"Error checking user {user_id}: {e}")
+                break
+        
+        self.sweep_stats.voters_checked += 1
+        if is_subscribed is None:
+            self.sweep_stats.skipped += 1
+        return is_subscribed
+    
+    async def voter_is_subscribed(self, channel_username: str, user_id: int, roster, required_status: dict, required_channels: list) -> Optional[bool]:
+        """Whether a voter is still in the required channels and the vote's channel, None if unknown"""
+        if roster is not None:
+            in_roster = roster.lookup(user_id)
+            self.roster_stats.record_lookup(in_roster is not None)
+            if in_roster is not None:
+                # Seed the cache so the check below doesn't call Telegram
+                self.checker.cache.set_membership(user_id, channel_username, in_roster)
+        
+        # Required channels are checked once per voter for the whole sweep
+        # (unknown results aren't kept, so they are asked again)
+        has_required = required_status.get(user_id)
+        if has_required is None:
+            has_required = await self.has_required_subscriptions(user_id, required_channels)
+            if has_required is not None:
+                required_status[user_id] = has_required
+        if not has_required:
+            return has_required
+        
+        # A channel that broke mid-sweep says nothing about the user: unknown
+        return await self.checker.subscription_state(user_id, channel_username)
+    
+    async def get_roster(self, channel_username: str, voter_count: int):
+        """Snapshot an admin channel's members for O(1) lookups during this sweep"""
+        if not Config.ROSTER_SNAPSHOTS_ENABLED or not voter_count:
+            return None
+        
         try:
-            # Find all votes cast by this user in this channel
-            user_votes = await self.db.db["user_votes"].find({
-                "voter_id": unsubscribed_user_id,
-                "channel_username": channel_username
-            }).to_list(length=None)
+            chat = await self.checker.resolve_channel(channel_username)
+            bot_status = await self.checker.check_bot_admin_status(chat["chat_id"])
+            if not bot_status["is_admin"]:
+                return None
             
-            votes_removed = 0
+            roster = await build_roster(
+                self.app, chat["chat_id"], channel_username, Config.ROSTER_MAX_SIZE, voter_count
+            )
+        except Exception as e:
+            print(f"Error building roster for {channel_username}: {e}")
+            roster = None
+        
+        self.roster_stats.record_roster(roster)
+        return roster
+    
+    async def channel_is_usable(self, channel_username: str) -> bool:
+        """Check channel health, probing a broken channel once its backoff expires"""
+        if not channel_health.is_broken(channel_username):
+            return True
+        if channel_health.should_skip(channel_username):
+            return False
+        return await self.checker.probe_channel(channel_username)
+    
+    async def remove_user_votes(self, unsubscribed_user_id: int, channel_username: str, votes: list = None):
+        """Remove all votes cast by an unsubscribed user and update participant vote counts
+        
+        One delete_many removes the votes, one bulk_write adjusts the affected post
+        counters and each affected post gets a single coalesced button refresh.
+        votes may hold the user's vote documents when the caller already has them.
+        """
+        try:
+            result = await self.db.remove_voter_votes(unsubscribed_user_id, channel_username, votes)
+            
+            for unique_post_id, new_count in result["posts"].items():
+                await self.update_channel_vote_button_by_post_id(channel_username, unique_post_id, new_count)
             
-            for vote in user_votes:
-                unique_post_id = vote.get("unique_post_id")
+            # Fallback for old votes without unique_post_id
+            legacy_votes = {}
+            for participant_user_id in result["legacy"]:
+                legacy_votes[participant_user_id] = legacy_votes.get(participant_user_id, 0) + 1
+            for participant_user_id, vote_count in legacy_votes.items():
+                update_result = await self.db.db[Config.PARTICIPANTS_COLLECTION].update_one(
+                    {
+                        "channel_username": channel_username,
+                        "user_id": participant_user_id
+                    },
+                    {"$inc": {"vote_count": -vote_count}}
+                )
                 
-                if unique_post_id:
-                    # Remove the vote using database function
-                    if await self.db.remove_user_vote(unsubscribed_user_id, unique_post_id):
-                        votes_removed += 1
-                        
-                        # Get live count and update participant record
-                        live_count = await self.db.get_post_vote_count(unique_post_id)
-                        await self.db.update_post_vote_count(unique_post_id, live_count)
-                        
-                        print(f"Removed vote from user {unsubscribed_user_id} for post {unique_post_id}, new count: {live_count}")
-                        
-                        # Update the channel message button with live count
-                        await self.update_channel_vote_button_by_post_id(channel_username, unique_post_id)
-                else:
-                    # Fallback for old votes without unique_post_id
-                    participant_user_id = vote.get("participant_user_id")
-                    if participant_user_id:
-                        result = await self.db.db[Config.PARTICIPANTS_COLLECTION].update_one(
-                            {
-                                "channel_username": channel_username,
-                                "user_id": participant_user_id
-                            },
-                            {"$inc": {"vote_count": -1}}
-                        )
-                        
-                        if result.modified_count > 0:
-                            votes_removed += 1
-                            print(f"Removed vote from user {unsubscribed_user_id} for participant {participant_user_id} (legacy)")
-                            
-                            # Update the channel message button with new vote count
-                            await self.update_channel_vote_button(channel_username, participant_user_id)
-            
-            print(f"Removed {votes_removed} votes from unsubscribed user {unsubscribed_user_id} in {channel_username}")
+                if update_result.modified_count > 0:
+                    print(f"Removed {vote_count} votes from user {unsubscribed_user_id} for participant {participant_user_id} (legacy)")
+                    
+                    # Update the channel message button with new vote count
+                    await self.update_channel_vote_button(channel_username, participant_user_id)
+            
+            print(f"Removed {result['removed']} votes from unsubscribed user {unsubscribed_user_id} in {channel_username} across {len(result['posts'])} posts")
+            return result["removed"]
             
         except Exception as e:
             print(f"Error removing votes for unsubscribed user {unsubscribed_user_id}: {e}")
+            return 0
     
-    async def update_channel_vote_button_by_post_id(self, channel_username: str, unique_post_id: str):
-        """Update the vote button in channel message with live count using unique post ID"""
+    async def update_channel_vote_button_by_post_id(self, channel_username: str, unique_post_id: str, count: int = None):
+        """Update the vote button in channel message using unique post ID
+        
+        Uses the given count, or the live count from user_votes when none is given.
+        """
         try:
-            # Get participant data using database function
-            participant_data = await self.db.get_participant_by_post_id(unique_post_id)
+            # Skip edits that are known to fail
+            if channel_health.is_broken(channel_username):
+                return
+            
+            # Message id and post key come from the post metadata cache
+            participant_data = await self.db.get_post_metadata(unique_post_id)
             
             if participant_data and participant_data.get("channel_message_id"):
                 # Get live count from user_votes collection
-                live_count = await self.db.get_post_vote_count(unique_post_id)
-                emoji = "⚡"
+                live_count = count if count is not None else await self.db.get_post_vote_count(unique_post_id)
                 
-                # Create updated button
-                from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                channel_name = channel_username[1:]  # Remove @ prefix
-                updated_button = InlineKeyboardMarkup([
-                    [InlineKeyboardButton(f"{emoji} Vote for this participant ({live_count})", callback_data=f"channel_vote_{channel_name}_{unique_post_id}")]
-                ])
-                
-                # Update the message
-                await self.app.edit_message_reply_markup(
-                    chat_id=channel_username,
-                    message_id=participant_data["channel_message_id"],
-                    reply_markup=updated_button
+                # Queue the edit - several removals on one post collapse into one
+                button_coalescer.schedule(
+                    self.app, channel_username, participant_data["channel_message_id"],
+                    vote_callback_data(channel_username, unique_post_id, participant_data.get("post_key")), live_count
                 )
                 
-                print(f"Updated channel vote button for post {unique_post_id} with live count {live_count}")
-                
         except Exception as e:
             print(f"Error updating channel vote button by post ID: {e}")
     
     async def update_channel_vote_button(self, channel_username: str, participant_user_id: int):
         """Update the vote button in channel message with new count"""
         try:
+            # Skip edits that are known to fail
+            if channel_health.is_broken(channel_username):
+                return
+            
             # Get updated participant data
             participant_data = await self.db.db[Config.PARTICIPANTS_COLLECTION].find_one({
                 "channel_username": channel_username,
@@ -262,24 +597,12 @@ class VoteScheduler:
             
             if participant_data and participant_data.get("channel_message_id"):
                 new_count = participant_data.get("vote_count", 0)
-                emoji = "⚡"
-                
-                # Create updated button
-                from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                channel_name = channel_username[1:]  # Remove @ prefix
-                updated_button = InlineKeyboardMarkup([
-                    [InlineKeyboardButton(f"{emoji} Vote for this participant ({new_count})", 
-                                        callback_data=f"channel_vote_{channel_name}_{participant_user_id}")]
-                ])
                 
-                # Update the channel message
-                await self.app.edit_message_reply_markup(
-                    chat_id=channel_username,
-                    message_id=participant_data["channel_message_id"],
-                    reply_markup=updated_button
+                # Legacy posts use the participant's user id in the callback data
+                button_coalescer.schedule(
+                    self.app, channel_username, participant_data["channel_message_id"],
+                    vote_callback_data(channel_username, participant_user_id), new_count
                 )
-                
-                print(f"Updated channel vote button for participant {participant_user_id} with new count: {new_count}")
         except Exception as e:
             print(f"Error updating channel vote button for participant {participant_user_id}: {e}")
     
@@ -321,6 +644,24 @@ class VoteScheduler:
         except Exception as e:
             print(f"Error logging participant removal: {e}")
     
+    async def refresh_channel_peers(self):
+        """Re-resolve stale channel username -> chat id mappings"""
+        try:
+            refreshed = await channel_resolver.refresh(self.app, self.db)
+            if refreshed:
+                print(f"Refreshed {refreshed} channel peers")
+        except Exception as e:
+            print(f"Error refreshing channel peers: {e}")
+    
+    async def compact_vote_events(self):
+        """Fold settled vote events into vote_counts snapshots"""
+        try:
+            compacted = await vote_events.compact(self.db)
+            if compacted:
+                print(f"Compacted vote events for {compacted} posts")
+        except Exception as e:
+            print(f"Error compacting vote events: {e}")
+    
     async def cleanup_old_data(self):
         """Clean up old data (run daily)"""
         try:
@@ -330,6 +671,12 @@ class VoteScheduler:
             # For now, we'll just log the cleanup
             stats = await self.db.get_bot_stats()
             
+            # Pick up voters whose votes never reached the ledger (restarts, older votes)
+            if Config.VERIFICATION_LEDGER_ENABLED:
+                await self.seed_verification_ledger([
+                    vote.get("channel_username") or vote.get("channel", "") for vote in await self.get_active_votes()
+                ])
+            
             cleanup_log = f"""
 🧹 **Daily Cleanup Report**
 
@@ -355,9 +702,22 @@ class VoteScheduler:
     
     async def get_scheduler_status(self):
         """Get current scheduler status"""
+        recent_sweeps = await self.sweep_runs.recent(10)
         return {
             "is_running": self.is_running,
             "jobs": len(self.scheduler.get_jobs()) if self.is_running else 0,
             "next_subscription_check": self.scheduler.get_job('subscription_check').next_run_time if self.is_running else None,
-            "next_cleanup": self.scheduler.get_job('daily_cleanup').next_run_time if self.is_running else None
+            "next_cleanup": self.scheduler.get_job('daily_cleanup').next_run_time if self.is_running else None,
+            "roster_stats": self.roster_stats.to_dict(),
+            "button_updates": button_coalescer.stats(),
+            "vote_counters": post_counters.stats(),
+            "vote_verification": self.verifier.stats() if self.verifier else None,
+            "vote_throttle": dict(vote_limiter.stats(), **vote_inflight.stats()),
+            "telegram_flight": telegram_flight.stats(),
+            "channel_resolver": channel_resolver.stats(),
+            "membership_cache": membership_cache.stats(),
+            "verification_ledger": await verification_ledger.stats(self.db) if Config.VERIFICATION_LEDGER_ENABLED else None,
+            "last_sweep": self.last_sweep,
+            "recent_sweeps": recent_sweeps,
+            "sweep_trend": SweepRuns.trend(recent_sweeps)
         }
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent identical requests
+
+    The first caller for a key runs the call; everyone who asks for the same key
+    while it is still running awaits the same future instead of calling Telegram
+    again.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> Task
+        self.calls = 0
+        self.suppressed = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run call() once per key at a time and return its result to every waiter
+
+        The call runs as its own task, so cancelling any caller - the one that
+        started it included - never cancels the result the others are waiting on.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.suppressed += 1
+        else:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        """Get call/suppression counters for monitoring"""
+        return {
+            "inflight": len(self._inflight),
+            "calls": self.calls,
+            "suppressed": self.suppressed
+        }
+
+
+# Shared by utils/check.py, the resolver and any handler making Telegram lookups
+telegram_flight = SingleFlight()
@@ -0,0 +1,180 @@
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from config import Config
+from utils.cache import channel_key
+
+
+class SweepCheckpoints:
+    """Per-channel progress of the subscription sweep, stored in sweep_checkpoints
+
+    The sweep walks a channel's voters in voter_id order and records the last
+    voter it finished after every chunk. A sweep that runs out of time leaves
+    the checkpoint behind and the next one continues after it; a finished sweep
+    clears it so the following run starts from the beginning again.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _collection(self):
+        return self.db.db[Config.SWEEP_CHECKPOINTS_COLLECTION]
+
+    async def load(self, channel_username: str) -> Dict:
+        return await self._collection().find_one({"_id": channel_key(channel_username)}) or {}
+
+    async def load_all(self) -> Dict[str, Dict]:
+        """channel key -> checkpoint, for ordering channels within a sweep"""
+        checkpoints = await self._collection().find({}).to_list(length=None)
+        return {checkpoint["_id"]: checkpoint for checkpoint in checkpoints}
+
+    async def save(self, channel_username: str, last_voter_id: int, voters_checked: int, removed: int,
+                   retry_voter_ids: List[int] = ()):
+        """Record that every voter up to last_voter_id has been checked
+
+        retry_voter_ids are the voters up to there whose result was unknown; the
+        resumed sweep checks them again before moving on.
+        """
+        await self._collection().update_one(
+            {"_id": channel_key(channel_username)},
+            {
+                "$set": {
+                    "channel_username": channel_username,
+                    "last_voter_id": last_voter_id,
+                    "retry_voter_ids": sorted(retry_voter_ids),
+                    "updated_at": datetime.now()
+                },
+                "$inc": {"voters_checked": voters_checked, "removed": removed}
+            },
+            upsert=True
+        )
+
+    async def finish(self, channel_username: str):
+        """Mark the channel as fully swept; the next sweep starts from the first voter"""
+        await self._collection().update_one(
+            {"_id": channel_key(channel_username)},
+            {
+                "$set": {
+                    "channel_username": channel_username,
+                    "last_voter_id": None,
+                    "retry_voter_ids": [],
+                    "voters_checked": 0,
+                    "removed": 0,
+                    "updated_at": datetime.now(),
+                    "completed_at": datetime.now()
+                }
+            },
+            upsert=True
+        )
+
+    @staticmethod
+    def in_progress(checkpoint: Optional[Dict]) -> bool:
+        return bool(checkpoint) and checkpoint.get("last_voter_id") is not None
+
+
+class SweepTelemetry:
+    """What one subscription sweep run did, in a form that can be stored in sweep_runs
+
+    Cache hits, Telegram calls, timeouts and FloodWait seconds are read as deltas of the
+    scheduler's own checker and flood gate, so vote taps don't leak into them.
+    """
+
+    def __init__(self, mode: str = "full", checker=None, flood_gate=None):
+        self.mode = mode
+        self.checker = checker
+        self.flood_gate = flood_gate
+        self.started_at = datetime.now()
+        self._started = time.monotonic()
+        self._baseline = self._counters()
+        self.channels_scanned = 0
+        self.voters_checked = 0
+        self.votes_removed = 0
+        self.removals_by_channel = {}
+        self.errors_by_class = {}
+        self.flood_retries = 0
+        self.skipped = 0
+        self.roster_calls = 0
+
+    def _counters(self) -> Dict:
+        return {
+            "cache_hits": getattr(self.checker, "cache_hits", 0),
+            "timeouts": getattr(self.checker, "timeouts", 0),
+            "telegram_calls": getattr(self.checker, "telegram_calls", 0),
+            "flood_wait_seconds": getattr(self.flood_gate, "paused_seconds", 0.0)
+        }
+
+    def record_removal(self, channel_username: str, removed: int):
+        self.votes_removed += removed
+        if removed:
+            self.removals_by_channel[channel_username] = self.removals_by_channel.get(channel_username, 0) + removed
+
+    def record_error(self, error: BaseException):
+        name = type(error).__name__
+        self.errors_by_class[name] = self.errors_by_class.get(name, 0) + 1
+
+    def to_dict(self) -> Dict:
+        elapsed = time.monotonic() - self._started
+        counters = self._counters()
+        timeouts = counters["timeouts"] - self._baseline["timeouts"]
+        errors_by_class = dict(self.errors_by_class)
+        if timeouts:
+            # Timed out calls are counted by the checker, which answers "unknown" for them
+            errors_by_class["TimeoutError"] = errors_by_class.get("TimeoutError", 0) + timeouts
+        return {
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "duration_seconds": round(elapsed, 1),
+            "channels_scanned": self.channels_scanned,
+            "voters_checked": self.voters_checked,
+            "users_per_second": round(self.voters_checked / elapsed, 1) if elapsed else 0.0,
+            "cache_hits": counters["cache_hits"] - self._baseline["cache_hits"],
+            "telegram_calls": counters["telegram_calls"] - self._baseline["telegram_calls"] + self.roster_calls,
+            "flood_wait_seconds": round(counters["flood_wait_seconds"] - self._baseline["flood_wait_seconds"], 1),
+            "votes_removed": self.votes_removed,
+            # A list, since channel names are not safe as Mongo field names
+            "removals_by_channel": [
+                {"channel": channel, "removed": removed}
+                for channel, removed in sorted(self.removals_by_channel.items(), key=lambda item: -item[1])
+            ],
+            "errors_by_class": errors_by_class,
+            "timeouts": timeouts,
+            "flood_retries": self.flood_retries,
+            "skipped": self.skipped
+        }
+
+
+class SweepRuns:
+    """Telemetry of past sweep runs in sweep_runs, expired after SWEEP_RUNS_RETENTION_DAYS"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _collection(self):
+        return self.db.db[Config.SWEEP_RUNS_COLLECTION]
+
+    async def create_indexes(self):
+        await self._collection().create_index(
+            "started_at", expireAfterSeconds=Config.SWEEP_RUNS_RETENTION_DAYS * 86400
+        )
+
+    async def save(self, run: Dict):
+        try:
+            await self._collection().insert_one(dict(run))
+        except Exception as e:
+            print(f"Error saving sweep telemetry: {e}")
+
+    async def recent(self, limit: int = 10) -> List[Dict]:
+        """Newest runs first"""
+        return await self._collection().find({}, {"_id": 0}).sort("started_at", -1).limit(limit).to_list(length=None)
+
+    @staticmethod
+    def trend(runs: List[Dict], window: int = 5) -> Dict:
+        """Average throughput and removals of the newest runs vs the ones before them"""
+        def average(selected, field):
+            return round(sum(run.get(field, 0) for run in selected) / len(selected), 1) if selected else None
+
+        latest, previous = runs[:window], runs[window:window * 2]
+        return {
+            field: {"latest": average(latest, field), "previous": average(previous, field)}
+            for field in ("users_per_second", "voters_checked", "votes_removed", "flood_wait_seconds", "duration_seconds")
+        }
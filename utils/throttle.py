@@ -0,0 +1,110 @@
+import asyncio
+import time
+from typing import Dict, Hashable
+from config import Config
+from utils.cache import TTLCache
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets held in a bounded, self-expiring cache
+
+    Each key may spend `burst` taps at once and regains `rate` taps per second.
+    A bucket that has been idle long enough to refill completely is the same as
+    a new one, so it expires after burst / rate seconds and memory stays bounded
+    by max_size.
+    """
+
+    def __init__(self, rate: float = None, burst: int = None, max_size: int = None):
+        self.rate = Config.VOTE_TAP_RATE if rate is None else rate
+        self.burst = Config.VOTE_TAP_BURST if burst is None else burst
+        self._buckets = TTLCache(Config.VOTE_THROTTLE_SIZE if max_size is None else max_size, self.burst / self.rate)
+        self.allowed = 0
+        self.limited = 0
+
+    def allow(self, key: Hashable) -> bool:
+        """Spend one token for key, or return False when the bucket is empty"""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        if tokens < 1:
+            self.limited += 1
+            self._buckets.set(key, (tokens, now))
+            return False
+
+        self.allowed += 1
+        self._buckets.set(key, (tokens - 1, now))
+        return True
+
+    def stats(self) -> Dict:
+        return {"buckets": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+class InFlightSet:
+    """Keys currently being processed, so concurrent duplicates can be turned away"""
+
+    def __init__(self):
+        self._keys = set()
+        self.rejected = 0
+
+    def claim(self, key: Hashable) -> bool:
+        """Mark key as in flight; False if it already is"""
+        if key in self._keys:
+            self.rejected += 1
+            return False
+        self._keys.add(key)
+        return True
+
+    def release(self, key: Hashable):
+        self._keys.discard(key)
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._keys), "rejected": self.rejected}
+
+
+class FloodGate:
+    """Shared pacing for the Telegram calls of a pool of workers
+
+    Every worker awaits wait() before a call. Calls are spaced to at most `rate`
+    per second (0 = unpaced), and a FloodWait seen by any worker pauses all of
+    them until it has expired instead of each one hitting the same limit.
+    """
+
+    def __init__(self, rate: float = None):
+        self.rate = Config.SWEEP_RATE_LIMIT if rate is None else rate
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self.pauses = 0
+        self.paused_seconds = 0.0
+
+    def pause(self, seconds: float):
+        """Hold every worker for seconds (a FloodWait's x)"""
+        now = time.monotonic()
+        until = now + seconds
+        if until > self._paused_until:
+            self.pauses += 1
+            self.paused_seconds += until - max(now, self._paused_until)
+            self._paused_until = until
+
+    async def wait_open(self):
+        """Block while a FloodWait pause is in effect"""
+        while self._paused_until > time.monotonic():
+            await asyncio.sleep(self._paused_until - time.monotonic())
+
+    async def wait(self):
+        """Block until the gate is open and this caller's slot has come"""
+        await self.wait_open()
+        if self.rate:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+
+    def stats(self) -> Dict:
+        return {"rate": self.rate, "pauses": self.pauses, "paused_seconds": round(self.paused_seconds, 1)}
+
+
+# In front of the channel-vote handler
+vote_limiter = TokenBucketLimiter()
+vote_inflight = InFlightSet()
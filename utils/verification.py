@@ -0,0 +1,168 @@
+import asyncio
+import time
+from typing import Dict, List
+from pyrogram import Client
+from config import Config
+from utils.check import SubscriptionChecker
+from utils.buttons import button_coalescer
+from utils.callback_data import vote_callback_data
+from utils.ledger import verification_ledger
+
+
+class VoteVerifier:
+    """Background verification of optimistically accepted votes
+
+    With OPTIMISTIC_VOTES the vote handler records a provisional vote and answers
+    the tap right away. A bounded pool of workers then checks the required channel
+    subscriptions; verified votes are confirmed, votes of users Telegram says are
+    not subscribed are rolled back and the post button is re-rendered with the
+    corrected count. Votes Telegram couldn't answer for (FloodWait, errors, broken
+    channels) stay provisional and are retried later.
+    """
+
+    def __init__(self, app: Client, db, workers: int = None, queue_size: int = None):
+        self.app = app
+        self.db = db
+        self.checker = SubscriptionChecker(app, db)
+        self.workers = Config.VERIFICATION_WORKERS if workers is None else workers
+        self._queue = asyncio.Queue(maxsize=Config.VERIFICATION_QUEUE_SIZE if queue_size is None else queue_size)
+        self._tasks = []
+        self._retries = set()
+        self.accepted = 0
+        self.pending = 0
+        self.confirmed = 0
+        self.rolled_back = 0
+        self.retried = 0
+        self.inline_verifications = 0
+        self.errors = 0
+        self.verifications = 0
+        self.total_latency = 0.0
+
+    async def start(self):
+        """Start the worker pool and requeue votes left provisional by a restart"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        # In the background, so a large backlog doesn't hold up startup
+        self._tasks.append(asyncio.ensure_future(self._requeue_provisional()))
+        print(f"Vote verifier started with {self.workers} workers")
+
+    async def _requeue_provisional(self):
+        """Queue votes left provisional by a restart, waiting for room instead of verifying inline"""
+        try:
+            for vote in await self.db.get_provisional_votes():
+                await self._queue.put(self._job(vote))
+        except Exception as e:
+            print(f"Error requeueing provisional votes: {e}")
+
+    async def stop(self):
+        """Stop the workers; votes still queued stay provisional and are requeued on start"""
+        for task in self._tasks + list(self._retries):
+            task.cancel()
+        self._tasks = []
+        self._retries = set()
+
+    async def submit(self, vote: Dict):
+        """Queue a provisional vote for verification
+
+        When the queue is full the vote is verified in the caller instead, so a
+        burst can't grow memory without bound.
+        """
+        job = self._job(vote)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.inline_verifications += 1
+            await self.verify(job)
+
+    def _job(self, vote: Dict) -> Dict:
+        self.accepted += 1
+        self.pending += 1
+        return dict(vote, queued_at=time.time())
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.verify(job)
+            finally:
+                self._queue.task_done()
+
+    def required_channels(self, channel_username: str) -> List[str]:
+        return [Config.SUPPORT_CHANNEL, Config.UPDATE_CHANNEL, channel_username]
+
+    async def verify(self, job: Dict):
+        """Confirm or roll back one provisional vote"""
+        voter_id = job["voter_id"]
+        unique_post_id = job["unique_post_id"]
+        channel_username = job["channel_username"]
+
+        try:
+            subscription_status = await self.checker.check_all_subscriptions(
+                voter_id, self.required_channels(channel_username), fail_fast=True
+            )
+
+            unknown_channels = subscription_status["unknown_channels"]
+            if subscription_status["all_subscribed"]:
+                await self.db.confirm_vote(voter_id, unique_post_id)
+                self.confirmed += 1
+                if Config.VERIFICATION_LEDGER_ENABLED:
+                    await verification_ledger.record(self.db, voter_id, channel_username, True)
+            elif len(subscription_status["missing_channels"]) == len(unknown_channels):
+                # Nothing says the user left; only Telegram couldn't tell
+                self.retry_later(job, unknown_channels)
+            else:
+                participant_data = await self.db.rollback_vote(voter_id, unique_post_id)
+                if participant_data is not None:
+                    self.rolled_back += 1
+                    print(f"Rolled back vote from {voter_id} on post {unique_post_id} - missing {subscription_status['missing_channels']}")
+                    if participant_data.get("channel_message_id"):
+                        button_coalescer.schedule(
+                            self.app, channel_username, participant_data["channel_message_id"],
+                            vote_callback_data(channel_username, unique_post_id, participant_data.get("post_key")),
+                            participant_data.get("post_vote_count", 0)
+                        )
+            self.verifications += 1
+            self.total_latency += time.time() - job.get("queued_at", time.time())
+        except Exception as e:
+            # Leave the vote provisional; it is retried on the next start
+            self.errors += 1
+            print(f"Error verifying vote from {voter_id} on post {unique_post_id}: {e}")
+        finally:
+            self.pending -= 1
+
+    def retry_later(self, job: Dict, unknown_channels: List[str]):
+        """Verify the vote again after a back-off; it stays provisional meanwhile"""
+        attempts = job.get("attempts", 0) + 1
+        if attempts > Config.VERIFICATION_MAX_RETRIES:
+            print(f"Vote from {job['voter_id']} on post {job['unique_post_id']} is still unverifiable - left provisional")
+            return
+
+        self.retried += 1
+        self.pending += 1
+        task = asyncio.ensure_future(self._retry(dict(job, attempts=attempts), attempts * Config.VERIFICATION_RETRY_DELAY))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+        print(f"Couldn't verify vote from {job['voter_id']} in {unknown_channels} - retrying in {attempts * Config.VERIFICATION_RETRY_DELAY}s")
+
+    async def _retry(self, job: Dict, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # Requeued from the database on the next start instead
+            self.pending -= 1
+
+    def stats(self) -> Dict:
+        """Get provisional vs confirmed counts for monitoring"""
+        return {
+            "accepted": self.accepted,
+            "provisional": self.pending,
+            "confirmed": self.confirmed,
+            "rolled_back": self.rolled_back,
+            "retried": self.retried,
+            "queued": self._queue.qsize(),
+            "inline_verifications": self.inline_verifications,
+            "errors": self.errors,
+            "avg_verification_seconds": round(self.total_latency / self.verifications, 3) if self.verifications else 0.0
+        }